@@ -12,7 +12,101 @@ from progress.hardware.qhardware import QuantumOperationsService
 from progress.sockets import Token, TokenMessage
 import progress.progress_logging as log
 
-__all__ = ["QHAL", "EntanglementHandlerProtocol", "TokenOperationsService"]
+__all__ = ["QHAL", "EntanglementHandlerProtocol", "TokenOperationsService", "SocketTable"]
+
+
+class SocketTable:
+    r"""
+    A table that keeps track of the sockets currently allocated on a device. Each qubit of the device has a slot in
+    the table, at its position in the quantum memory (see
+    :meth:`~progress.hardware.qhardware.QHardware.map_info_to_qubit`). A dictionary maps each allocated socket to
+    its slot, so that membership checks and removals take constant time.
+
+    Parameters
+    ----------
+    qhardware : :class:`~progress.hardware.qhardware.QHardware`
+        The quantum hardware of the device.
+    """
+
+    def __init__(self, qhardware):
+        self.qhardware = qhardware
+        self._slots = [None] * (qhardware.num_qnics * qhardware.num_qbits_qnic)
+        self._slot_of = {}
+
+    @property
+    def capacity(self):
+        r"""
+        The maximum number of sockets that can be allocated at the same time.
+        """
+        return len(self._slots)
+
+    def _get_slot(self, socket):
+        return self.qhardware.map_info_to_qubit(socket.qnic, socket.idx)
+
+    def add(self, socket):
+        r"""
+        Add a socket to the table. If another socket occupies the same qubit, it is replaced, as the qubit
+        has been reused.
+
+        Parameters
+        ----------
+        socket : :class:`~progress.sockets.Socket`
+            The socket to add.
+
+        Returns
+        -------
+        :class:`~progress.sockets.Socket` or None
+            The socket that was replaced, if any.
+        """
+        slot = self._get_slot(socket)
+        old_socket = self._slots[slot]
+        if old_socket is not None:
+            del self._slot_of[old_socket]
+        self._slots[slot] = socket
+        self._slot_of[socket] = slot
+        return old_socket
+
+    def remove(self, socket):
+        r"""
+        Remove a socket from the table.
+
+        Parameters
+        ----------
+        socket : :class:`~progress.sockets.Socket`
+            The socket to remove.
+
+        Raises
+        ------
+        ValueError
+            If the socket is not in the table.
+        """
+        slot = self._slot_of.pop(socket, None)
+        if slot is None:
+            raise ValueError(f"Socket {socket} not found in the socket table.")
+        self._slots[slot] = None
+
+    def is_full(self):
+        r"""
+        Check whether all the qubits of the device are allocated.
+
+        Returns
+        -------
+        bool
+            `True` if the table is full, `False` otherwise.
+        """
+        return len(self._slot_of) == len(self._slots)
+
+    def __contains__(self, socket):
+        return socket in self._slot_of
+
+    def __len__(self):
+        return len(self._slot_of)
+
+    def __iter__(self):
+        return iter(self._slot_of)
+
+    def __repr__(self):
+        return f"SocketTable({list(self._slot_of)})"
 
 
 class QHAL(ns.nodes.Node):
@@ -27,6 +121,9 @@ class QHAL(ns.nodes.Node):
         The name of this node.
     qhardware : :class:`~progress.hardware.qhardware.QHardware`
         A reference to the QHardware placed in the same device (for easy access to its services).
+    pipelined : bool, optional
+        Whether the token operations service runs in pipelined mode.
+        See :class:`~progress.abstraction.qhal.TokenOperationsService`. Defaults to `False`.
 
     Attributes
     ----------
@@ -41,9 +138,8 @@ class QHAL(ns.nodes.Node):
     token_out_ports : list[:class:`netsquid.components.Port`]
         A shortcut to the output ports of this module. Each port is used to send tokens to the NET layer from a
         specific QNIC queue. The index of the port in the list is the index of the QNIC it is connected to.
-    socket_table : collections.deque
-        A table that keeps track of all tokens currently allocated. The table is implemented as a deque with a fixed
-        size.
+    socket_table : :class:`~progress.abstraction.qhal.SocketTable`
+        A table that keeps track of all tokens currently allocated. The table has one slot per qubit of the device.
 
     Notes
     -----
@@ -56,7 +152,7 @@ class QHAL(ns.nodes.Node):
           is the index of the QNIC token queue it is connected to.
     """
 
-    def __init__(self, device_id, name, qhardware):
+    def __init__(self, device_id, name, qhardware, pipelined=False):
         ports = ["q_ops", "new_entanglement", "tokens_ops"]
         ports += [f"token_out_{i}" for i in range(qhardware.num_qnics)]
         super().__init__(name=name, port_names=ports)
@@ -69,9 +165,10 @@ class QHAL(ns.nodes.Node):
 
         self._device_id = device_id
 
-        self.socket_table = collections.deque(maxlen=qhardware.num_qnics*qhardware.num_qbits_qnic)
+        self.socket_table = SocketTable(qhardware)
 
-        self.token_api_service = TokenOperationsService(self, name=f"token_api_service_{self._device_id}")
+        self.token_api_service = TokenOperationsService(self, name=f"token_api_service_{self._device_id}",
+                                                        pipelined=pipelined)
         self.entanglement_handler = EntanglementHandlerProtocol(self, name=f"entanglement_handler_{self._device_id}")
 
         self._start()
@@ -123,9 +220,9 @@ class EntanglementHandlerProtocol(ns.protocols.NodeProtocol):
                 local_end = msg.items[0]
                 other_end = msg.items[1]
 
-                self.node.socket_table.append(local_end)
-                if len(self.node.socket_table) == self.node.socket_table.maxlen:
-                    log.warning(f"Socket table of Device {self.node.supercomponent.device_id} is full.")
+                self.node.socket_table.add(local_end)
+                if self.node.socket_table.is_full():
+                    log.warning("Socket table of Device %s is full.", self.node.supercomponent.device_id)
 
                 # generate a token
                 coherence_time = self.node.qhardware.qproc_coherence_time
@@ -163,6 +260,9 @@ class TokenOperationsService(ns.protocols.ServiceProtocol):
     req_swap : collections.namedtuple
         Request to perform entanglement swapping on two tokens.
         See :meth:`~progress.abstraction.qhal.TokenOperationsService.req_swap`.
+    req_swap_batch : collections.namedtuple
+        Request to perform entanglement swapping on several pairs of tokens at once.
+        See :meth:`~progress.abstraction.qhal.TokenOperationsService.req_swap_batch`.
     req_dejmps : collections.namedtuple
         Request to perform de-JMPs on a token. See :meth:`~progress.abstraction.qhal.TokenOperationsService.req_dejmps`.
     req_qcirc : collections.namedtuple
@@ -175,6 +275,12 @@ class TokenOperationsService(ns.protocols.ServiceProtocol):
             The QHAL node.
         name : str or None, optional
             The name of the service protocol. If `None`, the name will be set to "Token Operations Service".
+        pipelined : bool, optional
+            If `False`, requests are handled one at a time: each request waits for the response of the quantum
+            hardware before the next one is looked at. If `True`, all the requests acting on disjoint tokens are
+            submitted to the quantum hardware as soon as they arrive, and each hardware response is matched to its
+            request through a unique operation id. Requests on tokens that are already in flight wait, in order,
+            for the operations on those tokens to complete. Defaults to `False`.
     """
 
     req_free = namedtuple("req_free", ["token"])
@@ -195,6 +301,16 @@ class TokenOperationsService(ns.protocols.ServiceProtocol):
         token2 (:class:`~progress.sockets.Token`): The second token to swap.
     """
 
+    req_swap_batch = namedtuple("req_swap_batch", ["id", "token_pairs"])
+    """
+    Request to perform entanglement swapping on several pairs of tokens with a single execution on the quantum
+    hardware. The response is the list of the swapping outcomes, in the order of the pairs.
+
+    Parameters:
+        id (int): The ID of the requesting module.
+        token_pairs (list of tuple): The pairs of tokens to swap, as `(token1, token2)` tuples.
+    """
+
     req_dejmps = namedtuple("req_purify", ["id", "token1", "token2", "role"])
     """
     Request to perform DEJMPS distillation on two tokens. The first one is the one distilled,
@@ -268,7 +384,7 @@ class TokenOperationsService(ns.protocols.ServiceProtocol):
         # DEBUG
         """
         # check consistency
-        if len(self.node.socket_table) >= self.node.socket_table.maxlen * 4 / 5:
+        if len(self.node.socket_table) >= self.node.socket_table.capacity * 4 / 5:
             consistency = self._check_consistency()
             if consistency != 0:
                 log.warning(f"Consistency check failed with code {consistency}.", repeater_id=self.node.supercomponent.device_id)
@@ -278,9 +394,9 @@ class TokenOperationsService(ns.protocols.ServiceProtocol):
         self.node.socket_table.remove(token.socket)
 
         """ DEBUG
-        if len(self.node.socket_table) >= self.node.socket_table.maxlen*4/5:
+        if len(self.node.socket_table) >= self.node.socket_table.capacity*4/5:
             log.warning(f"The socket table has {len(self.node.socket_table)} sockets out "
-                        f"of {self.node.socket_table.maxlen}.", repeater_id=self.node.supercomponent.device_id)
+                        f"of {self.node.socket_table.capacity}.", repeater_id=self.node.supercomponent.device_id)
         """
 
     def _handle_free(self, request):
@@ -304,6 +420,21 @@ class TokenOperationsService(ns.protocols.ServiceProtocol):
         self.node.socket_table.remove(token_a.socket)
         self.node.socket_table.remove(token_b.socket)
 
+    def _handle_swap_batch(self, request):
+        q_request = self._get_qop_request(request, request.id)
+        self.node.qhardware.put_qop(q_request)
+
+        # wait for the results
+        yield self.await_port_input(self.node.ports["q_ops"])
+        msg = self.node.ports["q_ops"].rx_input()
+        assert msg.items[0] == request.id
+        self.send_response(response=msg.items[1], name=request.id, request=request)
+
+        # remove the tokens from the socket table
+        for token_a, token_b in request.token_pairs:
+            self.node.socket_table.remove(token_a.socket)
+            self.node.socket_table.remove(token_b.socket)
+
     def _handle_dejmps(self, request):
         token_a = request.token1
         token_b = request.token2
@@ -324,7 +455,8 @@ class TokenOperationsService(ns.protocols.ServiceProtocol):
     def _handle_correct(self, request):
         token = request.token
 
-        q_request = QuantumOperationsService.req_correct(request.id, token.socket.qnic, token.socket.idx)
+        q_request = QuantumOperationsService.req_correct(request.id, token.socket.qnic, token.socket.idx,
+                                                        token.current_state)
         self.node.qhardware.put_qop(q_request)
 
         # wait for the result
@@ -363,12 +495,11 @@ class TokenOperationsService(ns.protocols.ServiceProtocol):
         num_qubits = 0
         for qnic in range(self.node.qhardware.num_qnics):
             llp = self.node.qhardware.get_subscribed_llp(qnic)
-            # count the number of non None elements in llp._qubits_status
-            num_qubits += len([x for x in llp._qubits_status if x is not None])
+            num_qubits += llp.occupancy()
 
         if len(self.node.socket_table) != num_qubits:
-            log.warning(f"The socket table has {len(self.node.socket_table)} sockets but the qhardware has "
-                      f"{num_qubits} qubits allocated in the link layer protocols.")
+            log.warning("The socket table has %d sockets but the qhardware has %d qubits allocated in the link layer "
+                        "protocols.", len(self.node.socket_table), num_qubits)
         return len(self.node.socket_table) - num_qubits
 
 
@@ -382,7 +513,7 @@ class TokenOperationsService(ns.protocols.ServiceProtocol):
         msg = ns.components.Message(header=header, items=[name, response, request])
         self.node.ports['tokens_ops'].tx_output(msg)
 
-    def __init__(self, node, name=None):
+    def __init__(self, node, name=None, pipelined=False):
         if name is None:
             name = "Token Operations Service"
         super().__init__(node=node, name=name)
@@ -393,11 +524,17 @@ class TokenOperationsService(ns.protocols.ServiceProtocol):
         self.add_signal(self._new_req_signal)
         self._create_id = 0
 
+        self.pipelined = pipelined
+        # operation id -> (request, sockets) for the operations submitted to the quantum hardware (pipelined mode)
+        self._in_flight = {}
+        self._busy_sockets = set()
+
         self.register_request(self.req_free, self._handle_free)
         self.register_request(self.req_qcirc, self._handle_qcirc)
         self.register_request(self.req_correct, self._handle_correct)
         self.register_request(self.req_dejmps, self._handle_dejmps)
         self.register_request(self.req_swap, self._handle_swap)
+        self.register_request(self.req_swap_batch, self._handle_swap_batch)
 
     def handle_request(self, request, identifier, start_time=None, **kwargs):
         r"""Schedule the request on the queue.
@@ -448,6 +585,9 @@ class TokenOperationsService(ns.protocols.ServiceProtocol):
 
         See :meth:`netsquid.protocols.Protocol.run`.
         """
+        if self.pipelined:
+            yield from self._run_pipelined()
+            return
         while True:
             yield self.await_signal(self, self._new_req_signal)
             # log.warning(f"Hey, you, you are finally awake! The queue has {len(self.queue)} requests!", repeater_id=self.node.supercomponent.device_id)
@@ -460,3 +600,101 @@ class TokenOperationsService(ns.protocols.ServiceProtocol):
                 gen = func(args, **kwargs)
                 if gen is not None:
                     yield from gen
+
+    def _new_operation_id(self):
+        op_id = self._create_id
+        self._create_id += 1
+        return op_id
+
+    def _get_request_sockets(self, request):
+        if isinstance(request, (self.req_free, self.req_correct)):
+            return [request.token.socket]
+        elif isinstance(request, self.req_qcirc):
+            return [token.socket for token in request.tokens]
+        elif isinstance(request, self.req_swap_batch):
+            return [token.socket for pair in request.token_pairs for token in pair]
+        return [request.token1.socket, request.token2.socket]
+
+    def _get_qop_request(self, request, op_id):
+        if isinstance(request, self.req_swap):
+            return QuantumOperationsService.req_swap(op_id, request.token1.socket.qnic, request.token1.socket.idx,
+                                                     request.token2.socket.qnic, request.token2.socket.idx)
+        elif isinstance(request, self.req_swap_batch):
+            return QuantumOperationsService.req_swap_batch(op_id, [(t1.socket.qnic, t1.socket.idx,
+                                                                    t2.socket.qnic, t2.socket.idx)
+                                                                   for t1, t2 in request.token_pairs])
+        elif isinstance(request, self.req_dejmps):
+            return QuantumOperationsService.req_dejmps(op_id, request.token1.socket.qnic, request.token1.socket.idx,
+                                                       request.token2.socket.qnic, request.token2.socket.idx,
+                                                       request.role)
+        elif isinstance(request, self.req_correct):
+            return QuantumOperationsService.req_correct(op_id, request.token.socket.qnic, request.token.socket.idx,
+                                                        request.token.current_state)
+        elif isinstance(request, self.req_qcirc):
+            return QuantumOperationsService.req_qcirc(op_id, [(t.socket.qnic, t.socket.idx) for t in request.tokens],
+                                                      request.qcirc)
+        raise ValueError(f"Request {request} not supported.")
+
+    def _submit_ready_requests(self):
+        r"""
+        Submit to the quantum hardware all the queued requests that do not act on tokens already in flight.
+        Requests that must wait are kept in the queue in their original order, and their tokens are blocked for the
+        requests behind them.
+
+        Returns
+        -------
+        float or None
+            The earliest start time of a request waiting for its start time, if any. [ns]
+        """
+        now = ns.sim_time()
+        next_start_time = None
+        blocked = set(self._busy_sockets)
+        waiting = collections.deque()
+        while len(self.queue) > 0:
+            start_time, (handler_id, request, kwargs) = self.queue.popleft()
+            sockets = self._get_request_sockets(request)
+            if start_time > now or any(socket in blocked for socket in sockets):
+                waiting.append((start_time, (handler_id, request, kwargs)))
+                blocked.update(sockets)
+                if start_time > now and (next_start_time is None or start_time < next_start_time):
+                    next_start_time = start_time
+                continue
+
+            if isinstance(request, self.req_free):
+                self.free(request.token)
+                continue
+
+            op_id = self._new_operation_id()
+            self._in_flight[op_id] = (request, sockets)
+            self._busy_sockets.update(sockets)
+            blocked.update(sockets)
+            self.node.qhardware.put_qop(self._get_qop_request(request, op_id))
+        self.queue = waiting
+        return next_start_time
+
+    def _complete_operation(self, msg):
+        request, sockets = self._in_flight.pop(msg.items[0])
+        self._busy_sockets.difference_update(sockets)
+        self.send_response(response=msg.items[1], name=request.id, request=request)
+
+        # remove the measured tokens from the socket table
+        if isinstance(request, self.req_swap):
+            self.node.socket_table.remove(request.token1.socket)
+            self.node.socket_table.remove(request.token2.socket)
+        elif isinstance(request, self.req_swap_batch):
+            for token_a, token_b in request.token_pairs:
+                self.node.socket_table.remove(token_a.socket)
+                self.node.socket_table.remove(token_b.socket)
+        elif isinstance(request, self.req_dejmps):
+            self.node.socket_table.remove(request.token2.socket)
+
+    def _run_pipelined(self):
+        q_ops_port = self.node.ports["q_ops"]
+        while True:
+            next_start_time = self._submit_ready_requests()
+            ev_expr = self.await_signal(self, self._new_req_signal) | self.await_port_input(q_ops_port)
+            if next_start_time is not None:
+                ev_expr |= self.await_timer(end_time=next_start_time)
+            yield ev_expr
+            while len(q_ops_port.input_queue) > 0:
+                self._complete_operation(q_ops_port.rx_input())
@@ -24,6 +24,19 @@ class QNetworkDevice(ns.nodes.Node):
         The parameters of the quantum processor of this device. See :func:`~progress.hardware.qhardware.get_processor`
         for details. If `None`, a default processor is created. Defaults to `None`. The field `num_positions` can be
         omitted, as it is set to `num_qnics * num_qbits_qnic`.
+    qstate_backend : str, optional
+        The quantum state backend of the quantum hardware. See :class:`~progress.hardware.qhardware.QHardware`.
+        Defaults to "netsquid".
+    pipelined : bool, optional
+        Whether the token operations of the QHAL and the quantum operations of the hardware run in pipelined mode,
+        overlapping requests on disjoint qubits. See :class:`~progress.abstraction.qhal.TokenOperationsService`.
+        Only supported by the "bell_diagonal" backend. Defaults to `False`.
+    fidelity_sampling_period : int, optional
+        The sampling period of the fidelity estimator of the quantum hardware.
+        See :class:`~progress.hardware.qhardware.FidelityEstimator`. Defaults to 1.
+    dag_cache_size : int or None, optional
+        The maximum number of replaced DAGs kept for reuse by the NET manager.
+        See :class:`~progress.pqnet.net_manager.NetManagerProtocol`. Defaults to `None`.
 
     Attributes
     ----------
@@ -59,7 +72,8 @@ class QNetworkDevice(ns.nodes.Node):
         - controller: The controller port of this device. It is used for controller-device communication.
     """
 
-    def __init__(self, device_id, num_qnics, num_cnics, num_qbits_qnic, qproc_params=None):
+    def __init__(self, device_id, num_qnics, num_cnics, num_qbits_qnic, qproc_params=None, qstate_backend="netsquid",
+                 pipelined=False, fidelity_sampling_period=1, dag_cache_size=None):
         ports = [f"q_{i}" for i in range(num_qnics)] + [f"c_{i}" for i in range(num_cnics)] + ["controller"]
         super().__init__(name=f"device_{device_id}", port_names=ports, ID=device_id)
         self.device_id = device_id
@@ -68,7 +82,8 @@ class QNetworkDevice(ns.nodes.Node):
 
         # create the quantum hardware
         self.qhardware = QHardware(name=f"qhardware_{device_id}", num_qnics=num_qnics, num_qbits_qnic=num_qbits_qnic,
-                                   qproc_params=qproc_params)
+                                   qproc_params=qproc_params, qstate_backend=qstate_backend, pipelined=pipelined,
+                                   fidelity_sampling_period=fidelity_sampling_period)
         #"""The quantum hardware of this device."""
         self.add_subcomponent(self.qhardware, name="qhardware")
         # connect the quantum hardware to the node ports
@@ -77,7 +92,7 @@ class QNetworkDevice(ns.nodes.Node):
             self.qhardware.ports[f"qnic{i}"].forward_output(self.ports[f"q_{i}"])
 
         # create the QHAL
-        self.qhal = QHAL(device_id=device_id, name=f"qhal_{device_id}", qhardware=self.qhardware)
+        self.qhal = QHAL(device_id=device_id, name=f"qhal_{device_id}", qhardware=self.qhardware, pipelined=pipelined)
         #"""The QHAL of this device."""
         self.add_subcomponent(self.qhal, name="qhal")
         # connect the QHAL to the qhardware ports
@@ -87,7 +102,8 @@ class QNetworkDevice(ns.nodes.Node):
         # create the pqnet level
         self.dag = None
         #"""The current DAG of the device (PQ-NET)."""
-        self.net_manager = NetManagerProtocol(name=f"net_manager_{device_id}", node=self)
+        self.net_manager = NetManagerProtocol(name=f"net_manager_{device_id}", node=self,
+                                              dag_cache_size=dag_cache_size)
         #"""The NET manager of this device. It handles classical messages and responses from the quantum hardware and
         #    delivers them to the destination module inside the DAG.
         #"""
@@ -0,0 +1,134 @@
+"""
+Microbenchmark of the wait loops of :class:`~progress.pqnet.p_module.ModuleEnvironment` and
+:class:`~progress.messaging.router.MessageRoutingService`. A driver delivers one message per nanosecond on a random
+input port of a module or of a router, and the cost of each message is measured against the simulation of the
+driver alone. The router is measured with and without a DAG installed, as the DAG adds its messages port to the
+wait expression.
+
+Run it with ``python -m progress.examples.benchmarks.event_expressions``. To compare two versions of the loops, run
+it on both checkouts.
+"""
+
+import time
+from types import SimpleNamespace
+
+import netsquid as ns
+
+from progress.messaging.messages import ClassicalRoutingTableMessage
+from progress.messaging.router import MessageRoutingService
+from progress.pqnet.messages import InterModuleMessage
+from progress.pqnet.p_module import Module, ModuleBehavior
+from progress.sockets import TokenMessage
+
+RECEIVERS = ("module", "router", "router_dag")
+"""The receivers that can be benchmarked."""
+
+
+class _SinkModuleBehavior(ModuleBehavior):
+    """Drop every token and message."""
+
+    def handle_message(self, request):
+        pass
+
+    def handle_response(self, request):
+        pass
+
+    def handle_new_token(self, request):
+        pass
+
+
+class _Driver(ns.protocols.NodeProtocol):
+    """Deliver one message per nanosecond on a random input port of the node."""
+
+    def __init__(self, node, port_names, message_factory, num_messages):
+        super().__init__(node=node, name="driver")
+        self.port_names = port_names
+        self.message_factory = message_factory
+        self.num_messages = num_messages
+
+    def run(self):
+        rng = ns.get_random_state()
+        for _ in range(self.num_messages):
+            # the first message is delivered after the setup of the receiver
+            yield self.await_timer(duration=1)
+            port_name = self.port_names[rng.randint(len(self.port_names))]
+            self.node.ports[port_name].tx_input(self.message_factory())
+
+
+def _setup_module(num_ports):
+    module = Module(module_id=0, device_id=0, name="module", num_input=num_ports, num_output=0)
+    module.behavior = _SinkModuleBehavior(node=module)
+
+    def start():
+        # the QHAL is not needed to consume tokens, so the module protocols are started without it
+        module.behavior.start()
+        module.environment.start()
+
+    return module, [f"in{i}" for i in range(num_ports)], lambda: TokenMessage(token=None), start
+
+
+def _setup_router(num_ports, with_dag):
+    node = ns.nodes.Node("router", port_names=["controller"] + [f"c_{i}" for i in range(num_ports)])
+    node.device_id = 0
+    node.num_cnics = num_ports
+    # the router only reads the messages port of the DAG
+    node.dag = SimpleNamespace(wrapping_node=ns.nodes.Node("dag", port_names=["messages"])) if with_dag else None
+    router = MessageRoutingService(name="router", node=node)
+
+    def start():
+        router.start()
+        # messages are forwarded to device 1 through the first classical port
+        node.ports["controller"].tx_input(ClassicalRoutingTableMessage(dest_device=0, routing_table={1: 0}))
+
+    def message_factory():
+        return InterModuleMessage(sender_device=2, sender_id=0, destination_device=1, destination_id=0,
+                                  inner_message=None)
+
+    return node, [f"c_{i}" for i in range(num_ports)], message_factory, start
+
+
+def run_benchmark(receiver, num_ports, num_messages, seed=42):
+    r"""
+    Simulate `num_messages` messages delivered to a module or a router with `num_ports` input ports.
+
+    Parameters
+    ----------
+    receiver : str or None
+        The receiver consuming the messages, one of :data:`RECEIVERS`. If `None`, the messages are delivered to the
+        ports of a module that is not started, which gives the cost of the simulation alone.
+    num_ports : int
+        The number of token input ports of the module, or of classical ports of the router.
+    num_messages : int
+        The number of messages delivered.
+    seed : int, optional
+        The seed of the NetSquid random state. Defaults to 42.
+
+    Returns
+    -------
+    float
+        The wall-clock time of the simulation. [s]
+    """
+    if receiver is not None and receiver not in RECEIVERS:
+        raise ValueError(f"Receiver {receiver} not supported.")
+    ns.sim_reset()
+    ns.set_random_state(seed=seed)
+    if receiver is None or receiver == "module":
+        node, port_names, message_factory, start = _setup_module(num_ports)
+    else:
+        node, port_names, message_factory, start = _setup_router(num_ports, with_dag=(receiver == "router_dag"))
+    _Driver(node, port_names, message_factory, num_messages).start()
+    if receiver is not None:
+        start()
+    start_time = time.perf_counter()
+    ns.sim_run()
+    return time.perf_counter() - start_time
+
+
+if __name__ == '__main__':
+    num_messages = 100000
+    for num_ports in [2, 5, 9]:
+        baseline = run_benchmark(None, num_ports, num_messages)
+        costs = [(run_benchmark(receiver, num_ports, num_messages) - baseline) / num_messages * 1e6
+                 for receiver in RECEIVERS]
+        print(f"{num_ports} ports: " + ", ".join(f"{receiver} {cost:.2f} us/message"
+                                                 for receiver, cost in zip(RECEIVERS, costs)))
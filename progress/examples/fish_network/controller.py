@@ -2,10 +2,10 @@
 A dummy controller that has some pre-loaded DAGS and can send them to the devices
 """
 from progress.messaging.messages import ClassicalRoutingTableMessage
-from progress.pqnet.messages import ReplaceDAGMessage
+from progress.pqnet.messages import ReplaceDAGMessage, PatchDAGMessage
 from progress.pqnet.repository import *
 from progress.pqnet.dag import DAGFactory
-from progress import progress_logging as log
+from progress import metrics, progress_logging as log
 
 import netsquid as ns
 
@@ -598,14 +598,28 @@ class DummyControllerProtocol(ns.protocols.NodeProtocol):
 
     NEW_SCENARIO_SIGNAL = "new_scenario"
     NEW_SCENARIO_EVT_TYPE = ns.pydynaa.EventType("new_scenario", "A new scenario has started")
+    # fields of the records published on the NEW_SCENARIO_SIGNAL channel of the active metrics bus
+    NEW_SCENARIO_FIELDS = ("time", "scenario", "topology_id")
 
-    def __init__(self, node, avg_scenario_period=0.5):
+    def __init__(self, node, avg_scenario_period=0.5, patch_dags=False):
         super().__init__(node=node, name="DummyControllerProtocol")
         self.avg_scenario_period = avg_scenario_period
+        # if True, DAGs are updated incrementally with PatchDAGMessage instead of being replaced
+        self.patch_dags = patch_dags
         self.scenario = 0
         self.previous_scenario = -1
         self.add_signal(self.NEW_SCENARIO_SIGNAL, self.NEW_SCENARIO_EVT_TYPE)
 
+    def _notify_new_scenario(self, topology_id):
+        # publish on the metrics bus if installed, otherwise signal the new scenario
+        bus = metrics.get_metrics_bus()
+        if bus is not None:
+            bus.get_channel(self.NEW_SCENARIO_SIGNAL, self.NEW_SCENARIO_FIELDS).publish(ns.sim_time(), self.scenario,
+                                                                                        topology_id)
+        else:
+            result = (ns.sim_time(), self.scenario, topology_id)
+            self.send_signal(self.NEW_SCENARIO_SIGNAL, result)
+
     def run(self):
 
         # at the beginning the controller sends the classical routing table to each node
@@ -660,8 +674,7 @@ class DummyControllerProtocol(ns.protocols.NodeProtocol):
                 conn_2.stop()
                 # and wait some time to simulate the time needed to detect the failure
                 # for statistics collection
-                result = (ns.sim_time(), self.scenario, topology_id)
-                self.send_signal(self.NEW_SCENARIO_SIGNAL, result)
+                self._notify_new_scenario(topology_id)
                 yield self.await_timer(duration=1e7)
 
             # send a new DAG to each node
@@ -669,13 +682,13 @@ class DummyControllerProtocol(ns.protocols.NodeProtocol):
 
                 # for statistics collection
                 if self.scenario != 4:
-                    result = (ns.sim_time(), self.scenario, topology_id)
-                    self.send_signal(self.NEW_SCENARIO_SIGNAL, result)
+                    self._notify_new_scenario(topology_id)
 
                 self.previous_scenario = self.scenario
                 for node in range(7):
                     dag_factory = get_dag_factory(node, self.scenario)
-                    msg = ReplaceDAGMessage(destination_device=node, dag_factory=dag_factory, topology_id=topology_id)
+                    message_class = PatchDAGMessage if self.patch_dags else ReplaceDAGMessage
+                    msg = message_class(destination_device=node, dag_factory=dag_factory, topology_id=topology_id)
                     self.node.ports[f"dev_{node}"].tx_output(msg)
 
                 # wait for the period to expire
@@ -685,10 +698,10 @@ class DummyControllerProtocol(ns.protocols.NodeProtocol):
 
 class DummyController(ns.nodes.Node):
 
-    def __init__(self, network=None, avg_scenario_period=0.5):
+    def __init__(self, network=None, avg_scenario_period=0.5, patch_dags=False):
         super().__init__(name="DummyController")
         self.network = network
-        self.protocol = DummyControllerProtocol(self, avg_scenario_period=avg_scenario_period)
+        self.protocol = DummyControllerProtocol(self, avg_scenario_period=avg_scenario_period, patch_dags=patch_dags)
 
     def start(self):
         self.protocol.start()
@@ -1,153 +1,106 @@
-import netsquid as ns
-import pandas as pd
+import math
+
+import numpy as np
 import matplotlib.pyplot as plt
 
 import progress.pqnet.repository
+from progress.metrics import MetricsBus, SlotMetrics, WindowedMetrics, get_metrics_bus, set_metrics_bus
 
 
-class TokenUtilizationMetricsCollector:
-    """
-    This class is responsible for collecting service time metrics about user requests in the simulation.
-    It collects metrics about requests between two specified nodes.
-    """
-
-    def __init__(self):
-        self.data_collector = ns.util.DataCollector(get_data_function=self.handle_trigger)
+def _get_metrics_bus():
+    # collectors subscribe to the active metrics bus, which is installed by the topology
+    bus = get_metrics_bus()
+    if bus is None:
+        bus = MetricsBus()
+        set_metrics_bus(bus)
+    return bus
 
-        ev_expr_new_token = ns.pydynaa.core.EventExpression(
-            event_type=progress.pqnet.repository.WaitForSwappingModuleBehavior.NEW_TOKEN_EVT_TYPE)
 
-        freed_token = ns.pydynaa.core.EventExpression(
-            event_type=progress.pqnet.repository.FreeEverythingModuleBehavior.FREED_TOKEN_EVT_TYPE)
+def _get_freed_token_channel():
+    behavior = progress.pqnet.repository.FreeEverythingModuleBehavior
+    return _get_metrics_bus().get_channel(behavior.FREED_TOKEN_SIGNAL, behavior.FREED_TOKEN_FIELDS)
 
-        self.data_collector.collect_on(triggers=[ev_expr_new_token, freed_token], combine_rule="OR")
 
-    @staticmethod
-    def handle_new_token(ev_expr):
-        protocol = ev_expr.triggered_events[-1].source
-        result = protocol.get_signal_result(progress.pqnet.repository.WaitForSwappingModuleBehavior.NEW_TOKEN_SIGNAL)
-        return {'time': result[0], 'type': 'new_token'}
+def _get_new_scenario_channel():
+    controller = progress.examples.fish_network.controller.DummyControllerProtocol
+    return _get_metrics_bus().get_channel(controller.NEW_SCENARIO_SIGNAL, controller.NEW_SCENARIO_FIELDS)
 
-    @staticmethod
-    def handle_freed_token(ev_expr):
-        protocol = ev_expr.triggered_events[-1].source
-        result = protocol.get_signal_result(progress.pqnet.repository.FreeEverythingModuleBehavior.FREED_TOKEN_SIGNAL)
-        return {'time': result[0], 'type': 'freed_token'}
 
-    def handle_trigger(self, ev_expr):
-        protocol = ev_expr.triggered_events[-1].source
+class TokenUtilizationMetricsCollector:
+    """
+    This class is responsible for collecting service time metrics about user requests in the simulation.
+    It collects metrics about requests between two specified nodes. It only reads the number of records published on
+    the metrics bus since its creation, so it adds no work per token.
+    """
 
-        if isinstance(protocol, progress.pqnet.repository.WaitForSwappingModuleBehavior):
-            return self.handle_new_token(ev_expr)
-        elif isinstance(protocol, progress.pqnet.repository.FreeEverythingModuleBehavior):
-            return self.handle_freed_token(ev_expr)
+    def __init__(self):
+        behavior = progress.pqnet.repository.WaitForSwappingModuleBehavior
+        self._new_tokens = _get_metrics_bus().get_channel(behavior.NEW_TOKEN_SIGNAL, behavior.NEW_TOKEN_FIELDS)
+        self._freed_tokens = _get_freed_token_channel()
+        self._new_tokens_offset = len(self._new_tokens)
+        self._freed_tokens_offset = len(self._freed_tokens)
 
     def get_counts(self):
-        dataframe = self.data_collector.dataframe
-
-        grouped = dataframe.groupby('type', as_index=True).count()
-        if len(grouped['time']) < 2:
+        num_new = len(self._new_tokens) - self._new_tokens_offset
+        num_freed = len(self._freed_tokens) - self._freed_tokens_offset
+        if num_new == 0 or num_freed == 0:
             print("WARNING: not enough data to compute token utilization")
             return 0, 1
-        return grouped['time'][0], grouped['time'][1]
+        return num_freed, num_new
 
 
 class FidelityMetricsCollector:
     """
     This class is responsible for collecting fidelity metrics about end-to-end sockets.
-    It collects metrics about tokens between two specified end nodes.
+    It collects metrics about tokens between two specified end nodes. Throughput and fidelity series are maintained
+    while the simulation runs by a :class:`~progress.metrics.WindowedMetrics` (attribute `metrics`).
     """
 
     def __init__(self, node_a, node_b):
 
         self.node_a = node_a
         self.node_b = node_b
+        self.metrics = WindowedMetrics()
 
-        self.data_collector = ns.util.DataCollector(get_data_function=self.handle_trigger)
-
-        new_scenario = ns.pydynaa.core.EventExpression(
-            event_type=progress.examples.fish_network.controller.DummyControllerProtocol.NEW_SCENARIO_EVT_TYPE)
+        _get_new_scenario_channel().subscribe(self.handle_new_scenario)
+        _get_freed_token_channel().subscribe(self.handle_freed_token)
 
-        freed_token = ns.pydynaa.core.EventExpression(
-            event_type=progress.pqnet.repository.FreeEverythingModuleBehavior.FREED_TOKEN_EVT_TYPE)
+    def handle_new_scenario(self, time, scenario, topology_id):
+        self.metrics.add_scenario(time, scenario)
 
-        self.data_collector.collect_on(triggers=[new_scenario, freed_token], combine_rule="OR")
-
-    @staticmethod
-    def handle_new_scenario(ev_expr):
-        protocol = ev_expr.triggered_events[-1].source
-        result = protocol.get_signal_result(progress.examples.fish_network.controller.DummyControllerProtocol.NEW_SCENARIO_SIGNAL)
-        return {'time': result[0], 'scenario': result[1], 'type': 'new_scenario'}
-
-    def handle_freed_token(self, ev_expr):
-        protocol = ev_expr.triggered_events[-1].source
-        result = protocol.get_signal_result(progress.pqnet.repository.FreeEverythingModuleBehavior.FREED_TOKEN_SIGNAL)
-        if result[1].socket.node == self.node_a and result[1].other_end.node == self.node_b:
-            return {'time': result[0], 'type': 'freed_token', 'fid_sq': result[2]}
-
-    def handle_trigger(self, ev_expr):
-        protocol = ev_expr.triggered_events[-1].source
-
-        if isinstance(protocol, progress.examples.fish_network.controller.DummyControllerProtocol):
-            return self.handle_new_scenario(ev_expr)
-        elif isinstance(protocol, progress.pqnet.repository.FreeEverythingModuleBehavior):
-            return self.handle_freed_token(ev_expr)
+    def handle_freed_token(self, time, node, other_node, fid_sq, slot_id):
+        if node == self.node_a and other_node == self.node_b:
+            self.metrics.add_sample(time, None if math.isnan(fid_sq) else fid_sq)
 
     def plot_fidelity(self, sample_dots=False):
-        dataframe = self.data_collector.dataframe
-
-        # filter out rows whose type is not 'freed_token'
-        fidelities = dataframe[dataframe['type'] == 'freed_token']
-        # reformat time from ns to ms
-        fidelities['time'] = fidelities['time'] / 1000000
-
-        # filter out rows whose type is not 'new_scenario'
-        scenarios = dataframe[dataframe['type'] == 'new_scenario']
-        # reformat time from ns to ms
-        scenarios['time'] = scenarios['time'] / 1000000
+        # times are reformatted from ns to ms
+        times, fidelities = self.metrics.get_samples()
+        times = times * 1e-6
+        scenario_times, scenarios = self.metrics.get_scenarios()
+        scenario_times = scenario_times * 1e-6
 
         # create a plot with time on the x-axis and fidelity on the y-axis, where scenarios are marked by
         # changing the backgorund color of the area for the x-axis interval of the scenario
         if sample_dots:
-            # perform a random sampling on fidelities and save the result in a new dataframe
-            sampled_fidelities = fidelities.sample(frac=0.3)
-            ax = sampled_fidelities.plot(x='time', y='fid_sq', kind='scatter', color='blue', figsize=(10, 5))
-
-        else:
-            ax = fidelities.plot(x='time', y='fid_sq', kind='scatter', color='blue', figsize=(10, 5))
-        prev_row = None
+            # perform a random sampling on fidelities
+            sampled = np.random.default_rng().random(len(times)) < 0.3
+            times, fidelities = times[sampled], fidelities[sampled]
+        _, ax = plt.subplots(figsize=(10, 5))
+        ax.scatter(times, fidelities, color='blue')
         color_map = {0: 'red', 1: 'green', 2: 'blue', 3: 'yellow'}
         # color_map = {0: 'white', 1: 'white', 2: 'white', 3: 'white', 4: 'cyan'}
-        for index, row in scenarios.iterrows():
-            if prev_row is not None:
-                ax.axvspan(prev_row['time'], row['time'], facecolor=color_map[prev_row['scenario']], alpha=0.3)
-            prev_row = row
-        # plot the last scenario
-        ax.axvspan(prev_row['time'], fidelities['time'].max(), facecolor=color_map[prev_row['scenario']], alpha=0.3)
-
-        # create a new dataframe where each entry has a field 'time' and a field 'throughput', where throughput is
-        # the number of tokens that were freed in the time interval between 'time' - window_size and 'time' divided
-        # by the window size
-        window_size = 10  # ms
-        step_size = 0.1  # ms
-        throughput = pd.DataFrame(columns=['time', 'throughput'])
-        next_time = fidelities['time'].min() + window_size
-        max_time = fidelities['time'].max()
-        while next_time < max_time:
-            row = pd.DataFrame(
-                {'time': [next_time],
-                 'throughput': [fidelities[(fidelities['time'] > next_time - window_size) & (fidelities['time'] < next_time)]['fid_sq'].count() * 1e3 / window_size]
-                }
-            )
-            throughput = pd.concat([throughput, row],
-                                   axis=0, ignore_index=True, join='outer')
-            next_time += step_size
+        span_ends = np.append(scenario_times[1:], times.max())
+        for start, end, scenario in zip(scenario_times, span_ends, scenarios):
+            ax.axvspan(start, end, facecolor=color_map[scenario], alpha=0.3)
+
+        # the throughput is the number of tokens freed in the last window, divided by the window size
+        throughput_times, throughput = self.metrics.get_throughput()
 
         # plot the throughput on the same plot as the fidelity, on the same x-axis but on a different y-axis
         ax2 = ax.twinx()
-        throughput.plot(x='time', y='throughput', kind='line', color='red', ax=ax2)
+        ax2.plot(throughput_times * 1e-6, throughput, color='red')
         ax2.set_ylabel('Throughput [tokens/s]')
-        ax2.set_ylim(0, 1.5*throughput['throughput'].max())
+        ax2.set_ylim(0, 1.5*throughput.max())
         # set the color of the y-axis labels to red
         for tl in ax2.get_yticklabels():
             tl.set_color('r')
@@ -158,7 +111,6 @@ class FidelityMetricsCollector:
         ax.set_ylabel('Fidelity (squared)')
         ax.set_title('Fidelity and throughput of end nodes A-C entanglement')
         ax.grid(True)
-        ax.legend().remove()
 
         # increase the font size of the title
         ax.title.set_fontsize(20)
@@ -176,85 +128,59 @@ class FidelityMetricsCollector:
 class AggregateMetricsCollector:
     """
     This class is responsible for collecting aggregate metrics about end-to-end sockets.
-    It collects metrics about tokens between two specified end nodes.
+    It collects metrics about tokens between two specified end nodes. Tokens are attributed to their slot (topology id)
+    while the simulation runs by a :class:`~progress.metrics.SlotMetrics` (attribute `metrics`).
     """
 
+    SCENARIO_GROUPS = {'High Fidelity': (0, 1), 'Low Fidelity': (2, 3)}
+    """The groups of scenarios that are compared."""
+
     def __init__(self, node_a, node_b):
 
         self.node_a = node_a
         self.node_b = node_b
+        self.metrics = SlotMetrics()
 
-        self.data_collector = ns.util.DataCollector(get_data_function=self.handle_trigger)
-
-        new_scenario = ns.pydynaa.core.EventExpression(
-            event_type=progress.examples.fish_network.controller.DummyControllerProtocol.NEW_SCENARIO_EVT_TYPE)
+        _get_new_scenario_channel().subscribe(self.handle_new_scenario)
+        _get_freed_token_channel().subscribe(self.handle_freed_token)
 
-        freed_token = ns.pydynaa.core.EventExpression(
-            event_type=progress.pqnet.repository.FreeEverythingModuleBehavior.FREED_TOKEN_EVT_TYPE)
+    def handle_new_scenario(self, time, scenario, topology_id):
+        self.metrics.add_slot(topology_id, time, scenario)
 
-        self.data_collector.collect_on(triggers=[new_scenario, freed_token], combine_rule="OR")
+    def handle_freed_token(self, time, node, other_node, fid_sq, slot_id):
+        if node == self.node_a and other_node == self.node_b:
+            self.metrics.add_sample(time, slot_id, None if math.isnan(fid_sq) else fid_sq)
 
-    @staticmethod
-    def handle_new_scenario(ev_expr):
-        protocol = ev_expr.triggered_events[-1].source
-        result = protocol.get_signal_result(progress.examples.fish_network.controller.DummyControllerProtocol.NEW_SCENARIO_SIGNAL)
-        return {'time': result[0], 'scenario': result[1], 'type': 'new_scenario', 'topology_id': result[2]}
+    def get_summary(self, quantiles=(0.05, 0.5, 0.95)):
+        """
+        Aggregate fidelities and response times (the time from the start of a slot to its first token) for each
+        group of :attr:`SCENARIO_GROUPS`. It does not need matplotlib.
 
-    def handle_freed_token(self, ev_expr):
-        protocol = ev_expr.triggered_events[-1].source
-        result = protocol.get_signal_result(progress.pqnet.repository.FreeEverythingModuleBehavior.FREED_TOKEN_SIGNAL)
-        if result[1].socket.node == self.node_a and result[1].other_end.node == self.node_b:
-            return {'time': result[0], 'type': 'freed_token', 'fid_sq': result[2], 'slot_id': result[3]}
-
-    def handle_trigger(self, ev_expr):
-        protocol = ev_expr.triggered_events[-1].source
-
-        if isinstance(protocol, progress.examples.fish_network.controller.DummyControllerProtocol):
-            return self.handle_new_scenario(ev_expr)
-        elif isinstance(protocol, progress.pqnet.repository.FreeEverythingModuleBehavior):
-            return self.handle_freed_token(ev_expr)
+        See Also
+        --------
+        :meth:`~progress.metrics.SlotMetrics.summarize`
+        """
+        return self.metrics.summarize(self.SCENARIO_GROUPS, quantiles)
 
     def plot_boxes(self):
-        dataframe = self.data_collector.dataframe
-
-        # filter out rows whose type is not 'freed_token'
-        fidelities = dataframe[dataframe['type'] == 'freed_token']
-        # reformat time from ns to ms
-        fidelities['time'] = fidelities['time'] * 1e-6
-
-        # filter out rows whose type is not 'new_scenario'
-        scenarios = dataframe[dataframe['type'] == 'new_scenario']
-        # reformat time from ns to ms
-        scenarios['time'] = scenarios['time'] * 1e-6
-
-        # add a field to fidelities that contains the current scenario and its starting time
-        fidelities['scenario'] = 0
-        fidelities['slot_start_time'] = 0.0
-        for index, row in scenarios.iterrows():
-            fidelities.loc[fidelities['slot_id'] == row['topology_id'], 'scenario'] = row['scenario']
-            fidelities.loc[fidelities['slot_id'] == row['topology_id'], 'slot_start_time'] = row['time']
-
-        # get a column containing fidelities for scenarios (0,1) and a column containing fidelities for scenarios (2,3)
-        fidelities_01 = fidelities[(fidelities['scenario'] == 0) | (fidelities['scenario'] == 1)]['fid_sq']
-        fidelities_23 = fidelities[(fidelities['scenario'] == 2) | (fidelities['scenario'] == 3)]['fid_sq']
-        
-        # get a column containing response times for scenarios (0,1) and a column containing response times for scenarios (2,3)
-        # to do so, we first get the first time a token is freed for each scenario_slot by grouping by scenario_start_time and taking the minimum time
-        # and then we compute the difference between the time of the scenario_start_time and the time of the first freed token
-        response_times_01 = fidelities[(fidelities['scenario'] == 0) | (fidelities['scenario'] == 1)].groupby('slot_start_time', as_index=True)['time'].min()
-        response_times_23 = fidelities[(fidelities['scenario'] == 2) | (fidelities['scenario'] == 3)].groupby('slot_start_time', as_index=True)['time'].min()
-        response_times_01 = response_times_01 - response_times_01.index
-        response_times_23 = response_times_23 - response_times_23.index
+        # get the fidelities for scenarios (0,1) and for scenarios (2,3)
+        # (tokens skipped by fidelity sampling have no fidelity)
+        groups = list(self.SCENARIO_GROUPS.values())
+        fidelities_01, fidelities_23 = [self.metrics.get_values(group) for group in groups]
+
+        # get the response times for scenarios (0,1) and for scenarios (2,3), i.e. the time between the start of each
+        # slot and its first freed token, reformatted from ns to ms
+        response_times_01, response_times_23 = [self.metrics.get_response_times(group) * 1e-6 for group in groups]
         print(response_times_01)
         print(response_times_23)
-        
+
         # plot fidelities and response times as boxplots
         fig, ax = plt.subplots(1, 2, figsize=(8, 5))
-        ax[0].boxplot([fidelities_01, fidelities_23], labels=['High Fidelity', 'Low Fidelity'],
+        ax[0].boxplot([fidelities_01, fidelities_23], labels=list(self.SCENARIO_GROUPS),
                       sym="", whis=[5, 95])
         ax[0].set_title('Fidelity of A-C entangled states')
         ax[0].set_ylabel('Fidelity (squared)')
-        ax[1].boxplot([response_times_01, response_times_23], labels=['High Fidelity', 'Low Fidelity'],
+        ax[1].boxplot([response_times_01, response_times_23], labels=list(self.SCENARIO_GROUPS),
                       sym="", whis=[5, 95])
         ax[1].set_title('Latency for A-C entanglement')
         ax[1].set_ylabel('Latency [ms]')
@@ -9,12 +9,16 @@ from progress.hardware.llps.mps import optimistic_parameters_v3, MPSProtocol
 from progress.hardware.mps_connection import MPSConnection
 
 from progress.device import QNetworkDevice
+from progress.metrics import MetricsBus, set_metrics_bus
 
 
 def get_topology(avg_scenario_period=0.5, controller_dist=15, out_of_band=False, generate_collectors=True):
     r"""
     Get the topology of the network.
     """
+    # the statistics of each run are published on a new metrics bus, shared by all its collectors
+    set_metrics_bus(MetricsBus())
+
     qproc_params = {
         "coherence_time": 5 * 1e6,
         "one_qbit_noise": None, 
@@ -0,0 +1,391 @@
+r"""
+This module implements a fast quantum state backend for the quantum hardware. Since ProgReSS devices only hold
+halves of Bell pairs, each pair can be described by the four coefficients of a Bell-diagonal state, in the order
+:math:`\vert \beta_{00} \rangle, \vert \beta_{01} \rangle, \vert \beta_{10} \rangle, \vert \beta_{11} \rangle`
+(the same encoding used by :attr:`progress.sockets.Token.current_state`). Entanglement swapping, DEJMPS distillation,
+Pauli corrections, depolarizing gate noise and dephasing memory noise are all applied in closed form on the
+coefficients.
+
+The backend is selected by creating a :class:`~progress.hardware.qhardware.QHardware` with
+``qstate_backend="bell_diagonal"``.
+"""
+
+import math
+
+import netsquid as ns
+from netsquid.util.simtools import get_random_state
+
+from progress.sockets import bell_state_from_measurement, compose_bell_states
+
+__all__ = ["BellPairHalf", "BellDiagonalPair", "BellDiagonalMemory"]
+
+
+class BellPairHalf:
+    r"""
+    One of the two qubits of a :class:`~progress.hardware.bell_diagonal.BellDiagonalPair`. It is what is stored in a
+    :class:`~progress.hardware.bell_diagonal.BellDiagonalMemory`.
+
+    Parameters
+    ----------
+    pair : :class:`~progress.hardware.bell_diagonal.BellDiagonalPair`
+        The pair this qubit belongs to.
+    side : int
+        The index of this qubit in the pair (0 or 1).
+    """
+
+    __slots__ = ('pair', 'side', 'dephase_rate', 'last_update')
+
+    def __init__(self, pair, side):
+        self.pair = pair
+        self.side = side
+        self.dephase_rate = 0.
+        self.last_update = ns.sim_time()
+
+
+class BellDiagonalPair:
+    r"""
+    A Bell pair described by its four Bell-diagonal coefficients. Memory noise is applied lazily: each half keeps the
+    time of its last update and its dephasing rate, and the coefficients are brought up to date only when they are
+    read or combined with another pair.
+
+    Parameters
+    ----------
+    coefficients : list[float] or None, optional
+        The four Bell-diagonal coefficients. If `None`, the pair is a perfect :math:`\vert \beta_{00} \rangle`.
+        Defaults to `None`.
+    """
+
+    __slots__ = ('coefficients', 'halves', '_pending_dejmps', '_num_claimed')
+
+    def __init__(self, coefficients=None):
+        if coefficients is None:
+            coefficients = [1., 0., 0., 0.]
+        self.coefficients = list(coefficients)
+        self.halves = [BellPairHalf(self, 0), BellPairHalf(self, 1)]
+        self._pending_dejmps = None
+        self._num_claimed = 0
+
+    def claim_half(self):
+        r"""
+        Get the next unclaimed half of the pair. It is used by the two ends of a link that receive the same pair,
+        e.g. from the message metadata of an entangling source.
+
+        Returns
+        -------
+        :class:`~progress.hardware.bell_diagonal.BellPairHalf`
+            The first half at the first call, the second one at the second call.
+        """
+        if self._num_claimed == 2:
+            raise ValueError("Both halves of the pair have already been claimed.")
+        half = self.halves[self._num_claimed]
+        self._num_claimed += 1
+        return half
+
+    def update(self, current_time=None):
+        r"""
+        Apply the memory dephasing accumulated by both halves until `current_time`.
+
+        Parameters
+        ----------
+        current_time : float or None, optional
+            The time until which the noise is applied. If `None`, the current simulation time is used. [ns]
+        """
+        if current_time is None:
+            current_time = ns.sim_time()
+        for half in self.halves:
+            delta_time = current_time - half.last_update
+            if delta_time > 0 and half.dephase_rate > 0:
+                self.dephase(1 - math.exp(-delta_time * 1e-9 * half.dephase_rate))
+            half.last_update = current_time
+
+    def dephase(self, prob):
+        r"""
+        Apply a Z error with probability `prob` on one qubit of the pair.
+        """
+        c = self.coefficients
+        self.coefficients = [(1 - prob) * c[k] + prob * c[k ^ 2] for k in range(4)]
+
+    def depolarize(self, prob):
+        r"""
+        Depolarize one qubit of the pair with probability `prob`. As the other qubit is maximally mixed, this
+        mixes the whole pair with the maximally mixed state.
+        """
+        self.coefficients = [(1 - prob) * c + prob / 4 for c in self.coefficients]
+
+    def apply_pauli(self, bell_state):
+        r"""
+        Apply on one qubit the Pauli operator that maps :math:`\vert \beta_{00} \rangle` to the Bell state with
+        index `bell_state` (X for bit 0, Z for bit 1).
+        """
+        c = self.coefficients
+        self.coefficients = [c[k ^ bell_state] for k in range(4)]
+
+    def fidelity(self, bell_state, current_time=None):
+        r"""
+        Get the (squared) fidelity of the pair with a reference Bell state.
+
+        Parameters
+        ----------
+        bell_state : int
+            The index of the reference Bell state.
+        current_time : float or None, optional
+            The time at which the fidelity is read. If `None`, the current simulation time is used. [ns]
+
+        Returns
+        -------
+        float
+            The fidelity of the pair.
+        """
+        self.update(current_time)
+        return self.coefficients[bell_state]
+
+
+class BellDiagonalMemory:
+    r"""
+    A quantum memory storing halves of Bell-diagonal pairs. It accepts the same parameters as
+    :func:`~progress.hardware.qhardware.get_processor`, and applies the same noise in closed form.
+
+    Parameters
+    ----------
+    num_positions : int
+        The number of qubits in the quantum memory.
+    coherence_time : int or None, optional
+        The coherence time of the quantum memory. If not `None`, qubits are also depolarized when they are placed in
+        the memory, see :attr:`INPUT_P_ERR`. [ns]
+    one_qbit_noise : None, optional
+        Custom noise models are not supported by this backend. Must be `None`.
+    two_qbit_noise : None, optional
+        Custom noise models are not supported by this backend. Must be `None`.
+    two_qbit_p_err : float, optional
+        The depolarizing probability of two qubit instructions.
+    meas_p_err : float, optional
+        The depolarizing probability applied before a CBS measurement.
+    instr_duration : float, optional
+        The duration of each instruction. Defaults to 0. [ns]
+    rng : :class:`~numpy.random.RandomState` or None, optional
+        The rng used to sample measurement outcomes. If `None`, the NetSquid random state is used.
+
+    Notes
+    -----
+    Qubits are placed in the memory with :meth:`put`, which applies the input noise of the processors built by
+    :func:`~progress.hardware.qhardware.get_processor` with a coherence time.
+    """
+
+    INPUT_P_ERR = 0.03
+    """
+    The depolarizing probability applied to the qubits placed in a memory with a coherence time. It matches the
+    input noise model installed by :func:`~progress.hardware.qhardware.get_processor`.
+    """
+
+    SWAP_DURATION = 1
+    """
+    The number of sequential instructions of an entanglement swapping.
+    """
+
+    DEJMPS_DURATION = 3
+    """
+    The number of sequential instructions of DEJMPS (parallel rotations, CNOT, measurement).
+    """
+
+    CORRECT_DURATION = 2
+    """
+    The number of sequential instructions of a Pauli correction (X and Z).
+    """
+
+    _DEJMPS_ROTATION = (0, 1, 3, 2)
+    # the local rotations of DEJMPS exchange the coefficients of beta_10 and beta_11
+
+    def __init__(self, num_positions, coherence_time=None, one_qbit_noise=None, two_qbit_noise=None,
+                 two_qbit_p_err=0.005, meas_p_err=0., instr_duration=0., rng=None):
+        if one_qbit_noise is not None or two_qbit_noise is not None:
+            raise ValueError("Custom noise models are not supported by the Bell-diagonal backend.")
+        self.num_positions = num_positions
+        self.two_qbit_p_err = two_qbit_p_err
+        self.meas_p_err = meas_p_err
+        self.instr_duration = instr_duration
+        self.dephase_rate = 0.
+        self.input_p_err = 0.
+        if coherence_time is not None:
+            self.dephase_rate = -math.log(0.98)*1e9 / coherence_time
+            self.input_p_err = self.INPUT_P_ERR
+        self.rng = rng
+        self._positions = [None] * num_positions
+
+    def _get_rng(self):
+        if self.rng is None:
+            return get_random_state()
+        return self.rng
+
+    def put(self, half, position):
+        r"""
+        Store a half of a pair at the given position, replacing what was there. The input noise of the memory is
+        applied to the half.
+
+        Parameters
+        ----------
+        half : :class:`~progress.hardware.bell_diagonal.BellPairHalf`
+            The half to store.
+        position : int
+            The memory position.
+        """
+        half.pair.update()
+        if self.input_p_err > 0:
+            half.pair.depolarize(self.input_p_err)
+        half.dephase_rate = self.dephase_rate
+        self._positions[position] = half
+
+    def peek(self, position):
+        r"""
+        Get the half stored at the given position without removing it.
+
+        Returns
+        -------
+        :class:`~progress.hardware.bell_diagonal.BellPairHalf` or None
+            The stored half, `None` if the position is empty.
+        """
+        return self._positions[position]
+
+    def pop(self, position):
+        r"""
+        Remove the half stored at the given position. The pair stops dephasing on this side.
+
+        Returns
+        -------
+        :class:`~progress.hardware.bell_diagonal.BellPairHalf` or None
+            The removed half, `None` if the position was empty.
+        """
+        half = self._positions[position]
+        if half is not None:
+            half.pair.update()
+            half.dephase_rate = 0.
+            self._positions[position] = None
+        return half
+
+    def _get_half(self, position):
+        half = self._positions[position]
+        if half is None:
+            raise ValueError(f"No qubit stored at position {position}.")
+        return half
+
+    def fidelity(self, position, bell_state):
+        r"""
+        Get the (squared) fidelity of the pair stored at the given position with a reference Bell state.
+
+        Parameters
+        ----------
+        position : int
+            The memory position.
+        bell_state : int
+            The index of the reference Bell state.
+
+        Returns
+        -------
+        float
+            The fidelity of the pair.
+        """
+        return self._get_half(position).pair.fidelity(bell_state)
+
+    def correct(self, position, current_state):
+        r"""
+        Bring the pair at the given position from the Bell state `current_state` back to
+        :math:`\vert \beta_{00} \rangle`.
+        """
+        self._get_half(position).pair.apply_pauli(current_state)
+
+    def swap(self, position1, position2):
+        r"""
+        Perform a Bell state measurement on the qubits at the given positions. The two remote halves are joined into a
+        new pair.
+
+        Returns
+        -------
+        int
+            The measurement outcome, with the same encoding as :data:`netsquid.components.INSTR_MEASURE_BELL`.
+        """
+        half_a = self._get_half(position1)
+        half_b = self._get_half(position2)
+        pair_a = half_a.pair
+        pair_b = half_b.pair
+        if pair_a is pair_b:
+            raise ValueError("Cannot swap two qubits of the same pair.")
+        now = ns.sim_time()
+        pair_a.update(now)
+        pair_b.update(now)
+        pair_a.depolarize(self.two_qbit_p_err)
+        pair_b.depolarize(self.two_qbit_p_err)
+
+        raw_outcome = int(self._get_rng().randint(4))
+        outcome = bell_state_from_measurement(raw_outcome)
+
+        p = pair_a.coefficients
+        q = pair_b.coefficients
+        coefficients = [0.] * 4
+        for i in range(4):
+            for j in range(4):
+                coefficients[compose_bell_states(i, j, outcome)] += p[i] * q[j]
+
+        new_pair = BellDiagonalPair(coefficients)
+        for side, half in enumerate([pair_a.halves[1 - half_a.side], pair_b.halves[1 - half_b.side]]):
+            half.pair = new_pair
+            half.side = side
+            new_pair.halves[side] = half
+        return raw_outcome
+
+    def dejmps(self, position1, position2, role):
+        r"""
+        Perform this side of DEJMPS distillation, where the qubit at `position1` is kept and the one at `position2`
+        is the ancilla. The joint outcome of both sides is sampled by the first side that performs the distillation,
+        and the second side reads its own outcome.
+
+        Returns
+        -------
+        int
+            The measurement outcome of the ancilla on this side.
+        """
+        if role not in ('A', 'B'):
+            raise ValueError("The role must be either 'A' or 'B'.")
+        half_a = self._get_half(position1)
+        half_b = self._get_half(position2)
+        pair_a = half_a.pair
+        pair_b = half_b.pair
+
+        pending = pair_a._pending_dejmps
+        if pending is not None and pending[0] is pair_b:
+            pair_a._pending_dejmps = None
+            return pending[1][half_a.side]
+
+        now = ns.sim_time()
+        pair_a.update(now)
+        pair_b.update(now)
+        p = [pair_a.coefficients[k] for k in self._DEJMPS_ROTATION]
+        q = [pair_b.coefficients[k] for k in self._DEJMPS_ROTATION]
+        # the bilateral CNOT maps two Bell states to two Bell states: the phase bit of the target moves onto the
+        # control, and the bit of the control onto the target. The ancilla outcomes agree if the target has bit 0
+        kept = ([0.] * 4, [0.] * 4)
+        for i in range(4):
+            for j in range(4):
+                k = (((i >> 1) ^ (j >> 1)) << 1) | (i & 1)
+                kept[(i & 1) ^ (j & 1)][k] += p[i] * q[j]
+
+        # after the CNOT, the gate noise on each side and the measurement noise on each side depolarize the ancilla.
+        # This only randomizes the parity of the outcomes, and leaves the kept pair untouched
+        prob_ancilla_intact = ((1 - self.two_qbit_p_err) * (1 - self.meas_p_err)) ** 2
+        success = [prob_ancilla_intact * kept[0][k] + (1 - prob_ancilla_intact) * (kept[0][k] + kept[1][k]) / 2
+                   for k in range(4)]
+        failure = [prob_ancilla_intact * kept[1][k] + (1 - prob_ancilla_intact) * (kept[0][k] + kept[1][k]) / 2
+                   for k in range(4)]
+
+        rng = self._get_rng()
+        prob_success = sum(success)
+        outcome = int(rng.randint(2))
+        if rng.random_sample() < prob_success:
+            pair_a.coefficients = [c / prob_success for c in success]
+            outcomes = [outcome, outcome]
+        else:
+            pair_a.coefficients = [c / (1 - prob_success) for c in failure]
+            outcomes = [outcome, 1 - outcome]
+        # the gate noise on each side depolarizes the kept qubit after the CNOT
+        pair_a.depolarize(self.two_qbit_p_err)
+        pair_a.depolarize(self.two_qbit_p_err)
+        pair_a._pending_dejmps = (pair_b, outcomes)
+        return outcomes[half_a.side]
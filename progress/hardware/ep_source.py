@@ -4,6 +4,7 @@ process of Midpoint Source Protocol.
 """
 import math
 
+import numpy as np
 from netsquid.components.qsource import QSource, SourceStatus
 from netsquid.components.models.delaymodels import DelayModel
 import netsquid.qubits.ketstates as ks
@@ -14,7 +15,8 @@ import netsquid as ns
 
 __all__ = ["MPSSourceNode"]
 
-from progress.hardware.llps.mps import MPSSourceProtocol
+from progress.hardware.bell_diagonal import BellDiagonalPair
+from progress.hardware.llps.mps import MPSSourceProtocol, sample_successful_pairs
 from progress import progress_logging as log
 
 
@@ -45,6 +47,10 @@ class MPSSource(QSource):
         The clock period of the MS protocols. Defaults to 1. [ns]
     t_link : int or float
         The total transmission time of the link between the two repeaters.
+    vectorized : bool, optional
+        If `True`, the trials of all the free positions are sampled with a few vectorized calls to the rng.
+        If `False`, positions are sampled one by one, consuming the rng exactly as in previous versions, so that old
+        experiments can be replayed seed for seed. Defaults to `True`.
     """
 
     class MPSDelayModel(DelayModel):
@@ -52,9 +58,13 @@ class MPSSource(QSource):
         This stateful delay model determines the time between the generation of two consecutive entangled pairs
         in MPS protocol. It should only be used inside its parent class
         :class:`~qi_simulation.mps.components.ep_source.MPSSource`.
+
+        The successful pairs of a round are stored as two arrays (bin indices and trial indices) that are consumed
+        through a cursor.
         """
 
-        def __init__(self, source,  p_left, p_right, num_positions, p_mid, t_clock, t_link, rng=None, **kwargs):
+        def __init__(self, source,  p_left, p_right, num_positions, p_mid, t_clock, t_link, rng=None,
+                     vectorized=True, **kwargs):
             self._p_left = p_left
             self._p_right = p_right
             self._num_positions = num_positions
@@ -66,19 +76,41 @@ class MPSSource(QSource):
             self._t_round = self._t_link + num_positions * self._K * t_clock
             self._last_bin_and_trial = (-1, -1)
             self._source = source
+            self._vectorized = vectorized
             super().__init__(rng=rng, **kwargs)
-            self._successful_pairs = self._get_successful_pairs()
+            self._successful_bins = None
+            self._successful_trials = None
+            self._next_pair = 0
+            self._set_successful_pairs()
             self._first_time = True
 
+        def _has_successful_pairs(self):
+            return self._next_pair < len(self._successful_bins)
+
+        def _pop_successful_pair(self):
+            bin_idx = int(self._successful_bins[self._next_pair])
+            trial_idx = int(self._successful_trials[self._next_pair])
+            self._next_pair += 1
+            return bin_idx, trial_idx
+
+        def _set_bell_pair(self):
+            # both halves of the next pair carry the same Bell-diagonal pair, used by ends with that backend
+            self._source.subcomponents["qsource"].output_meta["bell_pair"] = BellDiagonalPair()
+
+        def _set_successful_pairs(self):
+            self._successful_bins, self._successful_trials = self._get_successful_pairs()
+            self._next_pair = 0
+
         def generate_delay(self, **kwargs):
 
-            if len(self._successful_pairs) > 0:
-                bin_idx, trial_idx = self._successful_pairs.pop(0)
+            if self._has_successful_pairs():
+                bin_idx, trial_idx = self._pop_successful_pair()
                 last_bin, last_trial = self._last_bin_and_trial
                 self._last_bin_and_trial = (bin_idx, trial_idx)
 
                 # this is ugly but efficient to inform the node about the position of the generated entanglement
                 self._source.subcomponents["qsource"].output_meta["position"] = bin_idx
+                self._set_bell_pair()
                 # this keeps the t_link updated on receiving nodes
                 self._source.subcomponents["qsource"].output_meta["time_sent"] = ns.sim_time()
 
@@ -90,8 +122,8 @@ class MPSSource(QSource):
                 )
 
             else:
-                self._successful_pairs = self._get_successful_pairs()
-                if len(self._successful_pairs) == 0:
+                self._set_successful_pairs()
+                if not self._has_successful_pairs():
 
                     # used to inform that there was no successful trial in this round
                     self._source.subcomponents["qsource"].output_meta["position"] = -1
@@ -106,12 +138,13 @@ class MPSSource(QSource):
 
                     return self._get_time_left_in_round(last_bin, last_trial) + self._get_round_time()
                 else:
-                    bin_idx, trial_idx = self._successful_pairs.pop(0)
+                    bin_idx, trial_idx = self._pop_successful_pair()
                     last_bin, last_trial = self._last_bin_and_trial
                     self._last_bin_and_trial = (bin_idx, trial_idx)
 
                     # this is ugly but efficient to inform the node about the position of the generated entanglement
                     self._source.subcomponents["qsource"].output_meta["position"] = bin_idx
+                    self._set_bell_pair()
 
                     # update status of qubit
                     self._source.pos_status_list[bin_idx] = "busy"
@@ -148,19 +181,36 @@ class MPSSource(QSource):
             return ret
 
         def _get_successful_pairs(self):
+            r"""
+            Sample the positions that will be successfully entangled in the next round.
+
+            Returns
+            -------
+            tuple[:class:`numpy.ndarray`, :class:`numpy.ndarray`]
+                The bin indices and the trial indices of the successful pairs, sorted by bin index.
+            """
             """
             counter = 0
             for pairs in self._source.pos_status_list:
                 if pairs == "free":
                     counter += 1
             if self._source.ID == 13:
-                qilog.debug("{} free pairs found. Status are {}".format(counter, self._source.pos_status_list))
+                qilog.debug("%d free pairs found. Status are %s", counter, self._source.pos_status_list)
             """
-
-            successful_pairs = []
             rng = self.rng
             if rng is None:
                 rng = get_random_state()
+            if self._vectorized:
+                return self._sample_vectorized(rng)
+            return self._sample_sequential(rng)
+
+        def _sample_vectorized(self, rng):
+            free_bins = np.flatnonzero([status == "free" for status in self._source.pos_status_list])
+            return sample_successful_pairs(rng, free_bins, self._p_left, self._p_right, self._p_mid, self._K)
+
+        def _sample_sequential(self, rng):
+            successful_bins = []
+            successful_trials = []
             for i in range(self._num_positions):
                 if self._source.pos_status_list[i] == "free":
                     trials_left = rng.geometric(self._p_left)
@@ -169,23 +219,26 @@ class MPSSource(QSource):
                         gen_failures = rng.negative_binomial(trials_right, self._p_mid)
                         gen_trials = gen_failures + trials_right
                         if gen_trials <= self._K:
-                            successful_pairs.append((i, gen_trials-1))  # bin_index and trial_index
-            return successful_pairs
+                            successful_bins.append(i)
+                            successful_trials.append(gen_trials-1)
+            return np.array(successful_bins, dtype=int), np.array(successful_trials, dtype=int)
 
         def reset(self):
             self._last_bin_and_trial = (-1, -1)
             self._source.subcomponents["qsource"].output_meta["position"] = None
+            self._source.subcomponents["qsource"].output_meta["bell_pair"] = None
             for i, _ in enumerate(self._source.pos_status_list):
                 self._source.pos_status_list[i] = "free"
-            self._successful_pairs = self._get_successful_pairs()
+            self._set_successful_pairs()
 
-    def __init__(self, name, source, t_link, p_left, p_right=None, p_mid=1., num_positions=1, t_clock=1, **kwargs):
+    def __init__(self, name, source, t_link, p_left, p_right=None, p_mid=1., num_positions=1, t_clock=1,
+                 vectorized=True, **kwargs):
         if p_right is None:
             p_right = p_left
 
         state_sampler = StateSampler([ks.b00], [1.])
         model_params = {"source": source, "p_left": p_left, "p_right": p_right, "num_positions": num_positions,
-                        "p_mid": p_mid, "t_clock": t_clock, "t_link": t_link}
+                        "p_mid": p_mid, "t_clock": t_clock, "t_link": t_link, "vectorized": vectorized}
         timing = self.MPSDelayModel(**model_params)
         super().__init__(name, state_sampler=state_sampler, timing_model=timing, num_ports=2,
                          status=SourceStatus.OFF, **kwargs)
@@ -221,20 +274,24 @@ class MPSSourceNode(Node):
             The clock period of the MS protocols. Defaults to 1. [ns]
         rng : :class:`~numpy.random.RandomState`, optional
             The rng used in the stochastic generation of entangled pairs.
+        vectorized : bool, optional
+            Whether to sample the trials of all positions with vectorized rng calls. Set to `False` to replay
+            experiments run with previous versions seed for seed. Defaults to `True`.
         """
 
-    def __init__(self, name, p_left, p_right, num_positions, p_mid, t_clock, rng=None):
+    def __init__(self, name, p_left, p_right, num_positions, p_mid, t_clock, rng=None, vectorized=True):
         port_names = ["qout0", "qout1", "c0", "c1"]
         super().__init__(name=name, port_names=port_names)
         self.pos_status_list = ["free" for _ in range(num_positions)]
         self.mps_params = {"p_left": p_left, "p_right": p_right, "num_positions": num_positions,
-                           "p_mid": p_mid, "t_clock": t_clock, "rng": rng}
+                           "p_mid": p_mid, "t_clock": t_clock, "rng": rng, "vectorized": vectorized}
         protocol = MPSSourceProtocol(node=self)
         protocol.start()
 
     def init_source(self, t_link):
         qsource = MPSSource(f"{self.name}_inner_src", self, **self.mps_params, t_link=t_link)
         qsource.output_meta["position"] = None  # must be initialized
+        qsource.output_meta["bell_pair"] = None
         qsource.output_meta["time_sent"] = ns.sim_time()
         self.add_subcomponent(qsource, name="qsource")
         qsource.ports["qout0"].forward_output(self.ports["qout0"])
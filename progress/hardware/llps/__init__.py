@@ -1,10 +1,12 @@
 """
 This package contains an abstract class for Link Layer Protocols that can be instantiated to create custom protocols.
 It also provides a ready-to-use protocol called :class:`~progress.llps.mps.MPSProtocol`
-which is the default protocol used by quantum network devices.
+which is the default protocol used by quantum network devices, and an analytic
+:class:`~progress.hardware.llps.ideal.IdealLinkProtocol` for large parameter sweeps.
 """
 
 from progress.hardware.llps.llp import LinkProtocol
 from progress.hardware.llps.mps import MPSProtocol
+from progress.hardware.llps.ideal import IdealLink, IdealLinkProtocol
 
-__all__ = ["LinkProtocol", "MPSProtocol"]
+__all__ = ["LinkProtocol", "MPSProtocol", "IdealLink", "IdealLinkProtocol"]
@@ -0,0 +1,281 @@
+"""
+This module implements an analytic link layer protocol for links whose physics can be summarized by a generation
+rate. The link samples the same stochastic process as the Midpoint source (MPS) protocol, but it skips the
+entangling source, the quantum channels and the port hops: a ready-to-use Bell pair is placed directly in the quantum
+memories of the two ends at the time it would have been heralded.
+
+It can be used as a drop-in replacement of :class:`~progress.hardware.mps_connection.MPSConnection` and
+:class:`~progress.hardware.llps.mps.MPSProtocol` in topology builders. An :class:`IdealLink` is shared by the two
+:class:`IdealLinkProtocol` instances running at its ends, and no connection needs to be added to the network.
+"""
+
+import math
+
+import netsquid as ns
+import netsquid.qubits.ketstates as ks
+import numpy as np
+from netsquid.protocols import Protocol
+from netsquid.util.simtools import get_random_state
+
+import progress.progress_logging as qilog
+from progress.hardware.bell_diagonal import BellDiagonalPair
+from progress.hardware.llps.llp import LinkProtocol
+from progress.hardware.llps.mps import sample_successful_pairs
+
+__all__ = ["IdealLink", "IdealLinkProtocol"]
+
+
+class IdealLink:
+    r"""
+    An analytic model of a Midpoint source link between two devices. At each round, the link samples which
+    positions are entangled and when, using the same model as
+    :class:`~progress.hardware.ep_source.MPSSourceNode`. Each pair is then delivered to both ends with a single event.
+
+    Parameters
+    ----------
+    name : str
+        The name of this link.
+    length : int or float
+        The total length of the link. [km]
+    p_left : float
+        The probability of successfully latching the emitted qubit on the left with the components on that side.
+    p_right : float, optional
+        The probability of successfully latching the emitted qubit on the right with the components on that side.
+        If ``None``, it is set equal to ``p_left``. Defaults to ``None``.
+    p_mid : float, optional
+        The probability that the midpoint entangled pair source successfully emits a pair at a given clock cycle.
+        Defaults to 1.
+    num_positions : int, optional
+        The number of modes of the repeaters' quantum memories attached to the link. Defaults to 1.
+    t_clock : int or float, optional
+        The clock period of the MS protocols. Defaults to 1. [ns]
+    rng : :class:`~numpy.random.RandomState`, optional
+        The rng used in the stochastic generation of entangled pairs. If `None`, the NetSquid random state is used.
+
+    Notes
+    -----
+    A pair generated at trial `t` of bin `b` in a round starting at time :math:`T` is delivered at
+    :math:`T + (bK + t + 1)t_{clock} + t_{link}/2`, where :math:`t_{link}` is the round-trip time between the ends
+    and the midpoint. The next round starts at :math:`T + NKt_{clock} + t_{link}`. As in MPS, a position becomes
+    available again only when it has been freed at both ends.
+    """
+
+    def __init__(self, name, length, p_left, p_right=None, p_mid=1., num_positions=1, t_clock=1, rng=None):
+        if p_right is None:
+            p_right = p_left
+        self.name = name
+        self.length = length
+        self._p_left = p_left
+        self._p_right = p_right
+        self._p_mid = p_mid
+        self._num_positions = num_positions
+        self._t_clock = t_clock
+        self._K = math.ceil(3/(min(p_left, p_right)*p_mid))
+        self._t_link = 1e9*length/2e5
+        self._rng = rng
+
+        self._ends = []
+        # for each position, whether it was freed by the first and by the second end
+        self._freed = np.ones((num_positions, 2), dtype=bool)
+        self._source_protocol = IdealLink.IdealLinkSourceProtocol(self, name=f"{name}_src")
+
+    class IdealLinkSourceProtocol(Protocol):
+        r"""
+        The protocol driving the generation rounds of an :class:`~progress.hardware.llps.ideal.IdealLink`.
+        It should only be used inside its parent class.
+        """
+
+        POSITIONS_FREED = "POSITIONS_FREED"
+
+        def __init__(self, link, name=None):
+            super().__init__(name=name)
+            self.link = link
+            self.add_signal(self.POSITIONS_FREED)
+
+        def run(self):
+            link = self.link
+            while True:
+                free_bins = link._get_free_bins()
+                if len(free_bins) == 0:
+                    # no event is scheduled until a position is freed at both ends
+                    yield self.await_signal(self, self.POSITIONS_FREED)
+                    continue
+
+                round_start = ns.sim_time()
+                rng = link._rng
+                if rng is None:
+                    rng = get_random_state()
+                bins, trials = sample_successful_pairs(rng, free_bins, link._p_left, link._p_right, link._p_mid,
+                                                       link._K)
+                for bin_idx, trial_idx in zip(bins, trials):
+                    delay = (bin_idx * link._K + trial_idx + 1) * link._t_clock + link._t_link / 2
+                    yield self.await_timer(end_time=round_start + delay)
+                    link._deliver_pair(int(bin_idx))
+
+                yield self.await_timer(end_time=round_start + link._get_round_time())
+
+    def _get_round_time(self):
+        return self._K * self._num_positions * self._t_clock + self._t_link
+
+    def _get_free_bins(self):
+        return np.flatnonzero(self._freed.all(axis=1))
+
+    def attach(self, protocol):
+        r"""
+        Attach a link protocol to one end of this link. This is done automatically by
+        :class:`~progress.hardware.llps.ideal.IdealLinkProtocol`.
+
+        Parameters
+        ----------
+        protocol : :class:`~progress.hardware.llps.ideal.IdealLinkProtocol`
+            The protocol to attach.
+        """
+        if len(self._ends) == 2:
+            raise ValueError(f"Link {self.name} already has two ends.")
+        self._ends.append(protocol)
+
+    def get_other_end(self, protocol):
+        r"""
+        Get the protocol running at the other end of the link.
+
+        Parameters
+        ----------
+        protocol : :class:`~progress.hardware.llps.ideal.IdealLinkProtocol`
+            The protocol running at one end of the link.
+
+        Returns
+        -------
+        :class:`~progress.hardware.llps.ideal.IdealLinkProtocol` or None
+            The protocol running at the other end. `None` if it has not been attached yet.
+        """
+        for end in self._ends:
+            if end is not protocol:
+                return end
+        return None
+
+    def start(self):
+        r"""
+        Start the generation of entanglement. Called when both ends are running.
+        """
+        if len(self._ends) == 2 and all(end.is_running for end in self._ends) and \
+                not self._source_protocol.is_running:
+            self._source_protocol.start()
+
+    def stop(self):
+        r"""
+        Stop the generation of entanglement. Pairs that are not yet delivered are lost.
+        """
+        self._source_protocol.stop()
+
+    def resume(self):
+        r"""
+        Resume the generation of entanglement after a stop. All positions are considered released. If the
+        generation is already active, it has no effect.
+        """
+        if self._source_protocol.is_running:
+            return
+        self._freed[:] = True
+        self.start()
+
+    def free(self, protocol, idx):
+        r"""
+        Free a position at one end of the link.
+
+        Parameters
+        ----------
+        protocol : :class:`~progress.hardware.llps.ideal.IdealLinkProtocol`
+            The protocol at the end that frees the position.
+        idx : int
+            The position to free.
+        """
+        self._freed[idx, self._ends.index(protocol)] = True
+        if self._freed[idx].all() and self._source_protocol.is_running:
+            self._source_protocol.send_signal(self._source_protocol.POSITIONS_FREED)
+
+    def _deliver_pair(self, idx):
+        self._freed[idx] = False
+        qubits = BellDiagonalPair().halves
+        if not all(end.node.qstate_backend == "bell_diagonal" for end in self._ends):
+            # ends with the NetSquid backend get NetSquid qubits, the other ones keep the Bell-diagonal halves
+            ns_qubits = ns.qubits.create_qubits(2)
+            ns.qubits.assign_qstate(ns_qubits, ks.b00)
+            qubits = [qubit if end.node.qstate_backend == "bell_diagonal" else ns_qubit
+                      for end, qubit, ns_qubit in zip(self._ends, qubits, ns_qubits)]
+        for end, qubit in zip(self._ends, qubits):
+            end.receive_qubit(qubit, idx)
+
+
+class IdealLinkProtocol(LinkProtocol):
+    r"""
+    The link layer protocol running at one end of an :class:`~progress.hardware.llps.ideal.IdealLink`.
+
+    Parameters
+    ----------
+    num_positions : int
+        The number of qubits available for the link layer protocol.
+    qnic : str
+        The port name on which the protocol will run.
+    link : :class:`~progress.hardware.llps.ideal.IdealLink`
+        The link this protocol is attached to.
+    node : :class:`~progress.hardware.qhardware.QHardware` or None, optional
+        The node on which this protocols will run. If `None`, it must be set before starting the protocol.
+    other_node_info : tuple or None, optional
+        A two-elements tuple where the first is the neighbor node id (int), and the second is the name of its attached
+        interface (str). If `None`, it is taken from the protocol at the other end of the link when started.
+    name : str, optional
+        The name of the instance, defaults to the class name.
+    """
+
+    def __init__(self, num_positions, qnic, link, node=None, other_node_info=None, name=None):
+        super().__init__(num_positions, qnic, node, other_node_info, name)
+        self.link = link
+        link.attach(self)
+
+    def start(self):
+        """Start this protocol on a specified link of this node.
+
+        References
+        ----------
+
+        See :meth:`netsquid.protocols.Protocol.start` for more information.
+        """
+        self._reset_positions()
+        super().start()
+        if self.other_node_info is None:
+            other_end = self.link.get_other_end(self)
+            if other_end is not None and other_end.node is not None:
+                self.other_node_info = (other_end.node.supercomponent.device_id, other_end.interface)
+        self.link.start()
+        qilog.info("Ideal link protocol on interface %s has started.", self._qnic,
+                   repeater_id=self.node.supercomponent.device_id, protocol=self.name)
+
+    def receive_qubit(self, qubit, idx):
+        r"""
+        Store a qubit delivered by the link and signal the new entanglement.
+
+        Parameters
+        ----------
+        qubit : :class:`netsquid.qubits.qubit.Qubit`
+            The entangled qubit.
+        idx : int
+            The position of the qubit on this interface.
+        """
+        if not self._allocate_position(idx):
+            qilog.warning("Repeater tried to allocate non-empty position %d.", idx,
+                          repeater_id=self.node.supercomponent.device_id, protocol=self.name)
+        self.node.put_entangled_qubit(qubit, self._qnic, idx)
+        self.deliver_new_socket(idx=idx)
+
+    def free(self, request):
+        idx = request.idx
+        if not self._release_position(idx):
+            qilog.warning("Repeater tried to deallocate empty position %d.", idx,
+                          repeater_id=self.node.supercomponent.device_id, protocol=self.name)
+        self.link.free(self, idx)
+
+    def _handle_stop_generation(self, _):
+        self.link.stop()
+
+    def _handle_resume_generation(self, _):
+        self._reset_positions()
+        self.link.resume()
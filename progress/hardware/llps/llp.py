@@ -13,6 +13,7 @@ from netsquid.protocols.serviceprotocol import ServiceProtocol
 
 __all__ = ['LinkProtocol']
 
+from progress import tracing
 from progress.sockets import Socket
 
 
@@ -53,6 +54,10 @@ class LinkProtocol(ABC, ServiceProtocol):
     3. :class:`~progress.mps.protocols.mps_protocol.req_resume_generation`
         Resume the mid-point entangling source. All allocated qubits are considered released. If already active,
         it has no effect
+
+    Implementations should keep track of allocated positions through :meth:`_allocate_position`,
+    :meth:`_release_position` and :meth:`_reset_positions`, so that :meth:`occupancy` and
+    :meth:`free_positions` can be answered in constant time.
     """
 
     req_free = namedtuple("req_free", ["idx"])
@@ -94,6 +99,10 @@ class LinkProtocol(ABC, ServiceProtocol):
 
         self.other_node_info = other_node_info
 
+        self._qubits_status = None
+        self._num_allocated = 0
+        self._reset_positions()
+
     @property
     def interface(self):
         r"""
@@ -101,6 +110,75 @@ class LinkProtocol(ABC, ServiceProtocol):
         """
         return self._qnic
 
+    def occupancy(self):
+        r"""
+        Get the number of qubits currently allocated by this link protocol.
+
+        Returns
+        -------
+        int
+            The number of allocated qubits.
+        """
+        return self._num_allocated
+
+    def free_positions(self):
+        r"""
+        Get the number of qubits that are available for new entanglements.
+
+        Returns
+        -------
+        int
+            The number of free qubits.
+        """
+        return self._num_positions - self._num_allocated
+
+    def _reset_positions(self):
+        r"""
+        Mark all the positions as free.
+        """
+        self._qubits_status = [None] * self._num_positions
+        self._num_allocated = 0
+
+    def _allocate_position(self, idx):
+        r"""
+        Mark a position as allocated, storing the allocation time.
+
+        Parameters
+        ----------
+        idx : int
+            The index of the position to allocate.
+
+        Returns
+        -------
+        bool
+            `False` if the position was already allocated, `True` otherwise.
+        """
+        was_free = self._qubits_status[idx] is None
+        if was_free:
+            self._num_allocated += 1
+        self._qubits_status[idx] = ns.sim_time()
+        return was_free
+
+    def _release_position(self, idx):
+        r"""
+        Mark a position as free.
+
+        Parameters
+        ----------
+        idx : int
+            The index of the position to release.
+
+        Returns
+        -------
+        bool
+            `False` if the position was already free, `True` otherwise.
+        """
+        if self._qubits_status[idx] is None:
+            return False
+        self._num_allocated -= 1
+        self._qubits_status[idx] = None
+        return True
+
     @abstractmethod
     def _handle_stop_generation(self, request):
         r"""
@@ -137,6 +215,8 @@ class LinkProtocol(ABC, ServiceProtocol):
         # To describe the entanglement, we directly use two sockets
         local_end = Socket(self.node.supercomponent.device_id, self._qnic, idx)
         other_end = Socket(self.other_node_info[0], self.other_node_info[1], idx)
+        tracing.record(tracing.TraceEvent.ENTANGLEMENT_DELIVERED, device=local_end.node, socket=local_end,
+                       other_end=other_end)
         self.node.ports["new_entanglements"].tx_output(ns.components.Message(items=[local_end, other_end]))
 
 
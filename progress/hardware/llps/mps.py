@@ -5,12 +5,13 @@ It also provides a :class:`~progress.mps.protocols.mps_protocol.MPSSourceProtoco
 in the middle of the physical link between the two nodes.
 """
 
+import numpy as np
 from netsquid.components import Message, SourceStatus
 from netsquid.protocols.nodeprotocols import NodeProtocol
 import progress.progress_logging as qilog
 import netsquid as ns
 
-__all__ = ["MPSProtocol", "MPSSourceProtocol"]
+__all__ = ["MPSProtocol", "MPSSourceProtocol", "sample_successful_pairs"]
 
 from progress.hardware.llps.llp import LinkProtocol
 
@@ -40,8 +41,6 @@ class MPSProtocol(LinkProtocol):
     """
 
     def __init__(self, num_positions, qnic, node=None, other_node_info=None, name=None):
-        self._qubits_status = None
-
         self._alert_shown = False
 
         self._started_message_displayed = False
@@ -56,35 +55,30 @@ class MPSProtocol(LinkProtocol):
 
         See :meth:`netsquid.protocols.Protocol.start` for more information.
         """
-        self._qubits_status = [None for _ in range(self._num_positions)]
+        self._reset_positions()
         super().start()
 
     def _allocate_qubit(self, idx):
         if self._qubits_status[idx] is not None:
-            qilog.warning(f"Repeater tried to allocate non-empty position {idx}.",
+            qilog.warning("Repeater tried to allocate non-empty position %d.", idx,
                           repeater_id=self.node.supercomponent.device_id, protocol=self.name)
 
-        # count how many qubits are allocated
-        allocated = 0
-        for q in self._qubits_status:
-            if q is not None:
-                allocated += 1
+        allocated = self._num_allocated
         if allocated == self._num_positions:
-            qilog.warning(f"Attention. All qubits on interface {self._qnic} are allocated.",
+            qilog.warning("Attention. All qubits on interface %s are allocated.", self._qnic,
                           repeater_id=self.node.supercomponent.device_id, protocol=self.name)
             return None
         elif not self._alert_shown and allocated > 4*self._num_positions/5:
-            qilog.warning(f"More than 4/5 of the qubits on interface {self._qnic} are allocated. Possible"
-                          f" Bottleneck.",
+            qilog.warning("More than 4/5 of the qubits on interface %s are allocated. Possible Bottleneck.",
+                          self._qnic,
                           repeater_id=self.node.supercomponent.device_id, protocol=self.name)
             self._alert_shown = True
-        self._qubits_status[idx] = ns.sim_time()
+        self._allocate_position(idx)
 
     def _deallocate_qubit(self, idx):
-        if self._qubits_status[idx] is None:
-            qilog.warning(f"Repeater tried to deallocate empty position {idx}.",
+        if not self._release_position(idx):
+            qilog.warning("Repeater tried to deallocate empty position %d.", idx,
                           repeater_id=self.node.supercomponent.device_id, protocol=self.name)
-        self._qubits_status[idx] = None
 
     def run(self):
         r"""
@@ -104,7 +98,7 @@ class MPSProtocol(LinkProtocol):
             wait_timer = self.await_timer(duration=100000)
             ev_expr = yield wait_msg | wait_timer
             if ev_expr.first_term.value:
-                qilog.info(f"MPS Protocol on interface {self._qnic} has started.",
+                qilog.info("MPS Protocol on interface %s has started.", self._qnic,
                            repeater_id=self.node.supercomponent.device_id, protocol=self.name)
                 self._handle_incoming_qubit(ev_expr.first_term)
                 break
@@ -154,7 +148,10 @@ class MPSProtocol(LinkProtocol):
                 return
 
             self._allocate_qubit(idx)
-            self.node.qmemory.put(qubit, self.node.map_info_to_qubit(self._qnic, idx))
+            if self.node.qstate_backend == "bell_diagonal":
+                # the source attaches the same Bell-diagonal pair to both halves
+                qubit = msg.meta["bell_pair"].claim_half()
+            self.node.put_entangled_qubit(qubit, self._qnic, idx)
 
             # we create a socket for the qubit and we deliver to the stack engine:
             self.deliver_new_socket(idx=idx)
@@ -178,7 +175,7 @@ class MPSProtocol(LinkProtocol):
 
     def _handle_resume_generation(self, _):
         msg = ResumeGenerationMessage()
-        self._qubits_status = [None for _ in range(self._num_positions)]
+        self._reset_positions()
         self.node.ports[self._qnic].tx_output(msg)
 
 
@@ -317,6 +314,50 @@ class InitMPSMessage(Message):
         super().__init__(items=[ns.sim_time()], header=self.header)
 
 
+def sample_successful_pairs(rng, free_bins, p_left, p_right, p_mid, num_trials):
+    r"""
+    Sample which positions are successfully entangled in a round of the MPS protocol. For each free position, the
+    numbers of trials needed to latch a photon on the left and on the right are geometric. The position is entangled
+    only if both sides latch at the same trial and the midpoint source emits a pair within the `num_trials` trials of
+    the bin. All positions are sampled with a few vectorized calls to `rng`.
+
+    Parameters
+    ----------
+    rng : :class:`~numpy.random.RandomState`
+        The rng used for sampling.
+    free_bins : :class:`numpy.ndarray`
+        The indices of the free positions, sorted.
+    p_left : float
+        The probability of successfully latching the emitted qubit on the left.
+    p_right : float
+        The probability of successfully latching the emitted qubit on the right.
+    p_mid : float
+        The probability that the midpoint source successfully emits a pair at a given clock cycle.
+    num_trials : int
+        The number of trials (clock cycles) in each bin.
+
+    Returns
+    -------
+    tuple[:class:`numpy.ndarray`, :class:`numpy.ndarray`]
+        The bin indices and the trial indices of the successful pairs, sorted by bin index.
+    """
+    free_bins = np.asarray(free_bins, dtype=int)
+    if len(free_bins) == 0:
+        return free_bins, free_bins
+
+    trials_left = rng.geometric(p_left, size=len(free_bins))
+    trials_right = rng.geometric(p_right, size=len(free_bins))
+    latched = trials_left == trials_right
+    free_bins = free_bins[latched]
+    trials_right = trials_right[latched]
+    if len(free_bins) == 0:
+        return free_bins, trials_right
+
+    gen_trials = rng.negative_binomial(trials_right, p_mid) + trials_right
+    in_round = gen_trials <= num_trials
+    return free_bins[in_round], gen_trials[in_round] - 1  # bin_index and trial_index
+
+
 # parameters set to comply with simulations in https://arxiv.org/abs/1910.08227v2
 optimistic_parameters_v1 = {"p_mid": 1, "t_clock": 10, "N_value": 100, "p_photon": 0.9, "p_bsa": 0.53}
 optimistic_parameters_v2 = {"p_mid": 0.5, "t_clock": 10, "N_value": 100, "p_photon": 0.9, "p_bsa": 0.53}
@@ -39,8 +39,11 @@ class MPSConnection(Connection):
         The number of modes of the repeaters' quantum memories attached to the link. Defaults to 1.
     t_clock : int or float, optional
         The clock period of the MS protocols. Defaults to 1. [ns]
+    vectorized : bool, optional
+        Whether the source samples the trials of all positions with vectorized rng calls. Set to `False` to replay
+        experiments run with previous versions seed for seed. Defaults to `True`.
     """
-    def __init__(self, name, length, p_left, p_right=None, p_mid=1., num_positions=1, t_clock=1):
+    def __init__(self, name, length, p_left, p_right=None, p_mid=1., num_positions=1, t_clock=1, vectorized=True):
         super().__init__(name)
 
         models = {"delay_model": FibreDelayModel()}
@@ -51,7 +54,8 @@ class MPSConnection(Connection):
         cchannel_a = ClassicalChannel("CChannelA", length=0, models=models)
         cchannel_b = ClassicalChannel("CChannelB", length=0, models=models)
 
-        qsource = MPSSourceNode(f"{name}_src", p_left, p_right, num_positions, p_mid, t_clock)
+        qsource = MPSSourceNode(f"{name}_src", p_left, p_right, num_positions, p_mid, t_clock,
+                                vectorized=vectorized)
         self.add_subcomponent(qchannel_a)
         self.add_subcomponent(qchannel_b)
         self.add_subcomponent(cchannel_a)
@@ -2,15 +2,20 @@
 This module implements the quantum hardware (the Physical layer) of a quantum network device.
 """
 
+import heapq
 from collections import namedtuple, deque
 
 import netsquid as ns
 import math
+import numpy as np
 
+from progress.hardware.bell_diagonal import BellDiagonalMemory, BellPairHalf
 from progress.hardware.llps.llp import LinkProtocol
+from progress.sockets import get_pauli_corrections
 import progress.progress_logging as log
 
-__all__ = ['get_processor', 'QHardware', 'QuantumOperationsService']
+__all__ = ['get_processor', 'QHardware', 'QuantumOperationsService', 'BellDiagonalOperationsService',
+           'FidelityEstimator']
 
 INSTR_Rx = ns.components.IGate("Rx_gate", ns.qubits.operators.create_rotation_op(math.pi / 2, (1, 0, 0)))
 """
@@ -88,7 +93,7 @@ def get_processor(num_positions, coherence_time=None, one_qbit_noise=None, two_q
                                                phys_instructions=phys_instructions)
     else:
         # Used to apply an initial imperfection to the qubits (F_0 =~ 0.98)
-        models = {'qin_noise_model': ns.components.DepolarNoiseModel(depolar_rate=0.03,
+        models = {'qin_noise_model': ns.components.DepolarNoiseModel(depolar_rate=BellDiagonalMemory.INPUT_P_ERR,
                                                                      time_independent=True)}
 
         mem_noise_model = ns.components.DephaseNoiseModel(dephase_rate=-math.log(0.98)*1e9 / coherence_time)
@@ -119,6 +124,19 @@ class QHardware(ns.nodes.Node):
         The parameters of the quantum processor of this device. See :func:`~progress.hardware.qhardware.get_processor`
         for details. If `None`, a default processor is created. Defaults to `None`. The field `num_positions` can be
         omitted, as it is set to `num_qnics * num_qbits_qnic`.
+    qstate_backend : str, optional
+        How the quantum state of the stored qubits is simulated. With "netsquid", qubits are stored in a NetSquid
+        quantum processor and operations run as quantum programs. With "bell_diagonal", each pair is tracked as four
+        Bell-diagonal coefficients and operations are applied in closed form
+        (see :mod:`~progress.hardware.bell_diagonal`). Custom quantum circuits are not supported by the latter.
+        Defaults to "netsquid".
+    pipelined : bool, optional
+        Whether the quantum operations service overlaps operations on disjoint memory positions. Only supported by
+        the "bell_diagonal" backend, see :class:`~progress.hardware.qhardware.BellDiagonalOperationsService`.
+        Defaults to `False`.
+    fidelity_sampling_period : int, optional
+        The sampling period of the fidelity estimator of this device.
+        See :class:`~progress.hardware.qhardware.FidelityEstimator`. Defaults to 1.
 
     Attributes
     ----------
@@ -128,8 +146,12 @@ class QHardware(ns.nodes.Node):
         The number of QNICS of this device.
     num_qbits_qnic : int
         The number of physical qubits assigned to each QNIC of this device.
-    qmemory : :class:`netsquid.components.qprocessor.QuantumProcessor`
-        The quantum processor of this device.
+    qmemory : :class:`netsquid.components.qprocessor.QuantumProcessor` or None
+        The quantum processor of this device. `None` with the "bell_diagonal" backend.
+    bell_memory : :class:`~progress.hardware.bell_diagonal.BellDiagonalMemory` or None
+        The Bell-diagonal memory of this device. `None` with the "netsquid" backend.
+    fidelity_estimator : :class:`~progress.hardware.qhardware.FidelityEstimator`
+        The service used to read the fidelity of stored pairs (simulation cheat, for statistics only).
 
     Notes
     -----
@@ -142,7 +164,15 @@ class QHardware(ns.nodes.Node):
           that a new entangled qubit is available.
     """
     
-    def __init__(self, name, num_qnics=2, num_qbits_qnic=1, qproc_params=None):
+    QSTATE_BACKENDS = ("netsquid", "bell_diagonal")
+    """
+    The supported quantum state backends.
+    """
+
+    def __init__(self, name, num_qnics=2, num_qbits_qnic=1, qproc_params=None, qstate_backend="netsquid",
+                 pipelined=False, fidelity_sampling_period=1):
+        if qstate_backend not in self.QSTATE_BACKENDS:
+            raise ValueError(f"Quantum state backend {qstate_backend} not supported.")
         ports = ["qnic{}".format(i) for i in range(num_qnics)] + ["q_ops", "new_entanglements"]
         super().__init__(name=name, port_names=ports)
         self.qproc_params = qproc_params
@@ -160,11 +190,62 @@ class QHardware(ns.nodes.Node):
 
         qproc_params['num_positions'] = num_qnics * num_qbits_qnic
 
-        self.qmemory = get_processor(**qproc_params)
-
-        self._qops_service = QuantumOperationsService(name="qops_service", node=self)
+        self.qstate_backend = qstate_backend
+        self.bell_memory = None
+        if qstate_backend == "bell_diagonal":
+            self.bell_memory = BellDiagonalMemory(**qproc_params)
+            self._qops_service = BellDiagonalOperationsService(name="qops_service", node=self, pipelined=pipelined)
+        else:
+            self.qmemory = get_processor(**qproc_params)
+            self._qops_service = QuantumOperationsService(name="qops_service", node=self, pipelined=pipelined)
         self._qops_service.start()
 
+        self.fidelity_estimator = FidelityEstimator(self, sampling_period=fidelity_sampling_period)
+
+    def get_fidelity(self, qnic, idx, bell_state):
+        r"""
+        Get the (squared) fidelity of the pair stored on a qubit with a reference Bell state.
+        See :meth:`~progress.hardware.qhardware.FidelityEstimator.estimate`.
+
+        Parameters
+        ----------
+        qnic : int or str
+            The qnic to which the qubit is assigned.
+        idx : int
+            The index of the qubit relative to the qnic.
+        bell_state : int
+            The index of the reference Bell state.
+
+        Returns
+        -------
+        float or None
+            The fidelity, or `None` if the estimation was skipped because of sampling.
+        """
+        return self.fidelity_estimator.estimate(qnic, idx, bell_state)
+
+    def put_entangled_qubit(self, qubit, qnic, idx):
+        r"""
+        Store a newly entangled qubit in the memory. Link layer protocols should use this method so that the qubit is
+        stored in the representation of the selected quantum state backend.
+
+        Parameters
+        ----------
+        qubit : :class:`netsquid.qubits.qubit.Qubit` or :class:`~progress.hardware.bell_diagonal.BellPairHalf`
+            The qubit to store. The "bell_diagonal" backend only accepts halves of Bell-diagonal pairs, and the
+            "netsquid" backend only accepts NetSquid qubits.
+        qnic : int or str
+            The qnic to which the qubit is assigned.
+        idx : int
+            The index of the qubit relative to the qnic.
+        """
+        position = self.map_info_to_qubit(qnic, idx)
+        if self.bell_memory is not None:
+            if not isinstance(qubit, BellPairHalf):
+                raise ValueError("The bell_diagonal backend only stores halves of Bell-diagonal pairs.")
+            self.bell_memory.put(qubit, position)
+        else:
+            self.qmemory.put(qubit, position)
+
     def put_qop(self, request):
         """
         Submit a quantum operation request. The response is sent through the port "q_ops" of the node.
@@ -227,6 +308,79 @@ class QHardware(ns.nodes.Node):
             raise ValueError("The qnic must be either an integer or a string.")
 
 
+class FidelityEstimator:
+    r"""
+    Reads the fidelity of the pairs stored in a :class:`~progress.hardware.qhardware.QHardware` directly from their
+    state representation. With the "netsquid" backend, the fidelity is computed from the density matrix of the pair
+    and the projectors on the four Bell states, which are computed once and shared by all estimators. With the
+    "bell_diagonal" backend, the fidelity is read in constant time.
+
+    Parameters
+    ----------
+    qhardware : :class:`~progress.hardware.qhardware.QHardware`
+        The quantum hardware whose pairs are measured.
+    sampling_period : int, optional
+        Only one every `sampling_period` estimation requests is served, the others are skipped. Defaults to 1.
+
+    Attributes
+    ----------
+    sampling_period : int
+        Only one every `sampling_period` estimation requests is served, the others are skipped.
+    """
+
+    _bell_projectors = None
+
+    def __init__(self, qhardware, sampling_period=1):
+        if sampling_period < 1:
+            raise ValueError("The sampling period must be a positive integer.")
+        self.qhardware = qhardware
+        self.sampling_period = sampling_period
+        self._num_requests = 0
+
+    @classmethod
+    def _get_bell_projectors(cls):
+        if cls._bell_projectors is None:
+            kets = [ns.qubits.ketstates.b00, ns.qubits.ketstates.b01, ns.qubits.ketstates.b10,
+                    ns.qubits.ketstates.b11]
+            cls._bell_projectors = [np.outer(ket, ket.conj()).ravel() for ket in kets]
+        return cls._bell_projectors
+
+    def estimate(self, qnic, idx, bell_state):
+        r"""
+        Get the (squared) fidelity of the pair stored on a qubit with a reference Bell state. Pending memory noise is
+        applied before reading.
+
+        Parameters
+        ----------
+        qnic : int or str
+            The qnic to which the qubit is assigned.
+        idx : int
+            The index of the qubit relative to the qnic.
+        bell_state : int
+            The index of the reference Bell state.
+
+        Returns
+        -------
+        float or None
+            The fidelity, or `None` if the estimation was skipped because of sampling.
+        """
+        self._num_requests += 1
+        if (self._num_requests - 1) % self.sampling_period != 0:
+            return None
+        if bell_state not in (0, 1, 2, 3):
+            raise ValueError(f"Unknown Bell state {bell_state}.")
+
+        position = self.qhardware.map_info_to_qubit(qnic, idx)
+        if self.qhardware.bell_memory is not None:
+            return self.qhardware.bell_memory.fidelity(position, bell_state)
+
+        qubits = self.qhardware.qmemory.peek(position)[0].qstate.qubits
+        if len(qubits) != 2:
+            return 0.
+        dm = ns.qubits.reduced_dm(qubits)
+        return float(np.real(np.vdot(self._get_bell_projectors()[bell_state], dm.ravel())))
+
+
 class QuantumOperationsService(ns.protocols.ServiceProtocol):
     r"""
     This protocol is used to request quantum operations to the quantum processor.
@@ -238,6 +392,15 @@ class QuantumOperationsService(ns.protocols.ServiceProtocol):
         The component to which the service is attached.
     name : str or None, optional
         The name of the service, for labelling purposes. Defaults to `None`.
+    pipelined : bool, optional
+        Whether operations on disjoint memory positions may be in flight at the same time. A NetSquid quantum
+        processor executes one program at a time, so this service raises a `ValueError` if `True`. Subclasses
+        that set :attr:`SUPPORTS_PIPELINING` may overlap operations. Defaults to `False`.
+    """
+
+    SUPPORTS_PIPELINING = False
+    """
+    Whether the service can run in pipelined mode.
     """
 
     req_free = namedtuple("req_free", ["qnic", "idx"])
@@ -261,6 +424,17 @@ class QuantumOperationsService(ns.protocols.ServiceProtocol):
         idx2 (int): The index of the second qubit relative to the qnic.
     """
 
+    req_swap_batch = namedtuple("req_swap_batch", ["id", "pairs"])
+    """
+    Request to perform entanglement swapping on several pairs of qubits in the quantum processor, with a single
+    program execution. The response is the list of the Bell measurement outcomes, in the order of the pairs.
+
+    Parameters:
+        id (int): The id of the request.
+        pairs (list of tuples): A list of tuples `(qnic1, idx1, qnic2, idx2)`, each one identifying the two qubits
+            of a swap.
+    """
+
     req_dejmps = namedtuple("req_purify", ["id", "qnic1", "idx1", "qnic2", "idx2", "role"])
     """
     Request to perform DEJMPS distillation on two qubits in the quantum processor. The first one is the one distilled,
@@ -356,7 +530,8 @@ class QuantumOperationsService(ns.protocols.ServiceProtocol):
                     yield from gen
 
     class CorrectProgram(ns.components.QuantumProgram):
-        """Quantum processor program that applies corrections to restore the |beta00> state."""
+        """Quantum processor program that applies corrections to restore the |beta00> state.
+        The service keeps one instance for each correction pattern, so instances are not reconfigured while in use."""
         default_num_qubits = 1
         curr_state = 0
 
@@ -365,9 +540,10 @@ class QuantumOperationsService(ns.protocols.ServiceProtocol):
 
         def program(self):
             q1, = self.get_qubit_indices(1)
-            if self.curr_state == 1 or self.curr_state == 3:
+            x_corr, z_corr = get_pauli_corrections(self.curr_state)
+            if x_corr:
                 self.apply(ns.components.instructions.INSTR_X, q1)
-            if self.curr_state == 2 or self.curr_state == 3:
+            if z_corr:
                 self.apply(ns.components.instructions.INSTR_Z, q1)
             yield self.run()
 
@@ -385,7 +561,7 @@ class QuantumOperationsService(ns.protocols.ServiceProtocol):
 
         """
         # DEBUG
-        log.info("Freeing qubit on qnic %s, index %d" % (qnic, idx),
+        log.info("Freeing qubit on qnic %s, index %d", qnic, idx,
                  repeater_id=self.node.supercomponent.device_id,
                  protocol="QHardware")
         """
@@ -423,8 +599,8 @@ class QuantumOperationsService(ns.protocols.ServiceProtocol):
     def _handle_correct(self, request):
         cur_state = request.cur_state
         positions = [self.node.map_info_to_qubit(request.qnic1, request.idx1)]
-        self.correct_program.set_corrections(cur_state)
-        self.qproc.execute_program(program=self.correct_program, qubit_mapping=positions, error_on_fail=True)
+        prog = self._get_program("correct", cur_state)
+        self.qproc.execute_program(program=prog, qubit_mapping=positions, error_on_fail=True)
         yield self.await_program(processor=self.qproc)
 
         self.send_response('Done', name=request.id)
@@ -456,14 +632,9 @@ class QuantumOperationsService(ns.protocols.ServiceProtocol):
         Handle a DEJMPS distillation request. It automatically frees measured qubit at the end.
         """
         role = request.role
-        if role == 'A':
-            # pi/2 rotation
-            prog = self._setup_dejmps_program(conj_rotation=False)
-        elif role == 'B':
-            # -pi/2 rotation
-            prog = self._setup_dejmps_program(conj_rotation=True)
-        else:
+        if role not in ('A', 'B'):
             raise ValueError("The role must be either 'A' or 'B'.")
+        prog = self._get_program("dejmps", role)
         positions = [self.node.map_info_to_qubit(qnic, idx)
                      for qnic, idx in [(request.qnic1, request.idx1), (request.qnic2, request.idx2)]]
         self.qproc.execute_program(program=prog, qubit_mapping=positions, error_on_fail=True)
@@ -491,6 +662,87 @@ class QuantumOperationsService(ns.protocols.ServiceProtocol):
 
         self.send_response(bell_result, name=request.id)
 
+    def _get_batched_swap_program(self, num_pairs):
+        r"""
+        Get the quantum program measuring `num_pairs` pairs of qubits in the Bell basis in parallel. Programs are
+        built once for each number of pairs and then reused.
+
+        Parameters
+        ----------
+        num_pairs : int
+            The number of pairs to swap.
+
+        Returns
+        -------
+        :class:`~netsquid.components.qprogram.QuantumProgram`
+            The program. The outcome of the i-th pair is stored with output key "m{i}".
+        """
+        return self._get_program("swap_batch", num_pairs)
+
+    def _get_program(self, operation, variant):
+        r"""
+        Get the pre-built quantum program for an operation. Programs are built the first time they are requested
+        and never modified afterwards, so the same instance can be executed again as soon as the previous
+        execution has returned its output.
+
+        Parameters
+        ----------
+        operation : str
+            The operation. One of "correct", "dejmps" and "swap_batch".
+        variant : int or str
+            The correction pattern (the current Bell state index) for "correct", the role ('A' or 'B') for
+            "dejmps" and the number of pairs for "swap_batch".
+
+        Returns
+        -------
+        :class:`~netsquid.components.qprogram.QuantumProgram`
+            The program.
+        """
+        key = (operation, variant)
+        prog = self._program_cache.get(key)
+        if prog is not None:
+            return prog
+        if operation == "correct":
+            prog = self.CorrectProgram()
+            prog.set_corrections(variant)
+        elif operation == "dejmps":
+            # role 'A' applies the pi/2 rotation, role 'B' the -pi/2 one
+            prog = self._setup_dejmps_program(conj_rotation=(variant == 'B'))
+        elif operation == "swap_batch":
+            prog = ns.components.QuantumProgram(num_qubits=2 * variant, parallel=True)
+            qubits = prog.get_qubit_indices(num_qubits=2 * variant)
+            for i in range(variant):
+                prog.apply(ns.components.instructions.INSTR_MEASURE_BELL, [qubits[2 * i], qubits[2 * i + 1]],
+                           output_key=f"m{i}", inplace=False)
+        else:
+            raise ValueError(f"Unknown operation {operation}.")
+        self._program_cache[key] = prog
+        return prog
+
+    def _handle_swap_batch(self, request):
+        r"""
+        Handle a batched entanglement swapping request. All the swapped qubits are freed at the end.
+        """
+        if len(request.pairs) == 0:
+            self.send_response([], name=request.id)
+            return
+        positions = []
+        for qnic1, idx1, qnic2, idx2 in request.pairs:
+            positions.append(self.node.map_info_to_qubit(qnic1, idx1))
+            positions.append(self.node.map_info_to_qubit(qnic2, idx2))
+        prog = self._get_batched_swap_program(len(request.pairs))
+        self.qproc.execute_program(program=prog, qubit_mapping=positions, error_on_fail=True)
+        yield self.await_program(processor=self.qproc)
+
+        bell_results = [prog.output[f"m{i}"][0] for i in range(len(request.pairs))]
+
+        # free the swapped qubits
+        for qnic1, idx1, qnic2, idx2 in request.pairs:
+            self.free(qnic1, idx1)
+            self.free(qnic2, idx2)
+
+        self.send_response(bell_results, name=request.id)
+
     def send_response(self, response, name=None):
         r"""
         Sends a response to the port `q_ops`.
@@ -501,10 +753,13 @@ class QuantumOperationsService(ns.protocols.ServiceProtocol):
         msg = ns.components.Message(header=header, items=[name, response])
         self.node.ports['q_ops'].tx_output(msg)
 
-    def __init__(self, node, name=None):
+    def __init__(self, node, name=None, pipelined=False):
         if name is None:
             name = "Quantum Operations Service"
+        if pipelined and not self.SUPPORTS_PIPELINING:
+            raise ValueError(f"{type(self).__name__} does not support pipelined mode.")
         super().__init__(node=node, name=name)
+        self.pipelined = pipelined
 
         # We will use a queue for requests
         self.queue = deque()
@@ -518,11 +773,187 @@ class QuantumOperationsService(ns.protocols.ServiceProtocol):
         self._es_program = ns.components.QuantumProgram(num_qubits=2)
         q1, q2 = self._es_program.get_qubit_indices(num_qubits=2)
         self._es_program.apply(ns.components.instructions.INSTR_MEASURE_BELL, [q1, q2], output_key="m", inplace=False)
-
-        self.correct_program = self.CorrectProgram()
+        # pre-built programs, by (operation, variant). See _get_program
+        self._program_cache = {}
 
         self.register_request(self.req_free, self._handle_free)
         self.register_request(self.req_qcirc, self._handle_qcirc)
         self.register_request(self.req_correct, self._handle_correct)
         self.register_request(self.req_dejmps, self._handle_dejmps)
         self.register_request(self.req_swap, self._handle_swap)
+        self.register_request(self.req_swap_batch, self._handle_swap_batch)
+
+
+class BellDiagonalOperationsService(QuantumOperationsService):
+    r"""
+    A :class:`~progress.hardware.qhardware.QuantumOperationsService` for the "bell_diagonal" quantum state backend.
+    It supports the same requests and sends the same responses, but operations are applied in closed form on the
+    :class:`~progress.hardware.bell_diagonal.BellDiagonalMemory` of the node. Custom quantum circuits are not
+    supported.
+
+    Parameters
+    ----------
+    node : :class:`~netsquid.node.Node`
+        The component to which the service is attached.
+    name : str or None, optional
+        The name of the service, for labelling purposes. Defaults to `None`.
+    pipelined : bool, optional
+        If `True`, operations on disjoint memory positions overlap in time: each one completes after its own
+        duration, regardless of the operations submitted before it. Requests on positions that are in use wait,
+        in order, for them to be released. Defaults to `False`.
+    """
+
+    SUPPORTS_PIPELINING = True
+
+    def __init__(self, node, name=None, pipelined=False):
+        super().__init__(node=node, name=name, pipelined=pipelined)
+        self.bell_memory = self.node.bell_memory
+
+    def _get_operation(self, request):
+        r"""
+        Describe the operation requested by `request`.
+
+        Returns
+        -------
+        tuple[list[int], int, callable]
+            The memory positions used by the operation, its number of sequential instructions and a function
+            applying it and sending the response.
+        """
+        if isinstance(request, self.req_free):
+            return [self.node.map_info_to_qubit(request.qnic, request.idx)], 0, \
+                lambda: self._handle_free(request)
+        elif isinstance(request, self.req_correct):
+            return [self.node.map_info_to_qubit(request.qnic1, request.idx1)], self.bell_memory.CORRECT_DURATION, \
+                lambda: self._apply_correct(request)
+        elif isinstance(request, self.req_dejmps):
+            positions = [self.node.map_info_to_qubit(request.qnic1, request.idx1),
+                         self.node.map_info_to_qubit(request.qnic2, request.idx2)]
+            return positions, self.bell_memory.DEJMPS_DURATION, lambda: self._apply_dejmps(request)
+        elif isinstance(request, self.req_swap):
+            positions = [self.node.map_info_to_qubit(request.qnic1, request.idx1),
+                         self.node.map_info_to_qubit(request.qnic2, request.idx2)]
+            return positions, self.bell_memory.SWAP_DURATION, lambda: self._apply_swap(request)
+        elif isinstance(request, self.req_swap_batch):
+            positions = []
+            for qnic1, idx1, qnic2, idx2 in request.pairs:
+                positions.append(self.node.map_info_to_qubit(qnic1, idx1))
+                positions.append(self.node.map_info_to_qubit(qnic2, idx2))
+            # the Bell measurements of a batch run in parallel
+            return positions, self.bell_memory.SWAP_DURATION, lambda: self._apply_swap_batch(request)
+        raise ValueError("Custom quantum circuits are not supported by the Bell-diagonal backend.")
+
+    def _await_instructions(self, num_instructions):
+        duration = num_instructions * self.bell_memory.instr_duration
+        if duration > 0:
+            yield self.await_timer(duration=duration)
+
+    def free(self, qnic, idx):
+        self.bell_memory.pop(self.node.map_info_to_qubit(qnic, idx))
+        super().free(qnic, idx)
+
+    def _handle_qcirc(self, request):
+        raise ValueError("Custom quantum circuits are not supported by the Bell-diagonal backend.")
+
+    def _handle_correct(self, request):
+        yield from self._await_instructions(self.bell_memory.CORRECT_DURATION)
+        self._apply_correct(request)
+
+    def _handle_dejmps(self, request):
+        yield from self._await_instructions(self.bell_memory.DEJMPS_DURATION)
+        self._apply_dejmps(request)
+
+    def _handle_swap(self, request):
+        yield from self._await_instructions(self.bell_memory.SWAP_DURATION)
+        self._apply_swap(request)
+
+    def _handle_swap_batch(self, request):
+        yield from self._await_instructions(self.bell_memory.SWAP_DURATION)
+        self._apply_swap_batch(request)
+
+    def _apply_correct(self, request):
+        self.bell_memory.correct(self.node.map_info_to_qubit(request.qnic1, request.idx1), request.cur_state)
+
+        self.send_response('Done', name=request.id)
+
+    def _apply_dejmps(self, request):
+        outcome = self.bell_memory.dejmps(self.node.map_info_to_qubit(request.qnic1, request.idx1),
+                                          self.node.map_info_to_qubit(request.qnic2, request.idx2), request.role)
+
+        # free the ancilla
+        self.free(request.qnic2, request.idx2)
+
+        self.send_response(outcome, name=request.id)
+
+    def _apply_swap(self, request):
+        bell_result = self.bell_memory.swap(self.node.map_info_to_qubit(request.qnic1, request.idx1),
+                                            self.node.map_info_to_qubit(request.qnic2, request.idx2))
+
+        # free the swapped qubits
+        self.free(request.qnic1, request.idx1)
+        self.free(request.qnic2, request.idx2)
+
+        self.send_response(bell_result, name=request.id)
+
+    def _apply_swap_batch(self, request):
+        bell_results = []
+        for qnic1, idx1, qnic2, idx2 in request.pairs:
+            bell_results.append(self.bell_memory.swap(self.node.map_info_to_qubit(qnic1, idx1),
+                                                      self.node.map_info_to_qubit(qnic2, idx2)))
+            self.free(qnic1, idx1)
+            self.free(qnic2, idx2)
+
+        self.send_response(bell_results, name=request.id)
+
+    def run(self):
+        r"""
+        References
+        ----------
+
+        See :meth:`~progress.hardware.qhardware.QuantumOperationsService.run`.
+        """
+        if not self.pipelined:
+            yield from super().run()
+            return
+
+        # heap of (end_time, sequence number, positions, apply) of the operations in flight
+        in_flight = []
+        busy_positions = set()
+        sequence_number = 0
+        while True:
+            now = ns.sim_time()
+
+            # complete the operations that are over
+            while len(in_flight) > 0 and in_flight[0][0] <= now:
+                _, _, positions, apply = heapq.heappop(in_flight)
+                busy_positions.difference_update(positions)
+                apply()
+
+            # start the requests that do not conflict with the operations in flight, preserving their order
+            next_time = in_flight[0][0] if len(in_flight) > 0 else None
+            blocked = set(busy_positions)
+            waiting = deque()
+            while len(self.queue) > 0:
+                start_time, (handler_id, request, kwargs) = self.queue.popleft()
+                positions, num_instructions, apply = self._get_operation(request)
+                if start_time > now or any(position in blocked for position in positions):
+                    waiting.append((start_time, (handler_id, request, kwargs)))
+                    blocked.update(positions)
+                    if start_time > now and (next_time is None or start_time < next_time):
+                        next_time = start_time
+                    continue
+                duration = num_instructions * self.bell_memory.instr_duration
+                if duration <= 0:
+                    apply()
+                    continue
+                heapq.heappush(in_flight, (now + duration, sequence_number, positions, apply))
+                sequence_number += 1
+                busy_positions.update(positions)
+                blocked.update(positions)
+                if next_time is None or now + duration < next_time:
+                    next_time = now + duration
+            self.queue = waiting
+
+            if next_time is None:
+                yield self.await_signal(self, self._new_req_signal)
+            else:
+                yield self.await_signal(self, self._new_req_signal) | self.await_timer(end_time=next_time)
@@ -8,6 +8,7 @@ import netsquid as ns
 from progress.messaging.messages import ClassicalRoutingTableMessage
 from progress.pqnet.messages import InterModuleMessage, ReplaceDAGMessage
 from progress import progress_logging as log
+from progress import tracing
 
 
 class MessageRoutingService(ns.protocols.NodeProtocol):
@@ -30,6 +31,13 @@ class MessageRoutingService(ns.protocols.NodeProtocol):
         super().__init__(name=name, node=node)
         self._routing_table = None
 
+        # cached wait expressions. See _get_ev_expr and _get_dag_ev_expr
+        self._ev_expr = None
+        # port -> (order of handling, port name)
+        self._port_info = {}
+        self._dag_ev_expr = None
+        self._dag_port = None
+
     def _handle_message(self, message):
         r"""
         Handle a message that is meant to be routed between devices.
@@ -41,7 +49,7 @@ class MessageRoutingService(ns.protocols.NodeProtocol):
             req = self.node.net_manager.req_message(message)
             self.node.net_manager.put(req)
         elif isinstance(message, ReplaceDAGMessage):
-            log.info(f"Received new DAG", self.node.device_id)
+            log.info("Received new DAG", repeater_id=self.node.device_id)
             req = self.node.net_manager.req_message(message)
             self.node.net_manager.put(req)
         elif isinstance(message, ClassicalRoutingTableMessage):
@@ -51,7 +59,7 @@ class MessageRoutingService(ns.protocols.NodeProtocol):
         r"""
         Handle a message that contains a routing table.
         """
-        log.info(f"Received routing table", self.node.device_id)
+        log.info("Received routing table", repeater_id=self.node.device_id)
         if not isinstance(message, ClassicalRoutingTableMessage):
             raise TypeError("Message is not a routing table message")
         if message.destination_device != self.node.device_id:
@@ -61,24 +69,53 @@ class MessageRoutingService(ns.protocols.NodeProtocol):
 
     def _route_message_out(self, message):
         out_qnic = self._routing_table[message.destination_device]
+        tracing.record(tracing.TraceEvent.MESSAGE_ROUTED, device=self.node.device_id,
+                       other_device=message.destination_device, value=out_qnic)
         self.node.ports[f"c_{out_qnic}"].tx_output(message)
 
     def _get_ev_expr(self):
-        ev_expr = self.await_port_input(self.node.ports[f"controller"])
-        for i in range(self.node.num_cnics):
-            ev_expr |= self.await_port_input(self.node.ports[f"c_{i}"])
-
+        r"""
+        Get the expression waiting for input on the controller and classical ports. It is built on the first call
+        and only reset afterwards.
+        """
+        if self._ev_expr is not None:
+            self._ev_expr.reset()
+            return self._ev_expr
+        port_names = ["controller"] + [f"c_{i}" for i in range(self.node.num_cnics)]
+        ev_expr = None
+        for i, port_name in enumerate(port_names):
+            port = self.node.ports[port_name]
+            # ports are handled from the last classical port to the controller port
+            self._port_info[port] = (len(port_names) - i, port_name)
+            port_ev_expr = self.await_port_input(port)
+            ev_expr = port_ev_expr if ev_expr is None else ev_expr | port_ev_expr
+        self._ev_expr = ev_expr
         return ev_expr
 
+    def _get_dag_ev_expr(self, dag_port):
+        r"""
+        Get the expression waiting for input on the controller and classical ports or for output on the messages port
+        of the DAG. Its second term is the DAG port. It is rebuilt only when the DAG changes.
+        """
+        if self._dag_ev_expr is not None and self._dag_port is dag_port:
+            self._dag_ev_expr.reset()
+            return self._dag_ev_expr
+        self._dag_port = dag_port
+        self._dag_ev_expr = self._get_ev_expr() | self.await_port_output(dag_port)
+        return self._dag_ev_expr
+
     def _get_triggered_ports(self, ev_expr):
-        triggered_ports = []
-        for i in range(self.node.num_cnics - 1, -1, -1):
-            if ev_expr.second_term.value:
-                triggered_ports.append(f"c_{i}")
-            ev_expr = ev_expr.first_term
-        if ev_expr.value:
-            triggered_ports.append("controller")
-        return triggered_ports
+        r"""
+        Get the names of the classical ports that triggered `ev_expr`, from the events that fired.
+        """
+        triggered = []
+        for event in ev_expr.triggered_events:
+            port_info = self._port_info.get(event.source)
+            if port_info is not None and port_info not in triggered:
+                triggered.append(port_info)
+        if len(triggered) > 1:
+            triggered.sort()
+        return [port_name for _, port_name in triggered]
 
     def run(self):
         r"""
@@ -90,15 +127,14 @@ class MessageRoutingService(ns.protocols.NodeProtocol):
         while True:
             if self.node.dag is None:
                 ev_expr = yield self._get_ev_expr()
-                triggered_ports = self._get_triggered_ports(ev_expr)
             else:
-                ev_expr = yield self._get_ev_expr() |\
-                    self.await_port_output(self.node.dag.wrapping_node.ports["messages"])
+                dag_port = self.node.dag.wrapping_node.ports["messages"]
+                ev_expr = yield self._get_dag_ev_expr(dag_port)
                 if ev_expr.second_term.value:
-                    while len(self.node.dag.wrapping_node.ports["messages"].output_queue) > 0:
-                        message = self.node.dag.wrapping_node.ports["messages"].rx_output()
+                    while len(dag_port.output_queue) > 0:
+                        message = dag_port.rx_output()
                         self._handle_message(message)
-                triggered_ports = self._get_triggered_ports(ev_expr.first_term)
+            triggered_ports = self._get_triggered_ports(ev_expr)
 
             for port in triggered_ports:
                 while len(self.node.ports[port].input_queue) > 0:
@@ -0,0 +1,684 @@
+"""
+This module implements streaming metrics for simulations. Metrics are updated incrementally while the simulation
+runs, and their series are returned as NumPy arrays, so that analysis and plotting do not need to scan the raw
+samples again.
+
+Records are delivered to metrics through a :class:`MetricsBus`. Module behaviors publish fixed-schema records on the
+channels of the active bus (see :func:`set_metrics_bus`), where they are stored in preallocated columns and
+dispatched to the subscribers of the channel.
+"""
+
+import math
+
+import numpy as np
+
+__all__ = ["MetricsChannel", "MetricsBus", "set_metrics_bus", "get_metrics_bus", "WindowedMetrics",
+           "SlotMetrics"]
+
+
+def _grow(array, min_size):
+    r"""
+    Return `array` enlarged (by doubling) so that it has at least `min_size` rows. New rows are zero.
+    """
+    if len(array) >= min_size:
+        return array
+    new_size = max(min_size, 2 * len(array), 16)
+    grown = np.zeros((new_size,) + array.shape[1:], dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+class MetricsChannel:
+    r"""
+    A channel of a :class:`~progress.metrics.MetricsBus`. Each record published on the channel is stored once in
+    column arrays, which grow by doubling, and passed to all the subscribers of the channel.
+
+    Parameters
+    ----------
+    name : str
+        The name of the channel.
+    fields : tuple[str]
+        The names of the fields of the records.
+    dtypes : tuple or None, optional
+        The NumPy dtype of each field. If `None`, all fields are floats. Defaults to `None`.
+    capacity : int, optional
+        The number of records preallocated. Defaults to :attr:`CAPACITY`.
+    """
+
+    CAPACITY = 1024
+    """The default number of preallocated records."""
+
+    def __init__(self, name, fields, dtypes=None, capacity=None):
+        if dtypes is None:
+            dtypes = (float,) * len(fields)
+        if len(dtypes) != len(fields):
+            raise ValueError(f"Channel {name} has {len(fields)} fields but {len(dtypes)} dtypes.")
+        capacity = capacity if capacity is not None else self.CAPACITY
+        self.name = name
+        self.fields = tuple(fields)
+        self._columns = [np.zeros(capacity, dtype=dtype) for dtype in dtypes]
+        self._num_records = 0
+        self._subscribers = []
+
+    def __len__(self):
+        return self._num_records
+
+    def publish(self, *values):
+        r"""
+        Publish a record on the channel.
+
+        Parameters
+        ----------
+        *values
+            The values of the fields, in the order of :attr:`fields`.
+        """
+        row = self._num_records
+        columns = self._columns
+        if row == len(columns[0]):
+            columns = self._columns = [_grow(column, row + 1) for column in columns]
+        for column, value in zip(columns, values):
+            column[row] = value
+        self._num_records = row + 1
+        for subscriber in self._subscribers:
+            subscriber(*values)
+
+    def subscribe(self, callback):
+        r"""
+        Subscribe to the records published from now on.
+
+        Parameters
+        ----------
+        callback : callable
+            Called with the field values of each record, in the order of :attr:`fields`.
+        """
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        r"""
+        Remove a subscriber of the channel.
+
+        Parameters
+        ----------
+        callback : callable
+            The subscriber to remove.
+        """
+        self._subscribers.remove(callback)
+
+    def get_columns(self):
+        r"""
+        Get the records published so far.
+
+        Returns
+        -------
+        dict
+            Maps each field name to a NumPy array with the values of that field.
+        """
+        return {field: column[:self._num_records] for field, column in zip(self.fields, self._columns)}
+
+
+class MetricsBus:
+    r"""
+    A set of named :class:`~progress.metrics.MetricsChannel`, shared by the publishers and the subscribers of a
+    simulation run.
+    """
+
+    def __init__(self):
+        self._channels = {}
+
+    def get_channel(self, name, fields=None, dtypes=None):
+        r"""
+        Get a channel of the bus, creating it if `fields` is given and the channel does not exist yet.
+
+        Parameters
+        ----------
+        name : str
+            The name of the channel.
+        fields : tuple[str] or None, optional
+            The fields of the channel. If not `None`, they must match the fields of the existing channel.
+            Defaults to `None`.
+        dtypes : tuple or None, optional
+            The dtypes of the fields, used if the channel is created. Defaults to `None`.
+
+        Returns
+        -------
+        :class:`~progress.metrics.MetricsChannel` or None
+            The channel, or `None` if it does not exist and `fields` is `None`.
+        """
+        channel = self._channels.get(name)
+        if channel is None:
+            if fields is None:
+                return None
+            channel = self._channels[name] = MetricsChannel(name, fields, dtypes)
+        elif fields is not None and tuple(fields) != channel.fields:
+            raise ValueError(f"Channel {name} has fields {channel.fields}, not {tuple(fields)}.")
+        return channel
+
+
+_bus = None
+
+
+def set_metrics_bus(bus):
+    r"""
+    Install the bus on which metrics records are published.
+
+    Parameters
+    ----------
+    bus : :class:`~progress.metrics.MetricsBus` or None
+        The bus. If `None`, no records are published.
+    """
+    global _bus
+    _bus = bus
+
+
+def get_metrics_bus():
+    r"""
+    Get the active metrics bus.
+
+    Returns
+    -------
+    :class:`~progress.metrics.MetricsBus` or None
+        The active bus, or `None` if no bus is installed.
+    """
+    return _bus
+
+
+def _histogram_quantiles(histogram, edges, quantiles):
+    r"""
+    Estimate quantiles from a histogram, interpolating linearly inside the bins.
+    """
+    quantiles = np.asarray(quantiles, dtype=float)
+    total = histogram.sum()
+    if total == 0:
+        return np.full(quantiles.shape, np.nan)
+    cumulative = np.cumsum(histogram)
+    targets = quantiles * total
+    bins = np.minimum(np.searchsorted(cumulative, targets, side="left"), len(histogram) - 1)
+    below = np.where(bins > 0, cumulative[bins - 1], 0)
+    in_bin = histogram[bins]
+    fraction = np.divide(targets - below, in_bin, out=np.zeros_like(targets), where=in_bin > 0)
+    return edges[bins] + np.clip(fraction, 0., 1.) * (edges[bins + 1] - edges[bins])
+
+
+class WindowedMetrics:
+    r"""
+    A streaming collector of timestamped samples (e.g. the fidelity of the tokens freed by end nodes). It keeps:
+
+    - the number of samples and the sum of their values in time buckets of width `step`, from which sliding-window
+      throughput and mean are computed;
+    - the histogram of the values in the last `window`, updated as buckets enter and leave it;
+    - the count, sum, sum of squares and histogram of the values of each scenario.
+
+    Samples must be added in non-decreasing time order, as they are during a simulation.
+
+    Parameters
+    ----------
+    window : float, optional
+        The width of the sliding window. Defaults to :attr:`WINDOW`. [ns]
+    step : float, optional
+        The time resolution of the sliding-window series. It must divide `window`. Defaults to :attr:`STEP`. [ns]
+    num_bins : int, optional
+        The number of bins of the histograms used for quantiles. Defaults to :attr:`NUM_BINS`.
+    value_range : tuple, optional
+        The range of the values covered by the histograms. Values outside it are counted in the first or last bin.
+        Defaults to ``(0., 1.)``.
+    """
+
+    WINDOW = 1e7
+    """The default width of the sliding window (10 ms). [ns]"""
+
+    STEP = 1e5
+    """The default time resolution of the sliding-window series (0.1 ms). [ns]"""
+
+    NUM_BINS = 100
+    """The default number of histogram bins."""
+
+    def __init__(self, window=None, step=None, num_bins=None, value_range=(0., 1.)):
+        self.window = window if window is not None else self.WINDOW
+        self.step = step if step is not None else self.STEP
+        num_bins = num_bins if num_bins is not None else self.NUM_BINS
+        window_buckets = self.window / self.step
+        if self.step <= 0 or window_buckets < 1 or abs(window_buckets - round(window_buckets)) > 1e-9:
+            raise ValueError(f"The window ({self.window}) must be a positive multiple of the step ({self.step}).")
+        self._window_buckets = int(round(window_buckets))
+        self.edges = np.linspace(value_range[0], value_range[1], num_bins + 1)
+
+        # time of the first sample, origin of the buckets
+        self._origin = None
+        self._bucket_counts = np.zeros(0, dtype=np.int64)
+        self._bucket_values = np.zeros(0, dtype=float)
+        self._bucket_valued = np.zeros(0, dtype=np.int64)
+        self._last_bucket = -1
+
+        # histograms of the buckets in the current window, indexed by bucket modulo the window length
+        self._window_ring = np.zeros((self._window_buckets, num_bins), dtype=np.int64)
+        self._window_histogram = np.zeros(num_bins, dtype=np.int64)
+
+        self._num_samples = 0
+        self._sample_times = np.zeros(0, dtype=float)
+        self._sample_values = np.zeros(0, dtype=float)
+
+        self._num_scenarios = 0
+        self._scenario_times = np.zeros(0, dtype=float)
+        self._scenario_ids = np.zeros(0, dtype=np.int64)
+        self.current_scenario = None
+        # scenario -> [count, sum, sum of squares]
+        self._scenario_moments = {}
+        self._scenario_histograms = {}
+
+    def add_scenario(self, time, scenario):
+        r"""
+        Record the start of a new scenario. The following samples are attributed to it.
+
+        Parameters
+        ----------
+        time : float
+            The start time of the scenario. [ns]
+        scenario : int
+            The scenario identifier.
+        """
+        self._scenario_times = _grow(self._scenario_times, self._num_scenarios + 1)
+        self._scenario_ids = _grow(self._scenario_ids, self._num_scenarios + 1)
+        self._scenario_times[self._num_scenarios] = time
+        self._scenario_ids[self._num_scenarios] = scenario
+        self._num_scenarios += 1
+        self.current_scenario = scenario
+
+    def add_sample(self, time, value=None):
+        r"""
+        Add a sample.
+
+        Parameters
+        ----------
+        time : float
+            The time of the sample. [ns]
+        value : float or None, optional
+            The value of the sample. If `None`, the sample only counts towards throughput. Defaults to `None`.
+        """
+        if self._origin is None:
+            self._origin = time
+        bucket = int((time - self._origin) // self.step)
+        if bucket < self._last_bucket:
+            raise ValueError(f"Sample at time {time} is older than the last sample.")
+        if bucket > self._last_bucket:
+            self._advance_window(bucket)
+
+        self._bucket_counts[bucket] += 1
+        self._sample_times = _grow(self._sample_times, self._num_samples + 1)
+        self._sample_values = _grow(self._sample_values, self._num_samples + 1)
+        self._sample_times[self._num_samples] = time
+        self._sample_values[self._num_samples] = np.nan if value is None else value
+        self._num_samples += 1
+        if value is None:
+            return
+
+        self._bucket_values[bucket] += value
+        self._bucket_valued[bucket] += 1
+        value_bin = min(max(int(np.searchsorted(self.edges, value, side="right")) - 1, 0), len(self.edges) - 2)
+        self._window_ring[bucket % self._window_buckets, value_bin] += 1
+        self._window_histogram[value_bin] += 1
+
+        moments = self._scenario_moments.get(self.current_scenario)
+        if moments is None:
+            moments = self._scenario_moments[self.current_scenario] = [0, 0., 0.]
+            self._scenario_histograms[self.current_scenario] = np.zeros(len(self.edges) - 1, dtype=np.int64)
+        moments[0] += 1
+        moments[1] += value
+        moments[2] += value * value
+        self._scenario_histograms[self.current_scenario][value_bin] += 1
+
+    def _advance_window(self, bucket):
+        r"""
+        Move the window forward so that its last bucket is `bucket`, dropping the histograms of the buckets that
+        leave it.
+        """
+        self._bucket_counts = _grow(self._bucket_counts, bucket + 1)
+        self._bucket_values = _grow(self._bucket_values, bucket + 1)
+        self._bucket_valued = _grow(self._bucket_valued, bucket + 1)
+        if bucket - self._last_bucket >= self._window_buckets:
+            self._window_ring[:] = 0
+            self._window_histogram[:] = 0
+        else:
+            for expired in range(self._last_bucket + 1, bucket + 1):
+                row = self._window_ring[expired % self._window_buckets]
+                self._window_histogram -= row
+                row[:] = 0
+        self._last_bucket = bucket
+
+    def __len__(self):
+        return self._num_samples
+
+    def get_samples(self):
+        r"""
+        Get all the samples.
+
+        Returns
+        -------
+        tuple
+            The times of the samples [ns] and their values (NaN for samples without value), as NumPy arrays.
+        """
+        return self._sample_times[:self._num_samples], self._sample_values[:self._num_samples]
+
+    def get_scenarios(self):
+        r"""
+        Get the scenario changes.
+
+        Returns
+        -------
+        tuple
+            The start times of the scenarios [ns] and their identifiers, as NumPy arrays.
+        """
+        return self._scenario_times[:self._num_scenarios], self._scenario_ids[:self._num_scenarios]
+
+    def _get_window_sums(self, bucket_array):
+        r"""
+        Sum `bucket_array` over each full window, returning one value per window end.
+        """
+        num_buckets = self._last_bucket + 1
+        if num_buckets < self._window_buckets:
+            return np.zeros(0, dtype=bucket_array.dtype)
+        cumulative = np.concatenate(([0], np.cumsum(bucket_array[:num_buckets])))
+        return cumulative[self._window_buckets:] - cumulative[:-self._window_buckets]
+
+    def _get_window_times(self):
+        num_windows = self._last_bucket + 2 - self._window_buckets
+        if num_windows <= 0:
+            return np.zeros(0, dtype=float)
+        return self._origin + (np.arange(num_windows) + self._window_buckets) * self.step
+
+    def get_throughput(self):
+        r"""
+        Get the sliding-window throughput, with one point per step from the first full window.
+
+        Returns
+        -------
+        tuple
+            The end times of the windows [ns] and the number of samples per second in each window [1/s], as NumPy
+            arrays.
+        """
+        return self._get_window_times(), self._get_window_sums(self._bucket_counts) * 1e9 / self.window
+
+    def get_rolling_mean(self):
+        r"""
+        Get the sliding-window mean of the sample values, with one point per step from the first full window.
+
+        Returns
+        -------
+        tuple
+            The end times of the windows [ns] and the mean value in each window (NaN if the window has no valued
+            samples), as NumPy arrays.
+        """
+        sums = self._get_window_sums(self._bucket_values)
+        counts = self._get_window_sums(self._bucket_valued)
+        means = np.divide(sums, counts, out=np.full(len(sums), np.nan), where=counts > 0)
+        return self._get_window_times(), means
+
+    def get_window_quantiles(self, quantiles):
+        r"""
+        Get quantiles of the values in the last window, i.e. the window ending with the bucket of the last sample.
+
+        Parameters
+        ----------
+        quantiles : float or list[float]
+            The quantiles to compute, in :math:`[0, 1]`.
+
+        Returns
+        -------
+        :class:`numpy.ndarray`
+            The estimated quantiles (NaN if the window has no valued samples).
+        """
+        return _histogram_quantiles(self._window_histogram, self.edges, quantiles)
+
+    def get_histogram(self, scenario=None):
+        r"""
+        Get the histogram of the sample values.
+
+        Parameters
+        ----------
+        scenario : int or None, optional
+            If not `None`, only the samples of this scenario are counted. Defaults to `None`.
+
+        Returns
+        -------
+        tuple
+            The counts and the bin edges, as NumPy arrays.
+        """
+        if scenario is not None:
+            histogram = self._scenario_histograms.get(scenario)
+            if histogram is None:
+                histogram = np.zeros(len(self.edges) - 1, dtype=np.int64)
+            return histogram.copy(), self.edges
+        histogram = np.zeros(len(self.edges) - 1, dtype=np.int64)
+        for scenario_histogram in self._scenario_histograms.values():
+            histogram += scenario_histogram
+        return histogram, self.edges
+
+    def get_quantiles(self, quantiles, scenario=None):
+        r"""
+        Get quantiles of the sample values.
+
+        Parameters
+        ----------
+        quantiles : float or list[float]
+            The quantiles to compute, in :math:`[0, 1]`.
+        scenario : int or None, optional
+            If not `None`, only the samples of this scenario are considered. Defaults to `None`.
+
+        Returns
+        -------
+        :class:`numpy.ndarray`
+            The estimated quantiles (NaN if there are no valued samples).
+        """
+        histogram, edges = self.get_histogram(scenario)
+        return _histogram_quantiles(histogram, edges, quantiles)
+
+    def get_scenario_summary(self):
+        r"""
+        Get the aggregates of the sample values of each scenario.
+
+        Returns
+        -------
+        dict
+            Maps each scenario with valued samples to a dictionary with the keys ``count``, ``mean`` and ``std``.
+        """
+        summary = {}
+        for scenario, (count, total, total_sq) in self._scenario_moments.items():
+            mean = total / count
+            summary[scenario] = {"count": count, "mean": mean,
+                                 "std": math.sqrt(max(total_sq / count - mean * mean, 0.))}
+        return summary
+
+
+class SlotMetrics:
+    r"""
+    A streaming collector of samples attributed to slots, i.e. the periods during which a network configuration
+    (a topology id) is installed. Each slot has a start time and a scenario. Per-slot accumulators (first sample time,
+    number of samples, sum of values) are updated as samples arrive, so aggregation by slot or scenario never needs to
+    join samples and slots afterwards.
+
+    Parameters
+    ----------
+    default_scenario : int, optional
+        The scenario of slots that receive samples before being added with :meth:`add_slot`. Their start time is 0.
+        Defaults to 0.
+    """
+
+    def __init__(self, default_scenario=0):
+        self.default_scenario = default_scenario
+        # slot id -> row of the slot arrays
+        self._slot_rows = {}
+        self._slot_ids = np.zeros(0, dtype=np.int64)
+        self._slot_scenarios = np.zeros(0, dtype=np.int64)
+        self._slot_start_times = np.zeros(0, dtype=float)
+        self._slot_first_times = np.zeros(0, dtype=float)
+        self._slot_counts = np.zeros(0, dtype=np.int64)
+        self._slot_valued = np.zeros(0, dtype=np.int64)
+        self._slot_sums = np.zeros(0, dtype=float)
+
+        # valued samples, with the row of their slot
+        self._num_values = 0
+        self._values = np.zeros(0, dtype=float)
+        self._value_rows = np.zeros(0, dtype=np.int64)
+
+    def _get_row(self, slot_id):
+        row = self._slot_rows.get(slot_id)
+        if row is not None:
+            return row
+        row = len(self._slot_rows)
+        self._slot_rows[slot_id] = row
+        for name in ("_slot_ids", "_slot_scenarios", "_slot_start_times", "_slot_first_times", "_slot_counts",
+                     "_slot_valued", "_slot_sums"):
+            setattr(self, name, _grow(getattr(self, name), row + 1))
+        self._slot_ids[row] = slot_id
+        self._slot_scenarios[row] = self.default_scenario
+        self._slot_first_times[row] = np.nan
+        return row
+
+    def add_slot(self, slot_id, time, scenario):
+        r"""
+        Record the start of a slot.
+
+        Parameters
+        ----------
+        slot_id : int
+            The identifier of the slot (the topology id).
+        time : float
+            The start time of the slot. [ns]
+        scenario : int
+            The scenario of the slot.
+        """
+        row = self._get_row(slot_id)
+        self._slot_start_times[row] = time
+        self._slot_scenarios[row] = scenario
+
+    def add_sample(self, time, slot_id, value=None):
+        r"""
+        Add a sample to a slot.
+
+        Parameters
+        ----------
+        time : float
+            The time of the sample. [ns]
+        slot_id : int
+            The slot the sample belongs to.
+        value : float or None, optional
+            The value of the sample. If `None`, the sample only counts towards the slot activity. Defaults to `None`.
+        """
+        row = self._get_row(slot_id)
+        if self._slot_counts[row] == 0:
+            self._slot_first_times[row] = time
+        self._slot_counts[row] += 1
+        if value is None:
+            return
+        self._slot_valued[row] += 1
+        self._slot_sums[row] += value
+        self._values = _grow(self._values, self._num_values + 1)
+        self._value_rows = _grow(self._value_rows, self._num_values + 1)
+        self._values[self._num_values] = value
+        self._value_rows[self._num_values] = row
+        self._num_values += 1
+
+    def get_slots(self):
+        r"""
+        Get the accumulators of all slots, in the order the slots were first seen.
+
+        Returns
+        -------
+        dict
+            Maps ``slot_id``, ``scenario``, ``start_time`` [ns], ``first_time`` [ns] (NaN if the slot has no samples),
+            ``count``, ``valued`` and ``mean`` (NaN if the slot has no valued samples) to NumPy arrays.
+        """
+        num_slots = len(self._slot_rows)
+        valued = self._slot_valued[:num_slots]
+        sums = self._slot_sums[:num_slots]
+        return {"slot_id": self._slot_ids[:num_slots],
+                "scenario": self._slot_scenarios[:num_slots],
+                "start_time": self._slot_start_times[:num_slots],
+                "first_time": self._slot_first_times[:num_slots],
+                "count": self._slot_counts[:num_slots],
+                "valued": valued,
+                "mean": np.divide(sums, valued, out=np.full(num_slots, np.nan), where=valued > 0)}
+
+    def _get_slot_mask(self, scenarios):
+        num_slots = len(self._slot_rows)
+        if scenarios is None:
+            return np.ones(num_slots, dtype=bool)
+        return np.isin(self._slot_scenarios[:num_slots], list(scenarios))
+
+    def get_values(self, scenarios=None):
+        r"""
+        Get the values of the samples.
+
+        Parameters
+        ----------
+        scenarios : iterable or None, optional
+            If not `None`, only the samples of slots with one of these scenarios are returned. Defaults to `None`.
+
+        Returns
+        -------
+        :class:`numpy.ndarray`
+            The values, in arrival order.
+        """
+        values = self._values[:self._num_values]
+        if scenarios is None:
+            return values
+        return values[self._get_slot_mask(scenarios)[self._value_rows[:self._num_values]]]
+
+    def get_response_times(self, scenarios=None):
+        r"""
+        Get the response time of the slots, i.e. the time between the start of each slot and its first sample.
+        Slots without samples are skipped.
+
+        Parameters
+        ----------
+        scenarios : iterable or None, optional
+            If not `None`, only the slots with one of these scenarios are considered. Defaults to `None`.
+
+        Returns
+        -------
+        :class:`numpy.ndarray`
+            The response times. [ns]
+        """
+        num_slots = len(self._slot_rows)
+        mask = self._get_slot_mask(scenarios) & (self._slot_counts[:num_slots] > 0)
+        return self._slot_first_times[:num_slots][mask] - self._slot_start_times[:num_slots][mask]
+
+    def summarize(self, groups, quantiles=(0.05, 0.5, 0.95)):
+        r"""
+        Aggregate values and response times by groups of scenarios.
+
+        Parameters
+        ----------
+        groups : dict
+            Maps a group name to the scenarios in the group.
+        quantiles : tuple, optional
+            The quantiles to compute. Defaults to ``(0.05, 0.5, 0.95)``.
+
+        Returns
+        -------
+        dict
+            Maps each group name to a dictionary with the number of values (``num_values``), the number of slots
+            with samples (``num_slots``), and the mean and quantiles of values (``value_mean``,
+            ``value_quantiles``) and response times (``response_time_mean``, ``response_time_quantiles``). Means and
+            quantiles are NaN for empty groups.
+        """
+        summary = {}
+        for name, scenarios in groups.items():
+            values = self.get_values(scenarios)
+            response_times = self.get_response_times(scenarios)
+            summary[name] = {"num_values": len(values),
+                             "num_slots": len(response_times),
+                             "value_mean": _mean(values),
+                             "value_quantiles": _quantiles(values, quantiles),
+                             "response_time_mean": _mean(response_times),
+                             "response_time_quantiles": _quantiles(response_times, quantiles)}
+        return summary
+
+
+def _mean(values):
+    return float(np.mean(values)) if len(values) > 0 else np.nan
+
+
+def _quantiles(values, quantiles):
+    if len(values) == 0:
+        return np.full(len(quantiles), np.nan)
+    return np.quantile(values, quantiles)
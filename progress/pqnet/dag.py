@@ -19,6 +19,14 @@ class DAG:
     edges : list[tuple[str, str]]
         A list of tuples, where each tuple represents an edge in the DAG. The order of the tuple is important,
         as it determines the direction of the edge.
+    direct_dispatch : bool, optional
+        If `True`, tokens promoted by a module are handed to the downstream module immediately, by calling its
+        behavior, instead of being sent through the connected ports. This skips the port transfer and the wakeup of
+        the downstream :class:`~progress.pqnet.p_module.ModuleEnvironment`, which is only notified if it must
+        reschedule garbage collection (see :meth:`~progress.pqnet.p_module.ModuleEnvironment.notify_new_tokens`).
+        Ports are connected in both cases. Handlers are re-entrant: the downstream handler runs to completion inside
+        the upstream one, so a chain of modules nests its handlers, and a behavior should update its own state
+        before promoting tokens. Defaults to `False`.
 
     Attributes
     ----------
@@ -35,11 +43,13 @@ class DAG:
         - "tokens_ops_in": The input port for responses from the quantum hardware for operations on the tokens.
     """
 
-    def __init__(self, nodes, edges):
+    def __init__(self, nodes, edges, direct_dispatch=False):
         self._graph = nx.DiGraph()
         self._graph.add_nodes_from(nodes.keys())
         self._graph.add_edges_from(edges)
         self._nodes = nodes
+        # module name -> signature in the factory that created the module. See DAGFactory.patch_dag
+        self.module_signatures = {}
 
         if not nx.is_directed_acyclic_graph(self._graph):
             raise ValueError("The graph is not a DAG.")
@@ -69,16 +79,20 @@ class DAG:
                                      ["messages", "tokens_ops_in"])
 
         # connect the ports of the modules
+        self.direct_dispatch = direct_dispatch
         ports_used = {}
         for node in self._graph.nodes:
             ports_used[node] = (0, 0)
             self.wrapping_node.add_subcomponent(component=self._nodes[node], name=node)
+            self._nodes[node].direct_outputs = {} if direct_dispatch else None
         for edge in edges:
             source = edge[0]
             destination = edge[1]
             self._nodes[source].ports[f"out{ports_used[source][0]}"].connect(
                 self._nodes[destination].ports[f"in{ports_used[destination][1]}"]
             )
+            if direct_dispatch:
+                self._nodes[source].direct_outputs[ports_used[source][0]] = self._nodes[destination]
             ports_used[source] = (ports_used[source][0] + 1, ports_used[source][1])
             ports_used[destination] = (ports_used[destination][0], ports_used[destination][1] + 1)
 
@@ -111,12 +125,30 @@ class DAG:
         for node in self._nodes.values():
             node.qhal = qhal
 
-    def start(self):
+    def start(self, nodes=None):
         r"""
         Start all modules.
+
+        Parameters
+        ----------
+        nodes : list[str] or None, optional
+            If not `None`, only the modules with these names are started. Defaults to `None`.
+        """
+        if nodes is None:
+            nodes = self._nodes.keys()
+        for node in nodes:
+            self._nodes[node].start()
+
+    def clear_state(self):
+        r"""
+        Clear the state of all modules, so that a parked DAG can be started again. Token tables are emptied and
+        classical messages left over from the previous activation are dropped. The wiring is kept.
         """
         for node in self._nodes.values():
-            node.start()
+            node.clear_state()
+        messages_port = self.wrapping_node.ports["messages"]
+        while len(messages_port.output_queue) > 0:
+            messages_port.rx_output()
 
     def get_nodes(self):
         r"""
@@ -146,6 +178,37 @@ class DAG:
             node.stop()
             node.behavior.terminate()
 
+    def release(self, keep):
+        r"""
+        Dismantle the DAG, keeping some modules running so that they can be wired in a new DAG. All the other
+        modules are terminated and removed.
+
+        Parameters
+        ----------
+        keep : set[str]
+            The names of the modules to keep.
+
+        Returns
+        -------
+        dict[str, :class:`~progress.pqnet.p_module.Module`]
+            The kept modules, detached from this DAG.
+        """
+        kept = {}
+        for name, node in self._nodes.items():
+            if name in keep:
+                kept[name] = node
+            else:
+                node.stop()
+                node.behavior.terminate()
+            self.wrapping_node.rem_subcomponent(node)
+            for port in node.ports.values():
+                port.disconnect()
+        self._switch.remove()
+        self.wrapping_node.remove()
+        for port in self.wrapping_node.ports.values():
+            port.disconnect()
+        return kept
+
     def remove(self):
         r"""
         Remove all modules.
@@ -175,11 +238,34 @@ class DAGFactory:
         of the parameters to pass to the constructor of the module class. The dictionary must have keys that are
         numerical strings, so that they can be used to derive the module id. Roots of the DAG must have the optional
         integer parameter `"qnic"` to link them to the specific token queue from the QHAL.
+    device_id : int
+        The id of the device the DAG is created for.
+    fuse_pass_through : bool, optional
+        If `True`, modules whose behavior is marked as
+        :attr:`~progress.pqnet.p_module.ModuleBehavior.PASS_THROUGH` and that have a single output are removed from
+        the DAG, and their incoming edges are connected directly to their successor. A pass-through root hands its
+        qnic over to its successor, if that module has no other input. Tokens then reach the successor without the
+        intermediate hop. The fused modules no longer exist on the device, so messages and patches addressed to
+        their module ids are not delivered: only enable it for DAGs whose pass-through modules are never addressed
+        directly. Defaults to `False`.
+    direct_dispatch : bool, optional
+        Whether the created DAGs hand tokens between modules directly. See :class:`~progress.pqnet.dag.DAG`.
+        Defaults to `False`.
+
+    Attributes
+    ----------
+    fused_modules : list[str]
+        The names of the modules removed by fusion.
     """
 
-    def __init__(self, edges, module_behaviors, device_id):
+    def __init__(self, edges, module_behaviors, device_id, fuse_pass_through=False, direct_dispatch=False):
+        self.direct_dispatch = direct_dispatch
+        self.fused_modules = []
+        if fuse_pass_through:
+            edges, module_behaviors, self.fused_modules = _fuse_pass_through_modules(edges, module_behaviors)
         self._edges = edges
         self._module_behaviors = module_behaviors
+        self._device_id = device_id
         self._module_params = {}
         # infer the number of input and output ports for each module
         for node in self._module_behaviors.keys():
@@ -201,6 +287,54 @@ class DAGFactory:
             self._module_params[node]["name"] = "Module " + node
             self._module_params[node]["module_id"] = int(node)
 
+    def get_cache_key(self):
+        r"""
+        Get a key identifying the content of this factory. Two factories with the same key create equivalent DAGs,
+        so a DAG created by one of them can be reused in place of a DAG created by the other.
+
+        Returns
+        -------
+        tuple or None
+            The key. `None` if some parameter of the module behaviors is not hashable, in which case the DAGs
+            created by this factory should not be reused.
+        """
+        behaviors = []
+        for node in sorted(self._module_behaviors.keys()):
+            behavior_class, params = self._module_behaviors[node]
+            # the "node" parameter is set by create_dag and is not part of the content
+            params = {key: value for key, value in params.items() if key != "node"}
+            behaviors.append((node, behavior_class, _freeze(params)))
+        key = (self._device_id, self.direct_dispatch, tuple(tuple(edge) for edge in self._edges), tuple(behaviors))
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def _create_module(self, node):
+        module = Module(**self._module_params[node])
+        self._module_behaviors[node][1]["node"] = module
+        behavior = self._module_behaviors[node][0](**self._module_behaviors[node][1])
+        module.behavior = behavior
+        return module
+
+    def _get_module_signature(self, node):
+        r"""
+        Get what identifies a module of this factory and its place in the DAG: the behavior class and parameters,
+        and the incoming and outgoing edges, in the order that determines the port numbers.
+        """
+        behavior_class, params = self._module_behaviors[node]
+        params = {key: value for key, value in params.items() if key != "node"}
+        incoming = tuple(tuple(edge) for edge in self._edges if edge[1] == node)
+        outgoing = tuple(tuple(edge) for edge in self._edges if edge[0] == node)
+        return (behavior_class, _freeze(params), self._module_params[node]["num_input"],
+                self._module_params[node]["num_output"], incoming, outgoing)
+
+    def _build_dag(self, modules):
+        dag = DAG(modules, self._edges.copy(), direct_dispatch=self.direct_dispatch)
+        dag.module_signatures = {node: self._get_module_signature(node) for node in modules}
+        return dag
+
     def create_dag(self):
         r"""
         Create a DAG.
@@ -211,11 +345,102 @@ class DAGFactory:
         """
         modules = {}
         for node in self._module_behaviors.keys():
-            modules[node] = Module(**self._module_params[node])
-            self._module_behaviors[node][1]["node"] = modules[node]
-            behavior = self._module_behaviors[node][0](**self._module_behaviors[node][1])
-            modules[node].behavior = behavior
-        return DAG(modules.copy(), self._edges.copy())
+            modules[node] = self._create_module(node)
+        return self._build_dag(modules)
+
+    def patch_dag(self, dag):
+        r"""
+        Turn a running DAG into the DAG described by this factory, recreating only the modules that changed.
+        A module is kept, with its token table and behavior state, if the running DAG has a module with the same
+        name, behavior class and parameters, and the same incoming and outgoing edges. All the other modules of the
+        running DAG are terminated, and the missing ones are created. The DAG is then rewired.
+
+        Parameters
+        ----------
+        dag : :class:`~progress.pqnet.dag.DAG`
+            The running DAG. It is dismantled and must not be used afterwards.
+
+        Returns
+        -------
+        tuple[:class:`~progress.pqnet.dag.DAG`, list[str]]
+            The new DAG and the names of the modules that were created and must be started.
+        """
+        keep = set()
+        for node in self._module_behaviors.keys():
+            signature = dag.module_signatures.get(node)
+            if signature is not None and signature == self._get_module_signature(node):
+                keep.add(node)
+        kept_modules = dag.release(keep)
+
+        modules = {}
+        created = []
+        # keep the order of the factory, as it determines the ports of the messages switch
+        for node in self._module_behaviors.keys():
+            if node in kept_modules:
+                modules[node] = kept_modules[node]
+            else:
+                modules[node] = self._create_module(node)
+                created.append(node)
+        return self._build_dag(modules), created
+
+
+def _fuse_pass_through_modules(edges, module_behaviors):
+    r"""
+    Remove the pass-through modules from a DAG description. See :class:`~progress.pqnet.dag.DAGFactory`.
+
+    Returns
+    -------
+    tuple[list[tuple[str, str]], dict, list[str]]
+        The new edges, the new module behaviors and the names of the fused modules.
+    """
+    edges = [tuple(edge) for edge in edges]
+    module_behaviors = dict(module_behaviors)
+    fused = []
+    fused_one = True
+    while fused_one:
+        fused_one = False
+        for node, (behavior_class, params) in module_behaviors.items():
+            if not behavior_class.PASS_THROUGH:
+                continue
+            outgoing = [edge for edge in edges if edge[0] == node]
+            incoming = [edge for edge in edges if edge[1] == node]
+            if len(outgoing) != 1 or outgoing[0][1] == node:
+                continue
+            successor = outgoing[0][1]
+            is_root = "qnic" in params
+            if is_root:
+                # the successor becomes the root, so it must not have other inputs
+                if len(incoming) > 0 or "qnic" in module_behaviors[successor][1] or \
+                        any(edge[1] == successor for edge in edges if edge != outgoing[0]):
+                    continue
+                successor_class, successor_params = module_behaviors[successor]
+                successor_params = dict(successor_params)
+                successor_params["qnic"] = params["qnic"]
+                module_behaviors[successor] = (successor_class, successor_params)
+            elif len(incoming) == 0:
+                # the module never receives tokens
+                continue
+
+            # redirect the incoming edges to the successor, keeping the order of the output ports of predecessors
+            edges = [(edge[0], successor) if edge[1] == node else edge for edge in edges if edge != outgoing[0]]
+            del module_behaviors[node]
+            fused.append(node)
+            fused_one = True
+            break
+    return edges, module_behaviors, fused
+
+
+def _freeze(value):
+    r"""
+    Recursively convert dictionaries, lists and sets into tuples, so that the value can be hashed.
+    """
+    if isinstance(value, dict):
+        return tuple(sorted(((key, _freeze(item)) for key, item in value.items()), key=repr))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, (set, frozenset)):
+        return tuple(sorted((_freeze(item) for item in value), key=repr))
+    return value
 
 
 class DAGMessagesSwitch(ns.components.switch.Switch):
@@ -248,10 +473,10 @@ class DAGMessagesSwitch(ns.components.switch.Switch):
         for i in range(len(dag.get_nodes())):
             mux[port_names[i]] = "ext"
 
-        # Routing table:
+        # Routing table (module i of the DAG is connected to port module_i):
         routing_table = {}
-        for node in dag.get_nodes():
-            routing_table[int(node)] = port_names[int(node)]
+        for i, node in enumerate(dag.get_nodes()):
+            routing_table[int(node)] = port_names[i]
 
         super().__init__(name=name, port_names=port_names, properties={"mux_table": mux,
                                                                        "routing_table": routing_table})
@@ -263,7 +488,7 @@ class DAGMessagesSwitch(ns.components.switch.Switch):
         if input_port == "ext":
             if isinstance(message, InterModuleMessage):
                 if message.destination_id not in self.properties["routing_table"]:
-                    log.warning(f"No entry for module {message.destination_id} in the DAG")
+                    log.warning("No entry for module %s in the DAG", message.destination_id)
                     return []
                 return [(message, self.properties["routing_table"][message.destination_id])]
         elif input_port == "qhal_responses":  # message is a response from the QHAL
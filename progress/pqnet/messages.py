@@ -5,7 +5,7 @@ controller-device communication.
 
 import netsquid as ns
 
-__all__ = ["InterModuleMessage", "ReplaceDAGMessage"]
+__all__ = ["InterModuleMessage", "ReplaceDAGMessage", "PatchDAGMessage"]
 
 
 class InterModuleMessage(ns.components.Message):
@@ -131,3 +131,13 @@ class ReplaceDAGMessage(ns.components.Message):
         int
         """
         return self.items[-1]
+
+
+class PatchDAGMessage(ReplaceDAGMessage):
+    """
+    A message used by the controller to update the DAG of a device incrementally. Only the modules that differ from
+    the running DAG are stopped and recreated. The others keep running with their token tables.
+    See :meth:`~progress.pqnet.dag.DAGFactory.patch_dag`.
+    """
+
+    base_header = "PATCH DAG MESSAGE"
@@ -3,11 +3,12 @@ This module contains the manager for the NET layer. It is responsible for handli
 maintaining the DAG.
 """
 
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
 
 import netsquid as ns
 
-from progress.pqnet.messages import InterModuleMessage, ReplaceDAGMessage
+from progress import tracing
+from progress.pqnet.messages import InterModuleMessage, ReplaceDAGMessage, PatchDAGMessage
 
 __all__ = ["NetManagerProtocol"]
 
@@ -19,12 +20,28 @@ class NetManagerProtocol(ns.protocols.ServiceProtocol):
         - delivering messages from other modules to inner modules
         - maintaining the DAG.
 
+    A :class:`~progress.pqnet.messages.ReplaceDAGMessage` replaces the whole DAG, while a
+    :class:`~progress.pqnet.messages.PatchDAGMessage` only recreates the modules that changed
+    (see :meth:`~progress.pqnet.dag.DAGFactory.patch_dag`).
+
     Parameters
     ----------
     name : str
         The name of the protocol.
     node : :class:`netsquid.nodes.Node`
         The node that the protocol is running on.
+    dag_cache_size : int or None, optional
+        The maximum number of DAGs kept parked on the device after being replaced. When a
+        :class:`~progress.pqnet.messages.ReplaceDAGMessage` carries a factory with the same content
+        (see :meth:`~progress.pqnet.dag.DAGFactory.get_cache_key`) as a parked DAG, the parked DAG is cleared and
+        reconnected to the QHAL instead of being built from scratch. The least recently used DAG is removed when the
+        cache is full. If 0, replaced DAGs are always removed. If `None`, :attr:`DAG_CACHE_SIZE` is used.
+        Defaults to `None`.
+    """
+
+    DAG_CACHE_SIZE = 8
+    """
+    The default maximum number of parked DAGs per device.
     """
 
     req_message = namedtuple("req_message", ["message"])
@@ -37,11 +54,66 @@ class NetManagerProtocol(ns.protocols.ServiceProtocol):
         - message(:class:`netsquid.components.Message`): The message to handle.
     """
 
-    def __init__(self, name, node):
+    def __init__(self, name, node, dag_cache_size=None):
         super().__init__(name=name, node=node)
         self.register_request(self.req_message, self._handle_message)
         self.entanglement_started = False
 
+        if dag_cache_size is None:
+            dag_cache_size = self.DAG_CACHE_SIZE
+        if dag_cache_size < 0:
+            raise ValueError(f"The DAG cache size must be non-negative, got {dag_cache_size}.")
+        self.dag_cache_size = dag_cache_size
+        # cache key -> parked DAG, from the least to the most recently used
+        self._parked_dags = OrderedDict()
+        self._current_dag_key = None
+
+    def _attach_dag(self, dag):
+        # connect the DAG to the qhal
+        self.node.add_subcomponent(dag.wrapping_node, name="dag")
+        for i in range(self.node.qhardware.num_qnics):
+            self.node.qhal.ports[f"token_out_{i}"].connect(dag.wrapping_node.ports[f"token_in_{i}"])
+        self.node.qhal.ports["tokens_ops"].connect(dag.wrapping_node.ports["tokens_ops_in"])
+
+    def _detach_dag(self, dag):
+        for i in range(self.node.qhardware.num_qnics):
+            self.node.qhal.ports[f"token_out_{i}"].disconnect()
+        self.node.qhal.ports["tokens_ops"].disconnect()
+        self.node.rem_subcomponent("dag")
+
+    def _park_current_dag(self):
+        r"""
+        Terminate the current DAG and keep it for later reuse, or remove it if it cannot be cached.
+        """
+        dag = self.node.dag
+        dag.terminate()
+        key = self._current_dag_key
+        if self.dag_cache_size == 0 or key is None:
+            dag.remove()
+            return
+        self._detach_dag(dag)
+        old_dag = self._parked_dags.pop(key, None)
+        if old_dag is not None:
+            old_dag.remove()
+        self._parked_dags[key] = dag
+        while len(self._parked_dags) > self.dag_cache_size:
+            _, evicted = self._parked_dags.popitem(last=False)
+            evicted.remove()
+
+    def _get_dag(self, dag_factory):
+        r"""
+        Get a DAG for the given factory, reusing a parked one if available.
+        """
+        key = dag_factory.get_cache_key() if self.dag_cache_size > 0 else None
+        dag = self._parked_dags.pop(key, None) if key is not None else None
+        if dag is None:
+            dag = dag_factory.create_dag()
+            dag.set_qhal(self.node.qhal)
+        else:
+            dag.clear_state()
+        self._current_dag_key = key
+        return dag
+
     def _handle_message(self, request):
         message = request.message
         if isinstance(message, InterModuleMessage):
@@ -51,23 +123,28 @@ class NetManagerProtocol(ns.protocols.ServiceProtocol):
                 # if the topology id of the message does not match the current topology id, ignore the message
                 return
             dag.wrapping_node.ports["messages"].tx_input(message)
+        elif isinstance(message, PatchDAGMessage) and self.node.dag is not None:
+            # patch the DAG of the node, only starting the new modules
+            self._detach_dag(self.node.dag)
+            self.node.dag, created = message.dag_factory.patch_dag(self.node.dag)
+            self.node.dag.set_qhal(self.node.qhal)
+            self._current_dag_key = message.dag_factory.get_cache_key() if self.dag_cache_size > 0 else None
+            self._attach_dag(self.node.dag)
+
+            self.node.dag.start(created)
+            self.node.current_topology_id = message.topology_id
+            tracing.record(tracing.TraceEvent.DAG_PATCHED, device=self.node.device_id, value=message.topology_id)
         elif isinstance(message, ReplaceDAGMessage):
-            # replace the DAG of the node
+            # replace the DAG of the node (also when a patch is received and there is no DAG yet)
 
             if self.node.dag is not None:
-                self.node.dag.terminate()
-                self.node.dag.remove()
-            self.node.dag = message.dag_factory.create_dag()
-            self.node.dag.set_qhal(self.node.qhal)
-
-            # connect the new DAG to the qhal
-            self.node.add_subcomponent(self.node.dag.wrapping_node, name="dag")
-            for i in range(self.node.qhardware.num_qnics):
-                self.node.qhal.ports[f"token_out_{i}"].connect(self.node.dag.wrapping_node.ports[f"token_in_{i}"])
-            self.node.qhal.ports["tokens_ops"].connect(self.node.dag.wrapping_node.ports["tokens_ops_in"])
+                self._park_current_dag()
+            self.node.dag = self._get_dag(message.dag_factory)
+            self._attach_dag(self.node.dag)
 
             self.node.dag.start()
             self.node.current_topology_id = message.topology_id
+            tracing.record(tracing.TraceEvent.DAG_REPLACED, device=self.node.device_id, value=message.topology_id)
 
             # by default, also start the entanglement generation on all links (only the first time)
             # TODO: this should be specified in the ReplaceDAGMessage
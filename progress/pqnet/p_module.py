@@ -6,6 +6,7 @@ from abc import ABC, abstractmethod
 from collections import namedtuple
 import progress.progress_logging as log
 import progress.pqnet.messages as messages
+from progress import tracing
 
 import netsquid as ns
 
@@ -52,6 +53,9 @@ class Module(ns.nodes.Node):
         The number of output ports for tokens. It matches the number of outgoing edges of this module in the DAG.
     token_table : :class:`~progress.sockets.TokenTable`
         The token table to store and manage owned tokens.
+    direct_outputs : dict[int, :class:`~progress.pqnet.p_module.Module`] or None
+        If not `None`, promoted tokens are handed to the behavior of the downstream module connected to each output
+        port directly, without going through the ports. Set by :class:`~progress.pqnet.dag.DAG`.
     """
 
     def __init__(self, module_id, device_id, name, num_input, num_output, qhal=None):
@@ -79,6 +83,9 @@ class Module(ns.nodes.Node):
         self.token_table = TokenTable()
         # """The token table to store and manage owned tokens."""
 
+        self.direct_outputs = None
+        # """Downstream modules by output port, when tokens are dispatched directly."""
+
     def start(self):
         """
         Start the module behavior. Should be called after the qhal and behavior have been set.
@@ -95,6 +102,19 @@ class Module(ns.nodes.Node):
         self.behavior.stop()
         self.environment.stop()
 
+    def clear_state(self):
+        """
+        Bring the module back to its initial state, before starting it again. The token table is replaced with an empty
+        one, input tokens and messages still queued on the ports are dropped and the state of the behavior is cleared.
+        Should be called while the module is stopped.
+        """
+        self.token_table = TokenTable()
+        for port in self.ports.values():
+            while len(port.input_queue) > 0:
+                port.rx_input()
+        self.environment.clear_state()
+        self.behavior.clear_state()
+
 
 class ModuleBehavior(ns.protocols.ServiceProtocol, ABC):
     """
@@ -119,6 +139,13 @@ class ModuleBehavior(ns.protocols.ServiceProtocol, ABC):
 
     GARBAGE_COLLECTOR_PERIOD = 0.5  # ms
 
+    PASS_THROUGH = False
+    """
+    Whether the behavior promotes every input token, unchanged and without keeping any state, to its only output
+    port when the module has a single output. Such modules can be fused into direct edges by
+    :class:`~progress.pqnet.dag.DAGFactory` (see its `fuse_pass_through` parameter).
+    """
+
     def __init__(self, node, qnic=None, name=None):
         if name is None:
             name = "ModuleBehaviorProtocol for {}".format(node.name)
@@ -187,6 +214,22 @@ class ModuleBehavior(ns.protocols.ServiceProtocol, ABC):
                                               inner_message=message, topology_id=self.node.supercomponent.supercomponent.current_topology_id)
         self.node.ports["messages"].tx_output(wrapper)
 
+    def _send_token(self, token, output_port):
+        r"""
+        Hand a token to the module connected to an output port, either directly or through the port. A direct
+        hand-off runs the handler of the downstream behavior before returning, see :class:`~progress.pqnet.dag.DAG`.
+        """
+        tracing.record(tracing.TraceEvent.TOKEN_PROMOTED, device=self.node.device_id, module=self.node.module_id,
+                       socket=token.socket, other_end=token.other_end, value=output_port)
+        direct_outputs = self.node.direct_outputs
+        if direct_outputs is not None:
+            downstream = direct_outputs[output_port]
+            downstream.behavior.put(ModuleBehavior.req_handle_new_token(token=token))
+            # the downstream environment did not see the token, its garbage collection timer may be late
+            downstream.environment.notify_new_tokens()
+        else:
+            self.node.ports[f"out{output_port}"].tx_output(TokenMessage(token=token))
+
     def token_is_present(self, token):
         r"""
         Check if a token is mapped to a physical qubit.
@@ -220,7 +263,7 @@ class ModuleBehavior(ns.protocols.ServiceProtocol, ABC):
             req = self.node.qhal.token_api_service.req_free(token)
             self.node.qhal.token_api_service.put(req)
         else:
-            log.warning(f"tried to free a token that is not present: {token}", repeater_id=self.node.device_id,
+            log.warning("tried to free a token that is not present: %s", token, repeater_id=self.node.device_id,
                         protocol=self.node.name)
             # log.warning(str(self.node.qhal.socket_table))
 
@@ -234,6 +277,27 @@ class ModuleBehavior(ns.protocols.ServiceProtocol, ABC):
         for token in to_remove:
             self.free_token(token)
 
+    def next_expiry(self):
+        r"""
+        Get the earliest time at which garbage collection has something to collect. It is used by the "expiry"
+        garbage collection mode of :class:`~progress.pqnet.p_module.ModuleEnvironment`. Behaviors that collect more
+        than expired tokens in :meth:`_collect_garbage` should override it.
+
+        Returns
+        -------
+        float or None
+            The earliest pct of the owned tokens [ns]. `None` if the token table is empty.
+        """
+        return self.node.token_table.next_expiry()
+
+    def clear_state(self):
+        r"""
+        Clear the state of the behavior before the module is started again. This is called when a parked DAG is
+        reused (see :class:`~progress.pqnet.net_manager.NetManagerProtocol`). Behaviors that keep state across
+        events should override it.
+        """
+        self.last_garbage_collection = ns.sim_time()
+
     def terminate(self):
         r"""
         Clean up actions before terminating.
@@ -288,7 +352,7 @@ class ProcessingModuleBehavior(ModuleBehavior, ABC):
         self.node.token_table.pop_token(token.socket, raise_error=False)
 
         if self.node.num_output == 1:
-            self.node.ports["out0"].tx_output(TokenMessage(token=token))
+            self._send_token(token, 0)
         else:
             raise ValueError("Cannot promote a token from a module with no output")
 
@@ -332,6 +396,19 @@ class ProcessingModuleBehavior(ModuleBehavior, ABC):
         req = self.node.qhal.token_api_service.req_swap(self.node.module_id, token_a, token_b)
         self.node.qhal.token_api_service.put(req)
 
+    def swap_token_pairs(self, token_pairs):
+        r"""
+        Swap several pairs of tokens with a single operation on the quantum hardware. The response carries the list
+        of the swapping outcomes, in the order of the pairs.
+
+        Parameters
+        ----------
+        token_pairs : list of tuple
+            The pairs of tokens to swap, as `(token_a, token_b)` tuples.
+        """
+        req = self.node.qhal.token_api_service.req_swap_batch(self.node.module_id, list(token_pairs))
+        self.node.qhal.token_api_service.put(req)
+
     def correct_token(self, token):
         r"""
         Apply the correction circuit to a token to bring it back to :math:`\vert \phi^+ \rangle` Bell state from
@@ -384,7 +461,7 @@ class SchedulingModuleBehavior(ModuleBehavior, ABC):
         self.node.token_table.pop_token(token.socket, raise_error=False)
 
         if self.node.num_output > output_port:
-            self.node.ports[f"out{output_port}"].tx_output(TokenMessage(token))
+            self._send_token(token, output_port)
         else:
             raise ValueError("Cannot promote a token from a non-existing output port")
 
@@ -395,6 +472,19 @@ class ModuleEnvironment(ns.protocols.NodeProtocol):
         - receiving messages from the module
         - sending messages out of the module
         - calling behavior handlers (i.e. triggering its events)
+
+    Parameters
+    ----------
+    node : :class:`~progress.pqnet.p_module.Module`
+        The module that this environment is associated with.
+    name : str or None, optional
+        The name of the environment. If `None`, a default name is used. Defaults to `None`.
+    garbage_collection_mode : str or None, optional
+        How expired tokens are collected. With "periodic", garbage collection is triggered every
+        :attr:`GARBAGE_COLLECTION_PERIOD`. With "expiry", a single timer is scheduled at the earliest expiry reported
+        by the behavior (see :meth:`~progress.pqnet.p_module.ModuleBehavior.next_expiry`), and no timer is scheduled
+        while nothing can expire. If `None`,
+        :attr:`GARBAGE_COLLECTION_MODE` is used. Defaults to `None`.
     """
 
     GARBAGE_COLLECTION_PERIOD = .2  # ms
@@ -402,27 +492,109 @@ class ModuleEnvironment(ns.protocols.NodeProtocol):
     The period of garbage collection in ms.
     """
 
-    def __init__(self, node, name=None):
+    GARBAGE_COLLECTION_MODES = ("periodic", "expiry")
+    """
+    The supported garbage collection modes.
+    """
+
+    GARBAGE_COLLECTION_MODE = "periodic"
+    """
+    The default garbage collection mode.
+    """
+
+    RESCHEDULE_SIGNAL = "Reschedule garbage collection"
+    """
+    The signal that wakes up the environment to reschedule garbage collection in "expiry" mode.
+    """
+
+    def __init__(self, node, name=None, garbage_collection_mode=None):
         if name is None:
             name = "ModuleEnvironment for {}".format(node.name)
         super().__init__(node=node, name=name)
+        if garbage_collection_mode is None:
+            garbage_collection_mode = self.GARBAGE_COLLECTION_MODE
+        if garbage_collection_mode not in self.GARBAGE_COLLECTION_MODES:
+            raise ValueError(f"Garbage collection mode {garbage_collection_mode} not supported.")
+        self.garbage_collection_mode = garbage_collection_mode
+        self.next_garbage_collection = ns.sim_time() + self.GARBAGE_COLLECTION_PERIOD*1e6
+        # the time of the garbage collection timer the run loop is waiting for, if any
+        self._scheduled_gc_time = None
+        self.add_signal(self.RESCHEDULE_SIGNAL)
+
+        # the expression waiting for input on any port, built once. See _get_wait_ev_expr
+        self._wait_ev_expr = None
+        # port -> (order of handling, port name)
+        self._port_info = {}
+
+    def clear_state(self):
+        r"""
+        Restart the garbage collection period from the current simulation time.
+        """
         self.next_garbage_collection = ns.sim_time() + self.GARBAGE_COLLECTION_PERIOD*1e6
 
     def _get_wait_ev_expr(self):
-        ev_expr = self.await_port_input(self.node.ports["messages"])
-        for i in range(self.node.num_input):
-            ev_expr |= self.await_port_input(self.node.ports["in{}".format(i)])
+        r"""
+        Get the expression waiting for input on any port of the module. The ports of a module never change, so the
+        expression is built on the first call and only reset afterwards.
+        """
+        if self._wait_ev_expr is not None:
+            self._wait_ev_expr.reset()
+            return self._wait_ev_expr
+        port_names = ["messages"] + ["in{}".format(i) for i in range(self.node.num_input)]
+        ev_expr = None
+        for i, port_name in enumerate(port_names):
+            port = self.node.ports[port_name]
+            # input ports are handled from the last to the first, then messages
+            self._port_info[port] = (len(port_names) - i, port_name)
+            port_ev_expr = self.await_port_input(port)
+            ev_expr = port_ev_expr if ev_expr is None else ev_expr | port_ev_expr
+        self._wait_ev_expr = ev_expr
         return ev_expr
 
     def _get_triggered_ports(self, ev_expr):
-        port_names = []
-        for i in range(self.node.num_input - 1, -1, -1):
-            if ev_expr.second_term.value:
-                port_names.append("in{}".format(i))
-            ev_expr = ev_expr.first_term
-        if ev_expr.value:
-            port_names.append("messages")
-        return port_names
+        r"""
+        Get the names of the ports that triggered `ev_expr`, from the events that fired. Events that do not come from
+        a port of the module (e.g. the garbage collection timer) are ignored.
+        """
+        triggered = []
+        for event in ev_expr.triggered_events:
+            port_info = self._port_info.get(event.source)
+            if port_info is not None and port_info not in triggered:
+                triggered.append(port_info)
+        if len(triggered) > 1:
+            triggered.sort()
+        return [port_name for _, port_name in triggered]
+
+    def _get_garbage_collection_time(self):
+        r"""
+        Get the time at which the next garbage collection should take place.
+
+        Returns
+        -------
+        float or None
+            The time of the next garbage collection [ns]. `None` if no garbage collection is needed.
+        """
+        if self.garbage_collection_mode == "periodic":
+            return self.next_garbage_collection
+        next_expiry = self.node.behavior.next_expiry()
+        if next_expiry is None:
+            return None
+        # tokens with no coherence time have pct 0 and are collected right away, as in periodic mode
+        return max(next_expiry, ns.sim_time())
+
+    def notify_new_tokens(self):
+        r"""
+        Notify the environment that tokens were added to the token table without going through its ports, e.g. by
+        direct dispatch (see :class:`~progress.pqnet.dag.DAG`). In "expiry" mode, the environment is woken up to
+        reschedule garbage collection if a token expires before the current timer. It has no effect otherwise.
+        """
+        if self.garbage_collection_mode != "expiry" or not self.is_running:
+            return
+        gc_time = self._get_garbage_collection_time()
+        if gc_time is not None and (self._scheduled_gc_time is None or gc_time < self._scheduled_gc_time):
+            # signal only once until the run loop picks the new time up
+            self._scheduled_gc_time = gc_time
+            self.send_signal(self.RESCHEDULE_SIGNAL)
 
     def run(self):
         r"""
@@ -433,16 +605,24 @@ class ModuleEnvironment(ns.protocols.NodeProtocol):
         """
         while True:
             # wait for a message on any input port (tokens or messages)
-            ev_expr = yield self._get_wait_ev_expr() | self.await_timer(end_time=self.next_garbage_collection)
-            if ev_expr.first_term.value:
-                port_names = self._get_triggered_ports(ev_expr.first_term)
+            gc_time = self._scheduled_gc_time = self._get_garbage_collection_time()
+            ev_expr = self._get_wait_ev_expr()
+            if self.garbage_collection_mode == "expiry":
+                ev_expr = ev_expr | self.await_signal(self, self.RESCHEDULE_SIGNAL)
+            if gc_time is not None:
+                # if nothing can expire, there is no need for a timer
+                ev_expr = ev_expr | self.await_timer(end_time=gc_time)
+            ev_expr = yield ev_expr
+            port_names = self._get_triggered_ports(ev_expr)
+            if len(port_names) > 0:
                 for port_name in port_names:
                     if port_name == "messages":
                         self._handle_message()
                     else:
                         self._handle_new_token(port_name)
-            else:
+            elif gc_time is not None and ns.sim_time() >= gc_time:
                 self._handle_collect_garbage()
+            # otherwise, the timer is rescheduled at the next iteration
 
     def _handle_message(self):
         while len(self.node.ports["messages"].input_queue) > 0:
@@ -1,10 +1,12 @@
 """
 Some popular, ready-to-use, module behaviors for the DAG
 """
+import heapq
+
 import netsquid as ns
 from progress.pqnet.p_module import ProcessingModuleBehavior, SchedulingModuleBehavior
-from progress.sockets import Token
-import progress.progress_logging as log
+from progress.sockets import Token, get_state_after_swap
+from progress import metrics, tracing
 
 __all__ = ["WaitForSwappingModuleBehavior", "EntanglementSwappingModuleBehavior", "FreeEverythingModuleBehavior",
            "RoundRobinSchedulingModuleBehavior", "ShortCircuitModuleBehavior", "DEJMPSModuleBehavior"]
@@ -15,7 +17,12 @@ class EntanglementSwappingModuleBehavior(ProcessingModuleBehavior):
     This class implements the behavior of a module that performs the entanglement swapping protocol.
     """
 
-    def __init__(self, dest_devices, dest_module_ids, name, node, qnic=None):
+    FLUSH_SWAPS_SIGNAL = "flush_swaps"
+    """
+    Label used to submit the swaps coalesced during the current simulation timestamp.
+    """
+
+    def __init__(self, dest_devices, dest_module_ids, name, node, qnic=None, coalesce=False):
         r"""
         Initialize the behavior of the module.
 
@@ -35,15 +42,60 @@ class EntanglementSwappingModuleBehavior(ProcessingModuleBehavior):
             The module that this behavior is attached to
         qnic : int or None, optional
             See :class:`~progress.pqnet.p_module.ModuleBehavior`.
+        coalesce : bool, optional
+            If `True`, the pairs of tokens matched during the same simulation timestamp are swapped together with a
+            single batched request to the QHAL, instead of one request per pair. Defaults to `False`.
         """
         self.dest_devices = dest_devices
         self.dest_module_ids = dest_module_ids
         self._swapped_ends = dest_devices
+        self.coalesce = coalesce
+        # device -> destination module id, for each pool
+        self._dest_module_id_maps = tuple(dict(zip(devices, module_ids))
+                                          for devices, module_ids in zip(dest_devices, dest_module_ids))
+        self._pending_pairs = []
         super().__init__(name=name, node=node, qnic=qnic)
+        self.add_signal(self.FLUSH_SWAPS_SIGNAL)
+
+    def run(self):
+        r"""
+        Submit the coalesced swaps once the tokens arrived at the current simulation timestamp have been matched.
+
+        References
+        ----------
+
+        See :meth:`netsquid.protocols.Protocol.run`.
+        """
+        while True:
+            yield self.await_signal(self, self.FLUSH_SWAPS_SIGNAL)
+            self._flush_pending_pairs()
+
+    def _flush_pending_pairs(self):
+        pairs = self._pending_pairs
+        self._pending_pairs = []
+        if len(pairs) == 1:
+            self.swap_tokens(*pairs[0])
+        elif len(pairs) > 1:
+            self.swap_token_pairs(pairs)
+
+    def clear_state(self):
+        super().clear_state()
+        self._pending_pairs = []
+
+    def _request_swap(self, token_a, token_b):
+        tracing.record(tracing.TraceEvent.SWAP_ISSUED, device=self.node.device_id, module=self.node.module_id,
+                       socket=token_a.socket, other_end=token_b.socket)
+        if not self.coalesce:
+            self.swap_tokens(token_a, token_b)
+            return
+        self._pending_pairs.append((token_a, token_b))
+        if len(self._pending_pairs) == 1:
+            # the signal is delivered after the events already scheduled at this timestamp
+            self.send_signal(self.FLUSH_SWAPS_SIGNAL)
 
     def handle_new_token(self, request):
         token = request.token
-        target_pool_index = 0 if token.other_end.node in self.dest_devices[1] else 1
+        target_pool_index = 0 if token.other_end.node in self._dest_module_id_maps[1] else 1
         target_pool = self.dest_devices[target_pool_index]
 
         # look in the token table for a token that is waiting to be swapped
@@ -57,31 +109,9 @@ class EntanglementSwappingModuleBehavior(ProcessingModuleBehavior):
 
         # request entanglement swapping
         if target_pool_index == 1:
-            self.swap_tokens(token, target_token)
+            self._request_swap(token, target_token)
         else:
-            self.swap_tokens(target_token, token)
-
-    @staticmethod
-    def _get_state_after_swap(old_state_a, old_state_b, outcome):
-        x_corr = 0
-        z_corr = 0
-        if old_state_a >= 2:
-            z_corr += 1
-        if old_state_b >= 2:
-            z_corr += 1
-        if outcome >= 2:
-            z_corr += 1
-
-        if old_state_a % 2 != 0:
-            x_corr += 1
-        if old_state_b % 2 != 0:
-            x_corr += 1
-        if outcome % 2 != 0:
-            x_corr += 1
-
-        x_corr %= 2
-        z_corr %= 2
-        return z_corr * 2 + x_corr
+            self._request_swap(target_token, token)
 
     def handle_response(self, request):
         # the response is the outcome of the entanglement swapping protocol
@@ -89,29 +119,29 @@ class EntanglementSwappingModuleBehavior(ProcessingModuleBehavior):
         # assert request.request.__name__ == "req_swap"
         # tokens have already been freed by the swapping protocol. no need to check them out again
         # send the outcome to the destination module
-        outcome = request.response
-        # the INSTR_BELL_MEASURE outcome does not exactly match bell states indices.
-        if outcome == 3:
-            outcome = 2
-        elif outcome == 2:
-            outcome = 3
+        if hasattr(request.request, "token_pairs"):
+            # batched swap: one outcome per pair
+            for (token_a, token_b), outcome in zip(request.request.token_pairs, request.response):
+                self._send_swap_outcome(token_a, token_b, outcome)
+        else:
+            self._send_swap_outcome(request.request.token1, request.request.token2, request.response)
 
+    def _send_swap_outcome(self, token_a, token_b, outcome):
         # print("Device: {}, swapping outcome: {}".format(self.node.device_id, outcome))  # DEBUG
 
-        # get the new state of the token
-        new_state = self._get_state_after_swap(request.request.token1.current_state,
-                                               request.request.token2.current_state,
-                                               outcome)
-        new_pct = min(request.request.token1.pct, request.request.token2.pct)
+        # get the new state of the token (the lookup also maps the INSTR_MEASURE_BELL outcome to a Bell state index)
+        new_state = get_state_after_swap(token_a.current_state, token_b.current_state, outcome)
+        new_pct = min(token_a.pct, token_b.pct)
+        tracing.record(tracing.TraceEvent.SWAP_COMPLETED, device=self.node.device_id, module=self.node.module_id,
+                       socket=token_a.other_end, other_end=token_b.other_end, value=new_state)
 
-        message = ns.components.Message(items=[request.request.token1.other_end,
-                                               request.request.token2.other_end,
-                                               new_state, new_pct], header="swapping_outcome")
+        message = ns.components.Message(items=[token_a.other_end, token_b.other_end, new_state, new_pct],
+                                        header="swapping_outcome")
 
-        dest_device_a = request.request.token1.other_end.node
-        dest_module_id_a = self.dest_module_ids[0][self.dest_devices[0].index(dest_device_a)]
-        dest_device_b = request.request.token2.other_end.node
-        dest_module_id_b = self.dest_module_ids[1][self.dest_devices[1].index(dest_device_b)]
+        dest_device_a = token_a.other_end.node
+        dest_module_id_a = self._dest_module_id_maps[0][dest_device_a]
+        dest_device_b = token_b.other_end.node
+        dest_module_id_b = self._dest_module_id_maps[1][dest_device_b]
 
         # DEBUG
         """
@@ -137,6 +167,12 @@ class WaitForSwappingModuleBehavior(SchedulingModuleBehavior):
     Label used to signal that a token has been captured.
     """
 
+    NEW_TOKEN_FIELDS = ("time", "other_node", "created_at")
+    """
+    The fields of the records published on the ``NEW_TOKEN_SIGNAL`` channel of the active
+    :class:`~progress.metrics.MetricsBus`.
+    """
+
     def __init__(self, name, node, output_map=None, qnic=None, collect_stats=False):
         r"""
         Initialize the behavior of the module.
@@ -153,15 +189,71 @@ class WaitForSwappingModuleBehavior(SchedulingModuleBehavior):
         qnic : int or None, optional
             See :class:`~progress.pqnet.p_module.ModuleBehavior`.
         collect_stats : bool, optional
-            Whether to collect statistics about the module's behavior.
+            Whether to collect statistics about the module's behavior. If a :class:`~progress.metrics.MetricsBus`
+            is installed, a record is published on it for each captured token, otherwise the ``NEW_TOKEN_SIGNAL``
+            signal is sent.
         """
         super().__init__(name=name, node=node, qnic=qnic)
         self.output_map = output_map
         self.collect_stats = collect_stats
-        self.pending_requests = []
+        # local socket -> (sequence number, swapping outcome request) waiting for the token on that socket
+        self.pending_requests = {}
+        # heap of (pct, sequence number, local socket), to drop pending outcomes once they expire
+        self._pending_expiries = []
+        self._pending_seq = 0
         if collect_stats:
             self.add_signal(self.NEW_TOKEN_SIGNAL, self.NEW_TOKEN_EVT_TYPE)
 
+    def clear_state(self):
+        super().clear_state()
+        self.pending_requests = {}
+        self._pending_expiries = []
+
+    def _get_local_end(self, request):
+        end_a = request.message.items[0]
+        end_b = request.message.items[1]
+        return end_a if end_a.node == self.node.device_id else end_b
+
+    def _add_pending_request(self, request):
+        self._drop_expired_pending_requests(ns.sim_time())
+        local_end = self._get_local_end(request)
+        seq = self._pending_seq
+        self._pending_seq += 1
+        # a newer outcome for the same socket supersedes the older one
+        self.pending_requests[local_end] = (seq, request)
+        heapq.heappush(self._pending_expiries, (request.message.items[3], seq, local_end))
+
+    def _drop_expired_pending_requests(self, current_time):
+        while len(self._pending_expiries) > 0 and self._pending_expiries[0][0] <= current_time:
+            _, seq, local_end = heapq.heappop(self._pending_expiries)
+            entry = self.pending_requests.get(local_end)
+            if entry is not None and entry[0] == seq:
+                del self.pending_requests[local_end]
+
+    def _collect_garbage(self, request):
+        r"""
+        Collect expired tokens, as well as pending swapping outcomes whose pct has passed.
+
+        See Also
+        --------
+        :meth:`~progress.pqnet.p_module.ModuleBehavior._collect_garbage`
+        """
+        super()._collect_garbage(request)
+        self._drop_expired_pending_requests(ns.sim_time())
+
+    def next_expiry(self):
+        r"""
+        Get the earliest time at which a token or a pending swapping outcome expires.
+
+        See Also
+        --------
+        :meth:`~progress.pqnet.p_module.ModuleBehavior.next_expiry`
+        """
+        next_expiry = super().next_expiry()
+        if len(self._pending_expiries) > 0 and (next_expiry is None or self._pending_expiries[0][0] < next_expiry):
+            next_expiry = self._pending_expiries[0][0]
+        return next_expiry
+
     def _process_request(self, request):
         # get the two ends that were swapped
         end_a = request.message.items[0]
@@ -169,7 +261,7 @@ class WaitForSwappingModuleBehavior(SchedulingModuleBehavior):
         new_pct = request.message.items[3]
         new_state = request.message.items[2]
         # check which end is the local end
-        local_end = end_a if end_a.node == self.node.device_id else end_b
+        local_end = self._get_local_end(request)
         # check which end is the remote end
         remote_end = end_a if end_a.node != self.node.device_id else end_b
         # get the token for the local end
@@ -197,25 +289,26 @@ class WaitForSwappingModuleBehavior(SchedulingModuleBehavior):
 
         result = self._process_request(request)
         if not result:
-            self.pending_requests.append(request)
+            self._add_pending_request(request)
 
     def handle_new_token(self, request):
         # simply store the token in the token table
         if self.collect_stats:
-            sig_result = (ns.sim_time(), request.token.other_end.node, request.token.socket.created_at, request.token)
-            self.send_signal(self.NEW_TOKEN_SIGNAL, sig_result)
+            bus = metrics.get_metrics_bus()
+            if bus is not None:
+                bus.get_channel(self.NEW_TOKEN_SIGNAL, self.NEW_TOKEN_FIELDS).publish(
+                    ns.sim_time(), request.token.other_end.node, request.token.socket.created_at)
+            else:
+                sig_result = (ns.sim_time(), request.token.other_end.node, request.token.socket.created_at,
+                              request.token)
+                self.send_signal(self.NEW_TOKEN_SIGNAL, sig_result)
 
         self.node.token_table.add_token(request.token)
 
-        # check if there are pending requests for this token
-        for pending_request in self.pending_requests:
-            end_a = pending_request.message.items[0]
-            end_b = pending_request.message.items[1]
-            local_end = end_a if end_a.node == self.node.device_id else end_b
-            if local_end == request.token.socket:
-                result = self._process_request(pending_request)
-                if result:
-                    self.pending_requests.remove(pending_request)
+        # check if there is a pending request for this token
+        entry = self.pending_requests.get(request.token.socket)
+        if entry is not None and self._process_request(entry[1]):
+            del self.pending_requests[request.token.socket]
 
     def handle_response(self, request):
         raise NotImplementedError("This module does not receive responses")
@@ -251,6 +344,10 @@ class DEJMPSModuleBehavior(ProcessingModuleBehavior):
         self._stored_outcomes = {}
         super().__init__(name=name, node=node, qnic=qnic)
 
+    def clear_state(self):
+        super().clear_state()
+        self._stored_outcomes = {}
+
     def handle_new_token(self, request):
         r"""
         If the module is the solicitor, it must check whether a new distillation can be carried out.
@@ -301,6 +398,8 @@ class DEJMPSModuleBehavior(ProcessingModuleBehavior):
         other_end_a = request.request.token1.other_end
         other_end_b = request.request.token2.other_end
         local_end_a = request.request.token1.socket
+        tracing.record(tracing.TraceEvent.DEJMPS_OUTCOME, device=self.node.device_id, module=self.node.module_id,
+                       socket=local_end_a, other_end=other_end_a, value=outcome)
 
         """
         # DEBUG
@@ -402,6 +501,8 @@ class RoundRobinSchedulingModuleBehavior(SchedulingModuleBehavior):
     scheduling of tokens among output ports.
     """
 
+    PASS_THROUGH = True
+
     def __init__(self, name, node, qnic=None):
         r"""
         Initialize the behavior of the module.
@@ -418,6 +519,10 @@ class RoundRobinSchedulingModuleBehavior(SchedulingModuleBehavior):
         super().__init__(name=name, node=node, qnic=qnic)
         self._next_out_index = 0
 
+    def clear_state(self):
+        super().clear_state()
+        self._next_out_index = 0
+
     def _get_next_out_idx(self, token=None):
         if token is None:
             ret = self._next_out_index
@@ -480,7 +585,11 @@ class FreeEverythingModuleBehavior(ProcessingModuleBehavior):
     qnic : int or None, optional
         See :class:`~progress.pqnet.p_module.ModuleBehavior`.
     collect_stats : bool, optional
-        Whether to collect statistics about the freed tokens.
+        Whether to collect statistics about the freed tokens. The fidelity of each token is read through
+        :meth:`~progress.hardware.qhardware.QHardware.get_fidelity`, and it is `None` for the tokens skipped by the
+        sampling period of the :class:`~progress.hardware.qhardware.FidelityEstimator`. If a
+        :class:`~progress.metrics.MetricsBus` is installed, a record is published on it for each freed token (with a
+        NaN fidelity if skipped), otherwise the ``FREED_TOKEN_SIGNAL`` signal is sent.
     """
 
     FREED_TOKEN_SIGNAL = "freed_token"
@@ -489,6 +598,12 @@ class FreeEverythingModuleBehavior(ProcessingModuleBehavior):
     Label used to signal that a token has been freed.
     """
 
+    FREED_TOKEN_FIELDS = ("time", "node", "other_node", "fid_sq", "slot_id")
+    """
+    The fields of the records published on the ``FREED_TOKEN_SIGNAL`` channel of the active
+    :class:`~progress.metrics.MetricsBus`.
+    """
+
     def __init__(self, name, node, qnic=None, collect_stats=False):
         super().__init__(name=name, node=node, qnic=qnic)
         self.collect_stats = collect_stats
@@ -506,15 +621,20 @@ class FreeEverythingModuleBehavior(ProcessingModuleBehavior):
         # log.info("Freeing token {}".format(request.token), repeater_id=self.node.device_id)
         if self.collect_stats:
 
-            # peek at the qubits inside the quantum memory (simulation cheat)
+            # read the fidelity from the quantum hardware (simulation cheat). It is None if skipped by sampling
             qhardware = self.node.supercomponent.supercomponent.qhardware
-            position = qhardware.map_info_to_qubit(request.token.socket.qnic, request.token.socket.idx)
-            qubits = qhardware.qmemory.peek(position)[0].qstate.qubits
-            fid_sq = self._compute_fidelity(qubits, request.token.current_state)
+            fid_sq = qhardware.get_fidelity(request.token.socket.qnic, request.token.socket.idx,
+                                            request.token.current_state)
             slot_id = self.node.supercomponent.supercomponent.current_topology_id
 
-            sig_result = (ns.sim_time(), request.token, fid_sq, slot_id)
-            self.send_signal(self.FREED_TOKEN_SIGNAL, sig_result)
+            bus = metrics.get_metrics_bus()
+            if bus is not None:
+                bus.get_channel(self.FREED_TOKEN_SIGNAL, self.FREED_TOKEN_FIELDS).publish(
+                    ns.sim_time(), request.token.socket.node, request.token.other_end.node,
+                    float("nan") if fid_sq is None else fid_sq, slot_id)
+            else:
+                sig_result = (ns.sim_time(), request.token, fid_sq, slot_id)
+                self.send_signal(self.FREED_TOKEN_SIGNAL, sig_result)
         self.free_token(request.token)
 
     def handle_response(self, request):
@@ -537,42 +657,6 @@ class FreeEverythingModuleBehavior(ProcessingModuleBehavior):
         """
         raise NotImplementedError(f"[Device {self.node.device_id}] This module ({self.node.module_id}) does not receive messages")
 
-    def _compute_fidelity(self, qubits, bell_state):
-        """
-        Compute the fidelity of the given qubits with the given bell state index reference.
-        """
-        if len(qubits) == 2:
-            if bell_state == 0:
-                fid_sq = ns.qubits.fidelity(
-                    qubits,
-                    reference_state=ns.qubits.ketstates.b00,
-                    squared=True)
-            elif bell_state == 1:
-                fid_sq = ns.qubits.fidelity(
-                    qubits,
-                    reference_state=ns.qubits.ketstates.b01,
-                    squared=True)
-            elif bell_state == 2:
-                fid_sq = ns.qubits.fidelity(
-                    qubits,
-                    reference_state=ns.qubits.ketstates.b10,
-                    squared=True)
-            elif bell_state == 3:
-                fid_sq = ns.qubits.fidelity(
-                    qubits,
-                    reference_state=ns.qubits.ketstates.b11,
-                    squared=True)
-            else:
-                log.error('Unknown bell state {} delivered'.format(bell_state),
-                          repeater_id=self.end_nodes[0])
-                fid_sq = -1
-        else:
-            fid_sq = 0.
-
-        # print("qubits state:", qubits[0].qstate.qrepr, "bell state:", bell_state, "fid:", fid_sq)
-
-        return fid_sq
-
 
 class ShortCircuitModuleBehavior(SchedulingModuleBehavior):
     r"""
@@ -588,6 +672,8 @@ class ShortCircuitModuleBehavior(SchedulingModuleBehavior):
         See :class:`~progress.pqnet.p_module.ModuleBehavior`.
     """
 
+    PASS_THROUGH = True
+
     def __init__(self, name, node, qnic=None):
         super().__init__(name=name, node=node, qnic=qnic)
 
@@ -1,9 +1,19 @@
-"""This module implements a specific logging API tuned for Quantum Internet simulations on Netsquid."""
+"""This module implements a specific logging API tuned for Quantum Internet simulations on Netsquid.
+
+Log entries are built lazily: the simulation time and the additional info are only computed if the logger is
+enabled for the level of the entry, and the message is formatted %-style with the extra positional arguments only
+when a handler emits it, e.g. ``info("Received %d tokens", num_tokens, repeater_id=0)``.
+
+Logging can also be switched off entirely with :func:`set_logging_enabled`, or by setting the environment variable
+``PROGRESS_LOGGING_OFF=1`` before importing the package. The logging functions are then replaced by no-ops.
+"""
 
-import netsquid as ns
 import logging
+import os
 
-__all__ = ["log_to_console", "log_to_file", "set_log_level",
+import netsquid as ns
+
+__all__ = ["log_to_console", "log_to_file", "set_log_level", "set_logging_enabled", "is_enabled_for",
            "remove_console_log", "debug", "info", "warning", "error", "critical"]
 
 
@@ -106,6 +116,41 @@ def set_log_level(level):
         handler.setLevel(level)
 
 
+def is_enabled_for(level):
+    """Check whether a log entry with the given level would be processed. Use it to guard the computation of
+    expensive arguments.
+
+    Parameters
+    ----------
+    level : int
+        The log level of the entry.
+
+    Returns
+    -------
+    bool
+        `True` if logging is enabled and the logger accepts entries of this level, `False` otherwise.
+    """
+    return _logging_enabled and logger.isEnabledFor(level)
+
+
+def set_logging_enabled(enabled):
+    """Switch the logging functions of this module on or off. When off, :func:`debug`, :func:`info`,
+    :func:`warning`, :func:`error` and :func:`critical` are replaced by no-ops, so a call only costs the evaluation
+    of its arguments. Callers must access them as module attributes (e.g. ``log.info``) for the switch to apply.
+
+    Parameters
+    ----------
+    enabled : bool
+        Whether logging should be enabled.
+    """
+    global _logging_enabled, debug, info, warning, error, critical
+    _logging_enabled = enabled
+    if enabled:
+        debug, info, warning, error, critical = _LOG_FUNCTIONS
+    else:
+        debug = info = warning = error = critical = _no_log
+
+
 def remove_console_log():
     """Remove the console log handler."""
     h = None
@@ -117,14 +162,17 @@ def remove_console_log():
         logger.removeHandler(h)
 
 
-def debug(message, repeater_id=None, protocol=None, protocol_state=None):
+def debug(message, *args, repeater_id=None, protocol=None, protocol_state=None):
     """Log a message with level DEBUG on the logger.
 
     Parameters
     ----------
     message : str
         The message to be logged. It should not contain the current simulation time because it is already
-        present in the log format.
+        present in the log format. It may contain %-style placeholders, filled with `args` only if the entry is
+        emitted.
+    *args
+        The arguments merged into `message`.
     repeater_id : int or None optional
         If not None, an additional string is added to the log entry, containing the components.rst identifier.
     protocol : str or None, optional
@@ -132,20 +180,21 @@ def debug(message, repeater_id=None, protocol=None, protocol_state=None):
     protocol_state : str or None, optional
         If not None, an additional string is added to the log entry, containing the provided protocols state.
     """
-    log_message = f"[{ns.sim_time()}]::DEBUG::"
-    log_message += _get_additional_info(repeater_id, protocol, protocol_state)
-    log_message += (" " + message)
-    logger.debug(log_message)
+    if logger.isEnabledFor(logging.DEBUG):
+        _log(logging.DEBUG, "DEBUG", message, args, repeater_id, protocol, protocol_state)
 
 
-def info(message, repeater_id=None, protocol=None, protocol_state=None):
+def info(message, *args, repeater_id=None, protocol=None, protocol_state=None):
     """Log a message with level INFO on the logger.
 
     Parameters
     ----------
     message : str
         The message to be logged. It should not contain the current simulation time because it is already
-        present in the log format.
+        present in the log format. It may contain %-style placeholders, filled with `args` only if the entry is
+        emitted.
+    *args
+        The arguments merged into `message`.
     repeater_id : int or None, optional
         If not None, an additional string is added to the log entry, containing the components.rst identifier.
     protocol : str or None, optional
@@ -153,20 +202,21 @@ def info(message, repeater_id=None, protocol=None, protocol_state=None):
     protocol_state : str or None, optional
         If not None, an additional string is added to the log entry, containing the provided protocols state.
     """
-    log_message = f"[{ns.sim_time()}]::INFO::"
-    log_message += _get_additional_info(repeater_id, protocol, protocol_state)
-    log_message += (" " + message)
-    logger.info(log_message)
+    if logger.isEnabledFor(logging.INFO):
+        _log(logging.INFO, "INFO", message, args, repeater_id, protocol, protocol_state)
 
 
-def warning(message, repeater_id=None, protocol=None, protocol_state=None):
+def warning(message, *args, repeater_id=None, protocol=None, protocol_state=None):
     """Log a message with level WARNING on the logger.
 
     Parameters
     ----------
     message : str
         The message to be logged. It should not contain the current simulation time because it is already
-        present in the log format.
+        present in the log format. It may contain %-style placeholders, filled with `args` only if the entry is
+        emitted.
+    *args
+        The arguments merged into `message`.
     repeater_id : int or None, optional
         If not None, an additional string is added to the log entry, containing the components.rst identifier.
     protocol : str or None, optional
@@ -174,20 +224,21 @@ def warning(message, repeater_id=None, protocol=None, protocol_state=None):
     protocol_state : str or None, optional
         If not None, an additional string is added to the log entry, containing the provided protocols state.
     """
-    log_message = f"[{ns.sim_time()}]::WARNING::"
-    log_message += _get_additional_info(repeater_id, protocol, protocol_state)
-    log_message += (" " + message)
-    logger.warning(log_message)
+    if logger.isEnabledFor(logging.WARNING):
+        _log(logging.WARNING, "WARNING", message, args, repeater_id, protocol, protocol_state)
 
 
-def error(message, repeater_id=None, protocol=None, protocol_state=None):
+def error(message, *args, repeater_id=None, protocol=None, protocol_state=None):
     """Log a message with level ERROR on the logger.
 
     Parameters
     ----------
     message : str
         The message to be logged. It should not contain the current simulation time because it is already
-        present in the log format.
+        present in the log format. It may contain %-style placeholders, filled with `args` only if the entry is
+        emitted.
+    *args
+        The arguments merged into `message`.
     repeater_id : int or None, optional
         If not None, an additional string is added to the log entry, containing the components.rst identifier.
     protocol : str or None, optional
@@ -195,20 +246,21 @@ def error(message, repeater_id=None, protocol=None, protocol_state=None):
     protocol_state : str or None, optional
         If not None, an additional string is added to the log entry, containing the provided protocols state.
     """
-    log_message = f"[{ns.sim_time()}]::ERROR::"
-    log_message += _get_additional_info(repeater_id, protocol, protocol_state)
-    log_message += (" " + message)
-    logger.error(log_message)
+    if logger.isEnabledFor(logging.ERROR):
+        _log(logging.ERROR, "ERROR", message, args, repeater_id, protocol, protocol_state)
 
 
-def critical(message, repeater_id=None, protocol=None, protocol_state=None):
+def critical(message, *args, repeater_id=None, protocol=None, protocol_state=None):
     """Log a message with level CRITICAL on the logger.
 
     Parameters
     ----------
     message : str
         The message to be logged. It should not contain the current simulation time because it is already
-        present in the log format.
+        present in the log format. It may contain %-style placeholders, filled with `args` only if the entry is
+        emitted.
+    *args
+        The arguments merged into `message`.
     repeater_id : int or None, optional
         If not None, an additional string is added to the log entry, containing the components.rst identifier.
     protocol : str or None, optional
@@ -216,10 +268,8 @@ def critical(message, repeater_id=None, protocol=None, protocol_state=None):
     protocol_state : str or None, optional
         If not None, an additional string is added to the log entry, containing the provided protocols state.
     """
-    log_message = f"[{ns.sim_time()}]::CRITICAL_ERROR::"
-    log_message += _get_additional_info(repeater_id, protocol, protocol_state)
-    log_message += (" " + message)
-    logger.critical(log_message)
+    if logger.isEnabledFor(logging.CRITICAL):
+        _log(logging.CRITICAL, "CRITICAL_ERROR", message, args, repeater_id, protocol, protocol_state)
 
 
 def _get_additional_info(repeater_id=None, protocol=None, protocol_state=None):
@@ -231,3 +281,21 @@ def _get_additional_info(repeater_id=None, protocol=None, protocol_state=None):
     if protocol_state is not None:
         log_message += f"STATE {protocol_state}::"
     return log_message
+
+
+def _log(level, level_name, message, args, repeater_id, protocol, protocol_state):
+    prefix = f"[{ns.sim_time()}]::{level_name}::" + _get_additional_info(repeater_id, protocol, protocol_state)
+    if args:
+        # the prefix must not be interpreted as a format string when the message is merged with its arguments
+        prefix = prefix.replace("%", "%%")
+    logger.log(level, prefix + " " + message, *args)
+
+
+def _no_log(message, *args, repeater_id=None, protocol=None, protocol_state=None):
+    pass
+
+
+_LOG_FUNCTIONS = (debug, info, warning, error, critical)
+_logging_enabled = True
+if os.environ.get("PROGRESS_LOGGING_OFF", "0").lower() not in ("", "0", "false", "no"):
+    set_logging_enabled(False)
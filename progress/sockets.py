@@ -4,11 +4,13 @@ that are used to represent qubits. Tokens are the external abstraction of qubits
 A token is created when Link Layer protocols signal the generation of a new entangled pair.
 """
 
+import heapq
 from collections import namedtuple
 
 import netsquid as ns
 
-__all__ = ['Socket', 'Token', 'TokenTable', 'TokenMessage']
+__all__ = ['Socket', 'Token', 'TokenTable', 'TokenMessage', 'BELL_STATE_FROM_MEASUREMENT', 'SWAP_FRAME_TABLE',
+           'compose_bell_states', 'bell_state_from_measurement', 'get_state_after_swap', 'get_pauli_corrections']
 
 
 # Socket = namedtuple('Socket', ['node', 'interface', 'idx'])
@@ -26,39 +28,66 @@ class Socket:
         The interface the qubit is assigned on.
     idx : int
         The index of the qubit on the interface.
+    created_at : float or None, optional
+        The simulation time at which the socket was created [ns]. If `None`, the current simulation time is used.
+        Defaults to `None`.
+
+    Notes
+    -----
+    Sockets are immutable. Their fields are stored in slots and the hash is computed once at construction, as
+    sockets are used as keys in token tables, socket tables and in the state of many module behaviors.
     """
     __name__ = 'Socket'
 
-    _inner_tuple = namedtuple('Socket', ['node', 'qnic', 'idx', 'created_at'])
+    __slots__ = ('node', 'qnic', 'idx', 'created_at', '_key', '_hash')
 
-    def __init__(self, node, qnic, idx):
-        self._data = self._inner_tuple(node, qnic, idx, ns.sim_time())
+    _inner_tuple = namedtuple('Socket', ['node', 'qnic', 'idx', 'created_at'])
 
-    @property
-    def node(self):
-        return self._data.node
+    def __init__(self, node, qnic, idx, created_at=None):
+        if created_at is None:
+            created_at = ns.sim_time()
+        key = (node, qnic, idx, created_at)
+        object.__setattr__(self, 'node', node)
+        object.__setattr__(self, 'qnic', qnic)
+        object.__setattr__(self, 'idx', idx)
+        object.__setattr__(self, 'created_at', created_at)
+        object.__setattr__(self, '_key', key)
+        object.__setattr__(self, '_hash', hash(key))
 
     @property
-    def qnic(self):
-        return self._data.qnic
+    def _data(self):
+        return self._inner_tuple(*self._key)
 
-    @property
-    def idx(self):
-        return self._data.idx
+    def __setattr__(self, name, value):
+        raise AttributeError("Socket objects are immutable.")
 
-    @property
-    def created_at(self):
-        return self._data.created_at
+    def __delattr__(self, name):
+        raise AttributeError("Socket objects are immutable.")
 
     def __eq__(self, other):
-        return self.node == other.node and self.qnic == other.qnic and self.idx == other.idx and \
-               self.created_at == other.created_at
+        if not isinstance(other, Socket):
+            return NotImplemented
+        return self._key == other._key
+
+    def __ne__(self, other):
+        if not isinstance(other, Socket):
+            return NotImplemented
+        return self._key != other._key
 
     def __repr__(self):
         return f"Socket(node={self.node}, interface={self.qnic}, idx={self.idx}, created_at={self.created_at})"
 
     def __hash__(self):
-        return hash(self.__repr__())
+        return self._hash
+
+    def __reduce__(self):
+        return self.__class__, self._key
+
+    def __setstate__(self, state):
+        # sockets pickled by older versions store their fields in the instance dict under "_data"
+        if isinstance(state, tuple):
+            state = state[0]
+        Socket.__init__(self, *state['_data'])
 
 
 Token = namedtuple('Token', ['socket', 'other_end', 'current_state', 'pct', 'purified',
@@ -107,6 +136,104 @@ class TokenMessage(ns.components.Message):
         return f"TokenMessage(token={self.token})"
 
 
+BELL_STATE_FROM_MEASUREMENT = (0, 1, 3, 2)
+r"""
+Map from the outcome of a Bell state measurement (:data:`netsquid.components.instructions.INSTR_MEASURE_BELL`) to the
+index of the measured Bell state, with the encoding of :attr:`~progress.sockets.Token.current_state`.
+NetSquid swaps the indices of :math:`\vert\beta_{10}\rangle` and :math:`\vert\beta_{11}\rangle`.
+"""
+
+
+def compose_bell_states(*states):
+    r"""
+    Compose Bell states as Pauli frames. Bit 0 of a Bell state index is its X correction and bit 1 its Z
+    correction, so composing the frames (up to a global phase) is a bitwise XOR of the indices.
+
+    Parameters
+    ----------
+    *states : int
+        The Bell state indices (0 to 3).
+
+    Returns
+    -------
+    int
+        The index of the composed Bell state. 0 if no state is given.
+    """
+    result = 0
+    for state in states:
+        result ^= state
+    return result
+
+
+def bell_state_from_measurement(outcome):
+    r"""
+    Get the Bell state index corresponding to a Bell state measurement outcome.
+    See :data:`~progress.sockets.BELL_STATE_FROM_MEASUREMENT`.
+
+    Parameters
+    ----------
+    outcome : int
+        The outcome of :data:`netsquid.components.instructions.INSTR_MEASURE_BELL`.
+
+    Returns
+    -------
+    int
+        The Bell state index.
+    """
+    return BELL_STATE_FROM_MEASUREMENT[outcome]
+
+
+SWAP_FRAME_TABLE = tuple(tuple(tuple(state_a ^ state_b ^ BELL_STATE_FROM_MEASUREMENT[outcome]
+                                     for outcome in range(4))
+                               for state_b in range(4))
+                         for state_a in range(4))
+r"""
+The Bell state of the pair produced by entanglement swapping, indexed as
+``SWAP_FRAME_TABLE[state_a][state_b][outcome]``, where `state_a` and `state_b` are the Bell states of the swapped
+pairs and `outcome` is the raw outcome of :data:`netsquid.components.instructions.INSTR_MEASURE_BELL`.
+"""
+
+
+def get_state_after_swap(state_a, state_b, outcome):
+    r"""
+    Get the Bell state of the pair produced by entanglement swapping. See
+    :data:`~progress.sockets.SWAP_FRAME_TABLE`.
+
+    Parameters
+    ----------
+    state_a : int
+        The Bell state of the first swapped pair.
+    state_b : int
+        The Bell state of the second swapped pair.
+    outcome : int
+        The raw outcome of :data:`netsquid.components.instructions.INSTR_MEASURE_BELL`.
+
+    Returns
+    -------
+    int
+        The Bell state of the new pair.
+    """
+    return SWAP_FRAME_TABLE[state_a][state_b][outcome]
+
+
+def get_pauli_corrections(state):
+    r"""
+    Get the Pauli corrections that bring a pair from a Bell state back to :math:`\vert\beta_{00}\rangle`, when
+    applied to one of its qubits.
+
+    Parameters
+    ----------
+    state : int
+        The current Bell state index.
+
+    Returns
+    -------
+    tuple[bool, bool]
+        Whether an X and whether a Z gate must be applied.
+    """
+    return bool(state & 1), bool(state & 2)
+
+
 def have_same_ends(token1, token2):
     r"""
     Check if two tokens represent sockets that are entangled among the same two devices.
@@ -129,10 +256,39 @@ class TokenTable:
     """
     A table that stores tokens.
     This is used to keep track of the tokens that are currently owned by a specific module.
+
+    Notes
+    -----
+    Tokens are indexed by their local socket, so that lookups, removals and replacements take constant time.
+    For each remote node, the table also keeps a max-heap of the tokens entangled with that node ordered by
+    pct, so that Longest Remaining Time First (LRTF) picks take logarithmic time. A global min-heap on pct
+    lets garbage collection pop only the expired tokens. Heap entries are invalidated lazily: a removed
+    token stays in its heaps until it reaches the top or the heap is compacted.
+    """
+
+    _COMPACTION_SLACK = 32
+    """
+    Number of stale entries tolerated in a heap (in excess of its live entries) before the heap is rebuilt.
     """
 
     def __init__(self):
-        self._table = []
+        # local socket -> token, in insertion order
+        self._table = {}
+        # local socket -> sequence number of the insertion that stored the current token
+        self._seq = {}
+        # other end node -> heap of (-pct, -seq, socket)
+        self._by_node = {}
+        # other end node -> number of live tokens in the heap
+        self._live = {}
+        # heap of (pct, seq, socket) over all the tokens, used for garbage collection
+        self._expiries = []
+        self._next_seq = 0
+
+    def __len__(self):
+        return len(self._table)
+
+    def __contains__(self, local_end):
+        return local_end in self._table
 
     def get_snapshot(self):
         """
@@ -141,9 +297,9 @@ class TokenTable:
         Returns
         -------
         list[:class:`~progress.sockets.Token`]
-            The list of tokens in the table.
+            The list of tokens in the table, in insertion order.
         """
-        return self._table.copy()
+        return list(self._table.values())
 
     def add_token(self, token):
         r"""
@@ -154,7 +310,56 @@ class TokenTable:
         token : :class:`~progress.sockets.Token`
             The token to add.
         """
-        self._table.append(token)
+        if token.socket in self._table:
+            # keep a single token per local socket, as lookups are keyed by socket
+            self._discard(token.socket)
+
+        seq = self._next_seq
+        self._next_seq += 1
+        self._table[token.socket] = token
+        self._seq[token.socket] = seq
+
+        node = token.other_end.node
+        heap = self._by_node.get(node)
+        if heap is None:
+            heap = []
+            self._by_node[node] = heap
+            self._live[node] = 0
+        heapq.heappush(heap, (-token.pct, -seq, token.socket))
+        self._live[node] += 1
+        heapq.heappush(self._expiries, (token.pct, seq, token.socket))
+
+    def _discard(self, local_end):
+        r"""
+        Remove the token identified by `local_end` from the table and invalidate its heap entry.
+        The caller must make sure that the token is present.
+        """
+        token = self._table.pop(local_end)
+        del self._seq[local_end]
+        node = token.other_end.node
+        live = self._live[node] - 1
+        self._live[node] = live
+        heap = self._by_node[node]
+        if live == 0:
+            heap.clear()
+        elif len(heap) > 2 * live + self._COMPACTION_SLACK:
+            heap[:] = [entry for entry in heap if self._is_valid(entry)]
+            heapq.heapify(heap)
+
+        if not self._table:
+            self._expiries.clear()
+        elif len(self._expiries) > 2 * len(self._table) + self._COMPACTION_SLACK:
+            self._expiries[:] = [entry for entry in self._expiries if self._seq.get(entry[2]) == entry[1]]
+            heapq.heapify(self._expiries)
+        return token
+
+    def _is_valid(self, entry):
+        return self._seq.get(entry[2]) == -entry[1]
+
+    def _drop_stale_expiries(self):
+        expiries = self._expiries
+        while expiries and self._seq.get(expiries[0][2]) != expiries[0][1]:
+            heapq.heappop(expiries)
 
     def pop_token(self, local_end, raise_error=True):
         r"""
@@ -173,10 +378,8 @@ class TokenTable:
         :class:`~progress.sockets.Token`
             The socket descriptor that was popped.
         """
-        for descriptor in self._table:
-            if descriptor.socket == local_end:
-                self._table.remove(descriptor)
-                return descriptor
+        if local_end in self._table:
+            return self._discard(local_end)
         if raise_error:
             raise ValueError(f"Token local end {local_end} not found.")
         else:
@@ -198,9 +401,9 @@ class TokenTable:
         :class:`~progress.sockets.Token` or None
             The token that was found. None if the token was not found and raise_error is False.
         """
-        for token in self._table:
-            if token.socket == local_end:
-                return token
+        token = self._table.get(local_end)
+        if token is not None:
+            return token
         if raise_error:
             raise ValueError(f"Token local end {local_end} not found.")
         else:
@@ -224,22 +427,19 @@ class TokenTable:
         bool
             Whether or not the socket was found and replaced.
         """
-        for token in self._table:
-            if token.local_end == local_end:
-
-                third_desc = Token(token.local_end, new_token.other_end,
-                                   new_token.current_state, min(token.pct, new_token.pct),
-                                   new_token.purified, new_token.additional_info)
-
-                self._table.remove(token)
-                self._table.append(third_desc)
-                return True
-
+        if local_end not in self._table:
             if raise_error:
                 raise ValueError(f"Token with local end {local_end} not found.")
             else:
                 return False
 
+        token = self._discard(local_end)
+        third_desc = Token(token.socket, new_token.other_end,
+                           new_token.current_state, min(token.pct, new_token.pct),
+                           new_token.purified, new_token.additional_info)
+        self.add_token(third_desc)
+        return True
+
     def collect_garbage(self, current_time):
         r"""
         Remove all expired tokens from the token table.
@@ -255,13 +455,27 @@ class TokenTable:
             The list of tokens that were removed.
         """
         to_remove = []
-        for token in self._table:
-            if token.pct <= current_time:
-                to_remove.append(token)
-        for token in to_remove:
-            self._table.remove(token)
+        self._drop_stale_expiries()
+        while self._expiries and self._expiries[0][0] <= current_time:
+            _, _, socket = heapq.heappop(self._expiries)
+            to_remove.append(self._discard(socket))
+            self._drop_stale_expiries()
         return to_remove
 
+    def next_expiry(self):
+        r"""
+        Get the earliest pct among the tokens in the table.
+
+        Returns
+        -------
+        float or None
+            The earliest pct in the table [ns]. `None` if the table is empty.
+        """
+        self._drop_stale_expiries()
+        if not self._expiries:
+            return None
+        return self._expiries[0][0]
+
     def get_target_token(self, other_end_node, additional_info_filters=None, policy="LRTF"):
         r"""
         Get a token having a specific other end node.
@@ -290,7 +504,7 @@ class TokenTable:
     def _get_target_descriptor_LRTF(self, other_end_node, additional_info_filters=None):
         r"""
         Get the token having a specific other end node. In case of multiple choices, the one with the
-        highest pct is returned.
+        highest pct is returned. Ties are broken in favor of the most recently added token.
 
         Parameters
         ----------
@@ -307,19 +521,50 @@ class TokenTable:
         """
         if isinstance(other_end_node, int):
             other_end_node = [other_end_node]
-        # Find the socket descriptor with the longest remaining time
-        max_pct = 0
-        picked_token = None
-        for token in self._table:
-            if token.other_end.node in other_end_node and token.pct >= max_pct:
-                if additional_info_filters is not None:
-                    discard = False
-                    for key, value in additional_info_filters.items():
-                        if key not in token.additional_info or token.additional_info[key] != value:
-                            discard = True
-                            break
-                    if discard:
-                        continue
-                max_pct = token.pct
-                picked_token = token
-        return picked_token
+
+        best_entry = None
+        for node in other_end_node:
+            entry = self._peek_LRTF(node, additional_info_filters)
+            if entry is not None and (best_entry is None or entry < best_entry):
+                best_entry = entry
+        if best_entry is None:
+            return None
+        return self._table[best_entry[2]]
+
+    def _peek_LRTF(self, node, additional_info_filters=None):
+        r"""
+        Get the heap entry of the token with the longest remaining time among those entangled with `node` and
+        matching the filters, without removing it. Stale entries found on top of the heap are dropped.
+        """
+        heap = self._by_node.get(node)
+        if not heap:
+            return None
+
+        while heap and not self._is_valid(heap[0]):
+            heapq.heappop(heap)
+        if not heap:
+            return None
+        if additional_info_filters is None or self._matches(heap[0], additional_info_filters):
+            return heap[0]
+
+        # pop entries until we find a match, then push the skipped ones back
+        skipped = []
+        found = None
+        while heap:
+            entry = heapq.heappop(heap)
+            if not self._is_valid(entry):
+                continue
+            skipped.append(entry)
+            if self._matches(entry, additional_info_filters):
+                found = entry
+                break
+        for entry in skipped:
+            heapq.heappush(heap, entry)
+        return found
+
+    def _matches(self, entry, additional_info_filters):
+        additional_info = self._table[entry[2]].additional_info
+        for key, value in additional_info_filters.items():
+            if key not in additional_info or additional_info[key] != value:
+                return False
+        return True
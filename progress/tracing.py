@@ -0,0 +1,280 @@
+"""
+This module implements a structured event trace for simulations. Typed events (entanglement deliveries, token
+promotions, swaps, DEJMPS outcomes, DAG replacements and routed messages) are stored as fixed-width NumPy records
+in a compact, append-only binary file. Records are buffered in memory and written in blocks, and a trace can be
+memory-mapped for zero-copy analysis with :func:`read_trace`.
+
+Tracing is off by default. To record a simulation, install a writer before running it:
+
+>>> with TraceWriter("run.trace") as writer:
+...     set_trace_writer(writer)
+...     ns.sim_run()
+>>> records, metadata = read_trace("run.trace")
+>>> swaps = records[records["event"] == TraceEvent.SWAP_COMPLETED]
+
+Besides the trace file, the writer keeps a small JSON sidecar (``<filename>.json``) with the event names and the
+table of qnic names. Records refer to qnics by their index in that table.
+"""
+
+import json
+import struct
+
+import netsquid as ns
+import numpy as np
+
+__all__ = ["TraceEvent", "TRACE_DTYPE", "TraceWriter", "set_trace_writer", "get_trace_writer", "record",
+           "read_trace"]
+
+
+class TraceEvent:
+    r"""
+    The types of the events stored in a trace. The meaning of the socket fields and of the value of a record depend on
+    its type:
+
+    - ``ENTANGLEMENT_DELIVERED``: a link layer protocol delivered a new pair. The socket fields are the local and
+      the remote ends of the pair.
+    - ``TOKEN_PROMOTED``: a module promoted a token. The socket fields are the ends of the token and the value is the
+      output port.
+    - ``SWAP_ISSUED``: a swapping module requested the swap of two tokens. The socket fields are the local ends of
+      the two tokens.
+    - ``SWAP_COMPLETED``: a swap was performed. The socket fields are the ends of the new pair and the value is its
+      Bell state.
+    - ``DEJMPS_OUTCOME``: a DEJMPS round was completed. The socket fields are the ends of the kept token and the
+      value is the measurement outcome.
+    - ``DAG_REPLACED`` and ``DAG_PATCHED``: the NET manager installed a new DAG. The value is the topology id.
+    - ``MESSAGE_ROUTED``: a classical message was forwarded to another device. The remote device is the destination
+      of the message and the value is the output classical interface.
+    """
+
+    ENTANGLEMENT_DELIVERED = 0
+    TOKEN_PROMOTED = 1
+    SWAP_ISSUED = 2
+    SWAP_COMPLETED = 3
+    DEJMPS_OUTCOME = 4
+    DAG_REPLACED = 5
+    DAG_PATCHED = 6
+    MESSAGE_ROUTED = 7
+
+    NAMES = {ENTANGLEMENT_DELIVERED: "ENTANGLEMENT_DELIVERED", TOKEN_PROMOTED: "TOKEN_PROMOTED",
+             SWAP_ISSUED: "SWAP_ISSUED", SWAP_COMPLETED: "SWAP_COMPLETED", DEJMPS_OUTCOME: "DEJMPS_OUTCOME",
+             DAG_REPLACED: "DAG_REPLACED", DAG_PATCHED: "DAG_PATCHED", MESSAGE_ROUTED: "MESSAGE_ROUTED"}
+    """The name of each event type."""
+
+
+TRACE_DTYPE = np.dtype([("time", "<f8"), ("event", "u1"), ("device", "<i4"), ("module", "<i4"),
+                        ("socket_device", "<i4"), ("qnic", "<i2"), ("idx", "<i4"),
+                        ("other_device", "<i4"), ("other_qnic", "<i2"), ("other_idx", "<i4"),
+                        ("value", "<i8")])
+r"""
+The layout of a trace record. ``time`` is the simulation time of the event [ns], ``device`` and ``module`` identify
+where it happened (-1 if not applicable), ``socket_device``/``qnic``/``idx`` and
+``other_device``/``other_qnic``/``other_idx`` describe the sockets involved (-1 if not applicable), and ``value`` is
+an event-specific integer. The device of a socket can differ from ``device``, e.g. for the remote ends of a swap.
+"""
+
+_MAGIC = b"PRGTRACE"
+_VERSION = 2
+_HEADER = struct.Struct("<8sHH4x")
+
+_writer = None
+
+
+class TraceWriter:
+    r"""
+    Writer of a binary event trace. Records are accumulated in a preallocated buffer and appended to the file when
+    the buffer is full, when :meth:`flush` is called and when the writer is closed.
+
+    Parameters
+    ----------
+    filename : str
+        The name of the trace file. It is overwritten if present.
+    buffer_size : int, optional
+        The number of records kept in memory before they are written to the file. Defaults to
+        :attr:`BUFFER_SIZE`.
+    """
+
+    BUFFER_SIZE = 65536
+    """The default number of buffered records."""
+
+    def __init__(self, filename, buffer_size=None):
+        if buffer_size is None:
+            buffer_size = self.BUFFER_SIZE
+        if buffer_size <= 0:
+            raise ValueError(f"The buffer size must be positive, got {buffer_size}.")
+        self.filename = filename
+        self._buffer = np.zeros(buffer_size, dtype=TRACE_DTYPE)
+        self._num_buffered = 0
+        self._num_records = 0
+        # qnic name -> index in the qnic table of the sidecar
+        self._qnics = {}
+        self._file = open(filename, "wb")
+        self._file.write(_HEADER.pack(_MAGIC, _VERSION, TRACE_DTYPE.itemsize))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def __len__(self):
+        return self._num_records + self._num_buffered
+
+    @property
+    def closed(self):
+        r"""
+        bool: Whether the writer has been closed.
+        """
+        return self._file is None
+
+    def record(self, event, device=-1, module=-1, socket=None, other_end=None, value=0, other_device=-1):
+        r"""
+        Append a record to the trace.
+
+        Parameters
+        ----------
+        event : int
+            The type of the event, one of the constants of :class:`~progress.tracing.TraceEvent`.
+        device : int, optional
+            The device where the event happened. Defaults to -1.
+        module : int, optional
+            The module where the event happened. Defaults to -1.
+        socket : :class:`~progress.sockets.Socket` or None, optional
+            The first socket involved in the event. Defaults to `None`.
+        other_end : :class:`~progress.sockets.Socket` or None, optional
+            The second socket involved in the event. Defaults to `None`.
+        value : int, optional
+            An event-specific value. Defaults to 0.
+        other_device : int, optional
+            The remote device of the event, if `other_end` is `None`. Defaults to -1.
+        """
+        if socket is None:
+            socket_device, qnic, idx = -1, -1, -1
+        else:
+            socket_device, qnic, idx = socket.node, self._get_qnic_index(socket.qnic), socket.idx
+        if other_end is None:
+            other_qnic, other_idx = -1, -1
+        else:
+            other_device, other_qnic, other_idx = other_end.node, self._get_qnic_index(other_end.qnic), other_end.idx
+        self._buffer[self._num_buffered] = (ns.sim_time(), event, device, module, socket_device, qnic, idx,
+                                            other_device, other_qnic, other_idx, value)
+        self._num_buffered += 1
+        if self._num_buffered == len(self._buffer):
+            self.flush()
+
+    def _get_qnic_index(self, qnic):
+        index = self._qnics.get(qnic)
+        if index is None:
+            index = len(self._qnics)
+            self._qnics[qnic] = index
+        return index
+
+    def flush(self):
+        r"""
+        Write the buffered records and the sidecar to disk.
+        """
+        if self._num_buffered > 0:
+            self._file.write(self._buffer[:self._num_buffered].tobytes())
+            self._num_records += self._num_buffered
+            self._num_buffered = 0
+        self._file.flush()
+        with open(self.filename + ".json", "w") as sidecar:
+            json.dump(self.get_metadata(), sidecar)
+
+    def get_metadata(self):
+        r"""
+        Get the metadata of the trace, as stored in the sidecar.
+
+        Returns
+        -------
+        dict
+            The version of the format, the names of the event types, the qnic names in index order and the number of
+            records.
+        """
+        return {"version": _VERSION,
+                "events": {str(event): name for event, name in TraceEvent.NAMES.items()},
+                "qnics": [str(qnic) for qnic in self._qnics],
+                "num_records": len(self)}
+
+    def close(self):
+        r"""
+        Flush the writer and close the trace file. It also uninstalls the writer if it is the active one.
+        """
+        global _writer
+        if self._file is None:
+            return
+        self.flush()
+        self._file.close()
+        self._file = None
+        if _writer is self:
+            _writer = None
+
+
+def set_trace_writer(writer):
+    r"""
+    Install the writer that receives the events of the simulation.
+
+    Parameters
+    ----------
+    writer : :class:`~progress.tracing.TraceWriter` or None
+        The writer. If `None`, tracing is switched off.
+    """
+    global _writer
+    _writer = writer
+
+
+def get_trace_writer():
+    r"""
+    Get the active trace writer.
+
+    Returns
+    -------
+    :class:`~progress.tracing.TraceWriter` or None
+        The active writer, or `None` if tracing is off.
+    """
+    return _writer
+
+
+def record(event, device=-1, module=-1, socket=None, other_end=None, value=0, other_device=-1):
+    r"""
+    Record an event on the active writer. It has no effect if tracing is off.
+
+    See Also
+    --------
+    :meth:`~progress.tracing.TraceWriter.record`
+    """
+    if _writer is not None:
+        _writer.record(event, device, module, socket, other_end, value, other_device)
+
+
+def read_trace(filename):
+    r"""
+    Read a trace without loading it: the records are memory-mapped read-only.
+
+    Parameters
+    ----------
+    filename : str
+        The name of the trace file.
+
+    Returns
+    -------
+    tuple
+        A structured array of records with dtype :data:`~progress.tracing.TRACE_DTYPE` (a :class:`numpy.memmap`
+        unless the trace is empty) and the metadata stored in the sidecar.
+    """
+    with open(filename, "rb") as trace_file:
+        magic, version, itemsize = _HEADER.unpack(trace_file.read(_HEADER.size))
+        trace_file.seek(0, 2)
+        size = trace_file.tell() - _HEADER.size
+    if magic != _MAGIC:
+        raise ValueError(f"{filename} is not a trace file.")
+    if version != _VERSION or itemsize != TRACE_DTYPE.itemsize:
+        raise ValueError(f"Unsupported trace version {version} with records of {itemsize} bytes.")
+
+    with open(filename + ".json") as sidecar:
+        metadata = json.load(sidecar)
+
+    # records of a trace that was not closed might be incomplete at the end of the file
+    num_records = size // itemsize
+    if num_records == 0:
+        return np.zeros(0, dtype=TRACE_DTYPE), metadata
+    return np.memmap(filename, dtype=TRACE_DTYPE, mode="r", offset=_HEADER.size, shape=(num_records,)), metadata
@@ -0,0 +1,104 @@
+"""
+Tests of the Bell-diagonal quantum state backend against the NetSquid one.
+"""
+
+import numpy as np
+import pytest
+
+ns = pytest.importorskip("netsquid")
+
+from progress.hardware.bell_diagonal import BellDiagonalMemory, BellDiagonalPair  # noqa: E402
+from progress.hardware.qhardware import QuantumOperationsService, get_processor  # noqa: E402
+
+BELL_KETS = [ns.qubits.ketstates.b00, ns.qubits.ketstates.b01, ns.qubits.ketstates.b10, ns.qubits.ketstates.b11]
+
+NUM_TRIALS = 2000
+
+
+def _create_pair(coefficients):
+    qubits = ns.qubits.create_qubits(2)
+    dm = sum(c * np.outer(ket, ket.conj()) for c, ket in zip(coefficients, BELL_KETS))
+    ns.qubits.assign_qstate(qubits, dm)
+    return qubits
+
+
+def _netsquid_dejmps(coefficients_a, coefficients_b, proc_params):
+    r"""
+    Run DEJMPS on the NetSquid backend. Return the success probability and the mean fidelity of the kept pair with
+    :math:`\vert \beta_{00} \rangle` on success.
+    """
+    ns.set_qstate_formalism(ns.QFormalism.DM)
+    ns.set_random_state(seed=1)
+    num_successes = 0
+    fidelity = 0.
+    for _ in range(NUM_TRIALS):
+        ns.sim_reset()
+        pair_a = _create_pair(coefficients_a)
+        pair_b = _create_pair(coefficients_b)
+        programs = []
+        processors = []
+        for side, conj_rotation in enumerate([False, True]):
+            qproc = get_processor(num_positions=2, **proc_params)
+            qproc.put([pair_a[side], pair_b[side]], positions=[0, 1])
+            prog = QuantumOperationsService._setup_dejmps_program(conj_rotation)
+            qproc.execute_program(prog, qubit_mapping=[0, 1])
+            processors.append(qproc)
+            programs.append(prog)
+        ns.sim_run()
+        if programs[0].output["m"][0] == programs[1].output["m"][0]:
+            num_successes += 1
+            kept = [qproc.peek(0)[0] for qproc in processors]
+            fidelity += ns.qubits.fidelity(kept, ns.qubits.ketstates.b00, squared=True)
+    return num_successes / NUM_TRIALS, fidelity / num_successes
+
+
+def _bell_diagonal_dejmps(coefficients_a, coefficients_b, proc_params):
+    r"""
+    Run DEJMPS on the Bell-diagonal backend. Return the success probability and the mean fidelity of the kept pair
+    with :math:`\vert \beta_{00} \rangle` on success.
+    """
+    rng = np.random.RandomState(1)
+    num_successes = 0
+    fidelity = 0.
+    for _ in range(NUM_TRIALS):
+        pair_a = BellDiagonalPair(coefficients_a)
+        pair_b = BellDiagonalPair(coefficients_b)
+        outcomes = []
+        for side, role in enumerate(['A', 'B']):
+            memory = BellDiagonalMemory(num_positions=2, rng=rng, **proc_params)
+            memory.put(pair_a.halves[side], 0)
+            memory.put(pair_b.halves[side], 1)
+            outcomes.append(memory.dejmps(0, 1, role))
+        if outcomes[0] == outcomes[1]:
+            num_successes += 1
+            fidelity += pair_a.fidelity(0)
+    return num_successes / NUM_TRIALS, fidelity / num_successes
+
+
+@pytest.mark.parametrize("coefficients_a, coefficients_b", [
+    ([1., 0., 0., 0.], [1., 0., 0., 0.]),
+    ([.85, .05, .06, .04], [.7, .1, .15, .05]),
+])
+@pytest.mark.parametrize("proc_params", [
+    {"two_qbit_p_err": 0.1, "meas_p_err": 0.05},
+    {"two_qbit_p_err": 0.02, "meas_p_err": 0.},
+])
+def test_dejmps_matches_netsquid(coefficients_a, coefficients_b, proc_params):
+    ns_success, ns_fidelity = _netsquid_dejmps(coefficients_a, coefficients_b, proc_params)
+    bd_success, bd_fidelity = _bell_diagonal_dejmps(coefficients_a, coefficients_b, proc_params)
+    assert bd_success == pytest.approx(ns_success, abs=0.04)
+    assert bd_fidelity == pytest.approx(ns_fidelity, abs=0.02)
+
+
+def test_input_noise_matches_netsquid():
+    ns.set_qstate_formalism(ns.QFormalism.DM)
+    ns.sim_reset()
+    qubits = _create_pair([1., 0., 0., 0.])
+    for qubit in qubits:
+        get_processor(num_positions=1, coherence_time=1e9).put(qubit, positions=0)
+    ns_fidelity = ns.qubits.fidelity(qubits, ns.qubits.ketstates.b00, squared=True)
+
+    pair = BellDiagonalPair()
+    for half in pair.halves:
+        BellDiagonalMemory(num_positions=1, coherence_time=1e9).put(half, 0)
+    assert pair.fidelity(0) == pytest.approx(ns_fidelity)